@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -9,132 +9,164 @@ import os
 import threading
 import time
 
-from src.benchmark import run_benchmark
-from src.endpoints import get_endpoints
-from src.constants import PROVIDERS
+from src.benchmark import iter_benchmark
+from src.endpoints import get_endpoints, get_probe_options
+from src.constants import (
+    PROVIDERS, PROBE_PROTOCOLS, SSE_KEEPALIVE, ADAPTIVE_MAX_RUNS, CANCEL_GRACE
+)
+from src.cancel import CancelToken
+from src.progress import progress_bus
+from src.resolver import default_resolver
+from src.collector import collector
 
 app = Flask(__name__)
+app.register_blueprint(collector)
 
 # Global state for tracking benchmark status
 benchmark_status = {
     "running": False,
     "last_run": None,
-    "thread": None
+    "thread": None,
+    "cancel": None,  # CancelToken of the current benchmark
+    "results": {}  # Serialized results of the current benchmark so far
 }
 
-def run_benchmark_task(selected_providers, num_runs=3):
+def serialize_result(result):
+    """JSON-ready copy of one run_benchmark entry, keeping the hop fields the UI uses"""
+    json_result = {k: v for k, v in result.items() if k != 'hops'}
+    # Extract key hop data with geo info for visualization
+    hops = []
+    countries_traversed = set()
+    for hop in result['hops']:
+        hop_data = {
+            'ttl': hop.get('ttl'),
+            'ip': hop.get('ip'),
+            'rtt': hop.get('rtt'),
+            'status': hop.get('status'),
+            'clock': hop.get('clock')  # Timestamp source of the RTT
+        }
+        # Add geo data if available
+        if 'geo' in hop:
+            hop_data['geo'] = hop['geo']
+            if 'country' in hop['geo']:
+                countries_traversed.add(hop['geo']['country'])
+            if 'lat' in hop and 'lon' in hop:
+                hop_data['lat'] = hop['lat']
+                hop_data['lon'] = hop['lon']
+        # Add hop latency if available
+        if 'hop_latency' in hop:
+            hop_data['hop_latency'] = hop['hop_latency']
+        hops.append(hop_data)
+    json_result['hops'] = hops
+    json_result['countries_traversed'] = len(countries_traversed)
+    json_result['countries_list'] = list(countries_traversed)
+    return json_result
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it over path, so readers never see half a file"""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def run_benchmark_task(selected_providers, num_runs=3, protocol=None, target_ci=None,
+                       max_runs=ADAPTIVE_MAX_RUNS, cancel=None, time_limit=None,
+                       trace_timeout=None):
     """Run benchmark in a background thread"""
+    cancel = cancel or CancelToken()
+    def current():
+        # After /benchmark/cancel a new benchmark may own the status and results file
+        return benchmark_status["cancel"] is cancel
+    
     try:
-        # Initialize progress file
-        progress_path = Path('data/benchmark_progress.json')
         result_path = Path('data/latest_results.json')
-        progress_path.parent.mkdir(exist_ok=True)
+        result_path.parent.mkdir(exist_ok=True)
 
         print(f"Starting benchmark for providers: {selected_providers}, {num_runs} runs per provider")
         
-        # Set initial progress
-        with open(progress_path, 'w') as f:
-            json.dump({
-                "progress": 0,
-                "completed": 0,
-                "total": len(selected_providers) * num_runs,
-                "current_provider": "Initializing...",
-                "status": "running",
-                "start_time": time.time()
-            }, f)
-        
         # Get endpoints and run benchmark
         endpoints = get_endpoints(selected_providers)
         print(f"Retrieved endpoints: {endpoints}")
         
         # Update progress to 5% after endpoint resolution
-        with open(progress_path, 'w') as f:
-            json.dump({
-                "progress": 5,
-                "completed": 0,
-                "total": len(selected_providers) * num_runs,
-                "current_provider": "Resolving endpoints...",
-                "status": "running",
-                "start_time": time.time()
-            }, f)
+        progress_bus.publish({
+            "progress": 5,
+            "completed": 0,
+            "total": len(selected_providers) * num_runs,
+            "current_provider": "Resolving endpoints...",
+            "status": "running",
+            "start_time": time.time()
+        })
         
         if not endpoints:
             raise ValueError(f"No valid endpoints found for providers: {selected_providers}")
             
-        results = run_benchmark(endpoints, num_runs)
-        print(f"Benchmark completed with {len(results)} results")
+        # Results are written after every provider, so partial results show up immediately
+        json_results = benchmark_status["results"] if current() else {}
+        runs_done = 0
+        for event in iter_benchmark(endpoints, num_runs, protocol=protocol,
+                                    probe_options=get_probe_options(selected_providers),
+                                    target_ci=target_ci, max_runs=max_runs, cancel=cancel,
+                                    time_limit=time_limit, trace_timeout=trace_timeout):
+            if event["type"] != "endpoint":
+                runs_done += 1
+                continue
+            json_results[event["key"]] = serialize_result(event["result"])
+            if current():
+                print(f"Saving results to {result_path} with {len(json_results)} endpoints")
+                _write_json_atomic(result_path, json_results)
+        print(f"Benchmark completed with {len(json_results)} results")
+        truncated = any(result.get("truncated") for result in json_results.values())
+        
+        if cancel.reason:
+            print(f"Benchmark cancelled with {len(json_results)} partial results")
+            if current():
+                progress_bus.publish({
+                    "progress": 100,
+                    "completed": runs_done,
+                    "total": runs_done,
+                    "current_provider": "Cancelled",
+                    "status": "cancelled",
+                    "truncated": True,
+                    "end_time": time.time()
+                })
+            return
         
         # Check if results are empty
-        if not results:
+        if not json_results:
             raise ValueError("Benchmark returned empty results")
         
-        # Save to a temporary file
-        with open(result_path, 'w') as f:
-            # Create a version of results suitable for JSON serialization
-            json_results = {}
-            for k, v in results.items():
-                json_results[k] = {kk: vv for kk, vv in v.items() if kk != 'hops'}
-                # Extract key hop data with geo info for visualization
-                hops = []
-                countries_traversed = set()
-                for hop in v['hops']:
-                    hop_data = {
-                        'ttl': hop.get('ttl'),
-                        'ip': hop.get('ip'),
-                        'rtt': hop.get('rtt'),
-                        'status': hop.get('status')
-                    }
-                    # Add geo data if available
-                    if 'geo' in hop:
-                        hop_data['geo'] = hop['geo']
-                        if 'country' in hop['geo']:
-                            countries_traversed.add(hop['geo']['country'])
-                        if 'lat' in hop and 'lon' in hop:
-                            hop_data['lat'] = hop['lat']
-                            hop_data['lon'] = hop['lon']
-                    # Add hop latency if available
-                    if 'hop_latency' in hop:
-                        hop_data['hop_latency'] = hop['hop_latency']
-                    hops.append(hop_data)
-                json_results[k]['hops'] = hops
-                json_results[k]['countries_traversed'] = len(countries_traversed)
-                json_results[k]['countries_list'] = list(countries_traversed)
-            
-            print(f"Saving results to {result_path} with {len(json_results)} endpoints")
-            json.dump(json_results, f)
-            
-            # Verify the file was written correctly
-            if result_path.exists() and result_path.stat().st_size > 0:
-                print(f"Results file created successfully: {result_path.stat().st_size} bytes")
-            else:
-                print(f"Warning: Results file may be empty or not created properly")
+        # Verify the file was written correctly
+        if result_path.exists() and result_path.stat().st_size > 0:
+            print(f"Results file created successfully: {result_path.stat().st_size} bytes")
+        else:
+            print(f"Warning: Results file may be empty or not created properly")
         
         # Update final status - set to 99% first to ensure UI has time to update
-        with open(progress_path, 'w') as f:
-            json.dump({
-                "progress": 99,
-                "completed": len(selected_providers) * num_runs,
-                "total": len(selected_providers) * num_runs,
-                "current_provider": "Finalizing...",
-                "status": "running",
-                "end_time": time.time(),
-                "start_time": time.time() - 60  # Ensure the timer is consistent
-            }, f)
+        progress_bus.publish({
+            "progress": 99,
+            "completed": runs_done,
+            "total": runs_done,
+            "current_provider": "Finalizing...",
+            "status": "running",
+            "end_time": time.time(),
+            "start_time": time.time() - 60  # Ensure the timer is consistent
+        })
             
         # Short delay to allow UI to update before setting to complete
         time.sleep(0.5)
         
         # Now update to 100% complete
-        with open(progress_path, 'w') as f:
-            json.dump({
-                "progress": 100,
-                "completed": len(selected_providers) * num_runs,
-                "total": len(selected_providers) * num_runs,
-                "current_provider": "Complete",
-                "status": "complete",
-                "end_time": time.time(),
-                "start_time": time.time() - 60  # Keep time consistent
-            }, f)
+        progress_bus.publish({
+            "progress": 100,
+            "completed": runs_done,
+            "total": runs_done,
+            "current_provider": "Complete (time limit reached)" if truncated else "Complete",
+            "status": "complete",
+            "truncated": truncated,
+            "end_time": time.time(),
+            "start_time": time.time() - 60  # Keep time consistent
+        })
     
     except Exception as e:
         import traceback
@@ -142,21 +174,22 @@ def run_benchmark_task(selected_providers, num_runs=3):
         print(traceback.format_exc())
         
         # Handle errors
-        with open(progress_path, 'w') as f:
-            json.dump({
+        if current():
+            progress_bus.publish({
                 "progress": 0,
                 "status": "error",
                 "error": str(e),
                 "end_time": time.time()
-            }, f)
+            })
     
     finally:
         # Short delay to ensure final status is read by the UI
         time.sleep(0.5)
         
-        # Reset global state
-        benchmark_status["running"] = False
-        benchmark_status["last_run"] = time.time()
+        # Reset global state (already done by /benchmark/cancel if this run was cancelled)
+        if current():
+            benchmark_status["running"] = False
+            benchmark_status["last_run"] = time.time()
 
 @app.route('/')
 def index():
@@ -177,6 +210,13 @@ def run_benchmark_endpoint():
     data = request.json
     selected_providers = data.get('providers', ['aws', 'azure', 'gcp'])
     num_runs = int(data.get('num_runs', 3))  # Default to 3 runs
+    protocol = data.get('protocol')  # None = per-provider setting from config/endpoints.json
+    
+    if protocol is not None and protocol not in PROBE_PROTOCOLS:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown probe protocol: {protocol}"
+        }), 400
     
     # Validate num_runs
     if num_runs < 1:
@@ -184,13 +224,48 @@ def run_benchmark_endpoint():
     elif num_runs > 10:
         num_runs = 10  # Cap at 10 runs to prevent abuse
     
+    # Optional adaptive sampling: run until the RTT interval is within +/- target_ci
+    target_ci = data.get('target_ci')
+    if target_ci is not None:
+        target_ci = float(target_ci)
+        if not 0 < target_ci < 1:
+            return jsonify({
+                "status": "error",
+                "message": "target_ci must be a fraction between 0 and 1"
+            }), 400
+    max_runs = min(max(int(data.get('max_runs', ADAPTIVE_MAX_RUNS)), num_runs), ADAPTIVE_MAX_RUNS)
+    
+    # Optional deadlines for the whole benchmark and for each trace, in seconds
+    limits = {}
+    for key in ('time_limit', 'trace_timeout'):
+        if data.get(key) is not None:
+            limits[key] = float(data[key])
+            if limits[key] <= 0:
+                return jsonify({
+                    "status": "error",
+                    "message": f"{key} must be a positive number of seconds"
+                }), 400
+    
     # Set the global state
     benchmark_status["running"] = True
+    benchmark_status["cancel"] = cancel = CancelToken()
+    benchmark_status["results"] = {}
+    
+    # Set initial progress before replying, so event subscribers never see the previous run's end
+    progress_bus.publish({
+        "progress": 0,
+        "completed": 0,
+        "total": len(selected_providers) * (num_runs if target_ci is None else max_runs),
+        "current_provider": "Initializing...",
+        "status": "running",
+        "start_time": time.time()
+    })
     
     # Start benchmark in background thread
     benchmark_thread = threading.Thread(
         target=run_benchmark_task,
-        args=(selected_providers, num_runs),
+        args=(selected_providers, num_runs, protocol, target_ci, max_runs, cancel),
+        kwargs=limits,
         daemon=True
     )
     benchmark_thread.start()
@@ -200,34 +275,52 @@ def run_benchmark_endpoint():
         "status": "started",
         "message": "Benchmark started in background",
         "providers": selected_providers,
-        "num_runs": num_runs
+        "num_runs": num_runs,
+        "protocol": protocol,
+        "target_ci": target_ci,
+        "max_runs": max_runs if target_ci is not None else num_runs,
+        **limits
+    })
+
+@app.route('/benchmark/cancel', methods=['POST'])
+def cancel_benchmark():
+    """Abort the running benchmark and return its partial results"""
+    if not benchmark_status["running"]:
+        return jsonify({
+            "status": "error",
+            "message": "No benchmark is running"
+        }), 409
+    
+    # Traces notice within a fraction of a second; give them a moment to hand in what they have
+    benchmark_status["cancel"].cancel()
+    thread = benchmark_status["thread"]
+    if thread is not None:
+        thread.join(CANCEL_GRACE)
+    
+    # Free the slot even if a trace is still winding down
+    benchmark_status["running"] = False
+    benchmark_status["last_run"] = time.time()
+    results = dict(benchmark_status["results"])
+    return jsonify({
+        "status": "cancelled",
+        "stopped": thread is None or not thread.is_alive(),
+        "truncated": True,
+        "results": results
     })
 
 @app.route('/benchmark/status')
 def benchmark_status_endpoint():
     """Get the current status of the benchmark"""
-    progress_path = Path('data/benchmark_progress.json')
     result_path = Path('data/latest_results.json')
     
     status_info = {
         "running": benchmark_status["running"],
         "last_run": benchmark_status["last_run"],
-        "progress_file_exists": progress_path.exists(),
         "results_file_exists": result_path.exists(),
         "results_file_size": result_path.stat().st_size if result_path.exists() else 0,
+        "progress": progress_bus.current()[1],
     }
     
-    if progress_path.exists():
-        with open(progress_path, 'r') as f:
-            try:
-                progress = json.load(f)
-                status_info["progress"] = progress
-            except json.JSONDecodeError as e:
-                status_info["progress_error"] = str(e)
-                status_info["progress"] = {"progress": 0, "status": "error", "error": "Invalid progress file format"}
-    else:
-        status_info["progress"] = {"progress": 0, "status": "unknown"}
-    
     # Check if results file exists but is empty
     if result_path.exists() and result_path.stat().st_size == 0:
         status_info["results_error"] = "Results file exists but is empty"
@@ -238,6 +331,24 @@ def benchmark_status_endpoint():
     
     return jsonify(status_info)
 
+@app.route('/benchmark/events')
+def benchmark_events():
+    """Stream benchmark progress as Server-Sent Events until the benchmark finishes"""
+    def stream():
+        # Start with the current state, then every newer one
+        version, state = progress_bus.current()
+        while True:
+            if state is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(state)}\n\n"
+                if state.get("status") in ("complete", "error", "cancelled"):
+                    return
+            version, state = progress_bus.wait(version, timeout=SSE_KEEPALIVE)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/results')
 def get_results():
     result_path = Path('data/latest_results.json')
@@ -249,307 +360,323 @@ def get_results():
     
     return jsonify(results)
 
-@app.route('/visualize')
-def visualize():
-    result_path = Path('data/latest_results.json')
+def build_charts(results):
+    """
+    Build the /visualize figures from saved benchmark results.
     
-    # Check if results file exists
-    if not result_path.exists():
-        return render_template('no_results.html', error="No results file found. Please run a benchmark first.")
+    Args:
+        results: Dictionary of endpoint to serialized result (see serialize_result);
+            hops missing hop_latency get it filled in
     
-    # Check if file is empty
-    if result_path.stat().st_size == 0:
-        return render_template('no_results.html', error="Results file exists but is empty. Please run the benchmark again.")
-    
-    try:
-        with open(result_path, 'r') as f:
-            results = json.load(f)
-        
-        # Check if results are empty
-        if not results:
-            return render_template('no_results.html', error="Results file exists but contains no data. Please run the benchmark again.")
+    Returns:
+        Dictionary of chart name to Plotly figure JSON ('gauges' is a list of them)
+    """
+    # Ensure we have hop_latency data available (in case it wasn't in the saved JSON)
+    for endpoint in results:
+        # Sort valid hops by TTL
+        valid_hops = sorted([h for h in results[endpoint]["hops"] 
+                         if h.get("status") == "success" and h.get("rtt") is not None],
+                        key=lambda x: x.get("ttl", 0))
         
-        # Ensure we have hop_latency data available (in case it wasn't in the saved JSON)
-        for endpoint in results:
-            # Sort valid hops by TTL
-            valid_hops = sorted([h for h in results[endpoint]["hops"] 
-                             if h.get("status") == "success" and h.get("rtt") is not None],
-                            key=lambda x: x.get("ttl", 0))
+        # Calculate hop_latency if not already present
+        for i in range(1, len(valid_hops)):
+            prev_hop = valid_hops[i-1]
+            current_hop = valid_hops[i]
             
-            # Calculate hop_latency if not already present
-            for i in range(1, len(valid_hops)):
-                prev_hop = valid_hops[i-1]
-                current_hop = valid_hops[i]
-                
-                if "hop_latency" not in current_hop and prev_hop.get("rtt") is not None and current_hop.get("rtt") is not None:
-                    current_hop["hop_latency"] = current_hop["rtt"] - prev_hop["rtt"]
+            if "hop_latency" not in current_hop and prev_hop.get("rtt") is not None and current_hop.get("rtt") is not None:
+                current_hop["hop_latency"] = current_hop["rtt"] - prev_hop["rtt"]
+    
+    # Create bar chart comparing avg RTT
+    endpoints = list(results.keys())
+    provider_names = [PROVIDERS.get(endpoint.split('.')[0], endpoint) for endpoint in endpoints]
+    avg_rtts = [results[e]["avg_rtt_ms"] for e in endpoints]
+    
+    rtt_bar = go.Figure(data=[
+        go.Bar(x=provider_names, y=avg_rtts, marker_color='skyblue', 
+               text=[f"{rtt:.1f} ms" for rtt in avg_rtts],
+               textposition='auto')
+    ])
+    rtt_bar.update_layout(
+        title="Average Response Time by Cloud Provider",
+        xaxis_title="Cloud Provider",
+        yaxis_title="Average RTT (ms)",
+        template="plotly_white"
+    )
+    
+    # Create hop latency line chart
+    hop_latency = go.Figure()
+    
+    for endpoint in endpoints:
+        provider = endpoint.split('.')[0]
+        display_name = PROVIDERS.get(provider, provider)
         
-        # Create bar chart comparing avg RTT
-        endpoints = list(results.keys())
-        provider_names = [PROVIDERS.get(endpoint.split('.')[0], endpoint) for endpoint in endpoints]
-        avg_rtts = [results[e]["avg_rtt_ms"] for e in endpoints]
+        # Extract valid hops with RTT values and sort by TTL
+        valid_hops = [h for h in results[endpoint]["hops"] if h.get("status") == "success" and h.get("rtt") is not None]
+        valid_hops.sort(key=lambda x: x.get("ttl", 0))
         
-        rtt_bar = go.Figure(data=[
-            go.Bar(x=provider_names, y=avg_rtts, marker_color='skyblue', 
-                   text=[f"{rtt:.1f} ms" for rtt in avg_rtts],
-                   textposition='auto')
-        ])
-        rtt_bar.update_layout(
-            title="Average Response Time by Cloud Provider",
-            xaxis_title="Cloud Provider",
-            yaxis_title="Average RTT (ms)",
-            template="plotly_white"
-        )
+        if valid_hops:
+            ttls = [h["ttl"] for h in valid_hops]
+            rtts = [h["rtt"] for h in valid_hops]
+            
+            # Create hover text with geo info when available
+            hover_texts = []
+            for hop in valid_hops:
+                text = f"TTL: {hop['ttl']}<br>IP: {hop['ip']}<br>RTT: {hop['rtt']:.2f} ms"
+                if 'geo' in hop:
+                    geo = hop['geo']
+                    if 'city' in geo and 'country' in geo:
+                        text += f"<br>Location: {geo.get('city')}, {geo.get('country')}"
+                    elif 'country' in geo:
+                        text += f"<br>Country: {geo.get('country')}"
+                    if 'org' in geo:
+                        text += f"<br>Organization: {geo.get('org')}"
+                hover_texts.append(text)
+            
+            hop_latency.add_trace(go.Scatter(
+                x=ttls, 
+                y=rtts,
+                mode='lines+markers',
+                name=display_name,
+                hovertext=hover_texts,
+                hoverinfo='text'
+            ))
+    
+    hop_latency.update_layout(
+        title="RTT per Hop by Cloud Provider",
+        xaxis_title="Hop Number (TTL)",
+        yaxis_title="RTT (ms)",
+        template="plotly_white",
+        legend_title="Cloud Provider"
+    )
+    
+    # Create hop latency differential chart to show latency added by each hop
+    hop_differential = go.Figure()
+    
+    for endpoint in endpoints:
+        provider = endpoint.split('.')[0]
+        display_name = PROVIDERS.get(provider, provider)
         
-        # Create hop latency line chart
-        hop_latency = go.Figure()
+        # Extract valid hops with hop_latency values
+        latency_hops = [h for h in results[endpoint]["hops"] 
+                        if h.get("status") == "success" and "hop_latency" in h]
         
-        for endpoint in endpoints:
-            provider = endpoint.split('.')[0]
-            display_name = PROVIDERS.get(provider, provider)
+        if latency_hops:
+            # Sort by TTL to ensure correct order
+            latency_hops.sort(key=lambda x: x.get("ttl", 0))
             
-            # Extract valid hops with RTT values and sort by TTL
-            valid_hops = [h for h in results[endpoint]["hops"] if h.get("status") == "success" and h.get("rtt") is not None]
-            valid_hops.sort(key=lambda x: x.get("ttl", 0))
+            ttls = [h["ttl"] for h in latency_hops]
+            latencies = [h["hop_latency"] for h in latency_hops]
             
-            if valid_hops:
-                ttls = [h["ttl"] for h in valid_hops]
-                rtts = [h["rtt"] for h in valid_hops]
-                
-                # Create hover text with geo info when available
-                hover_texts = []
-                for hop in valid_hops:
-                    text = f"TTL: {hop['ttl']}<br>IP: {hop['ip']}<br>RTT: {hop['rtt']:.2f} ms"
-                    if 'geo' in hop:
-                        geo = hop['geo']
-                        if 'city' in geo and 'country' in geo:
-                            text += f"<br>Location: {geo.get('city')}, {geo.get('country')}"
-                        elif 'country' in geo:
-                            text += f"<br>Country: {geo.get('country')}"
-                        if 'org' in geo:
-                            text += f"<br>Organization: {geo.get('org')}"
-                    hover_texts.append(text)
-                
-                hop_latency.add_trace(go.Scatter(
-                    x=ttls, 
-                    y=rtts,
-                    mode='lines+markers',
-                    name=display_name,
-                    hovertext=hover_texts,
-                    hoverinfo='text'
-                ))
+            # Create hover text with geo info when available
+            hover_texts = []
+            for hop in latency_hops:
+                text = f"TTL: {hop['ttl']}<br>IP: {hop['ip']}<br>Added Latency: {hop['hop_latency']:.2f} ms"
+                if 'geo' in hop:
+                    geo = hop['geo']
+                    if 'city' in geo and 'country' in geo:
+                        text += f"<br>Location: {geo.get('city')}, {geo.get('country')}"
+                    elif 'country' in geo:
+                        text += f"<br>Country: {geo.get('country')}"
+                    if 'org' in geo:
+                        text += f"<br>Organization: {geo.get('org')}"
+                hover_texts.append(text)
+            
+            hop_differential.add_trace(go.Bar(
+                x=ttls,
+                y=latencies,
+                name=display_name,
+                hovertext=hover_texts,
+                hoverinfo='text'
+            ))
+    
+    hop_differential.update_layout(
+        title="Latency Added by Each Hop",
+        xaxis_title="Hop Number (TTL)",
+        yaxis_title="Latency Added (ms)",
+        template="plotly_white",
+        legend_title="Cloud Provider",
+        barmode='group'
+    )
+    
+    # Create world map with route visualization
+    # First, create a dataframe with all the hop points
+    map_data = []
+    
+    for endpoint in endpoints:
+        provider = endpoint.split('.')[0]
+        display_name = PROVIDERS.get(provider, provider)
         
-        hop_latency.update_layout(
-            title="RTT per Hop by Cloud Provider",
-            xaxis_title="Hop Number (TTL)",
-            yaxis_title="RTT (ms)",
-            template="plotly_white",
-            legend_title="Cloud Provider"
-        )
+        # Extract valid hops with geo data
+        geo_hops = [h for h in results[endpoint]["hops"] 
+                   if h.get("status") == "success" and "lat" in h and "lon" in h]
         
-        # Create hop latency differential chart to show latency added by each hop
-        hop_differential = go.Figure()
+        # Sort by TTL to ensure correct path order
+        geo_hops.sort(key=lambda x: x.get("ttl", 0))
         
-        for endpoint in endpoints:
-            provider = endpoint.split('.')[0]
-            display_name = PROVIDERS.get(provider, provider)
+        for hop in geo_hops:
+            hop_data = {
+                'provider': display_name,
+                'endpoint': endpoint,
+                'ttl': hop['ttl'],
+                'lat': hop['lat'],
+                'lon': hop['lon'],
+                'rtt': hop.get('rtt', 0),
+            }
             
-            # Extract valid hops with hop_latency values
-            latency_hops = [h for h in results[endpoint]["hops"] 
-                            if h.get("status") == "success" and "hop_latency" in h]
-            
-            if latency_hops:
-                # Sort by TTL to ensure correct order
-                latency_hops.sort(key=lambda x: x.get("ttl", 0))
-                
-                ttls = [h["ttl"] for h in latency_hops]
-                latencies = [h["hop_latency"] for h in latency_hops]
+            # Add location information if available
+            if 'geo' in hop:
+                geo = hop['geo']
+                location_parts = []
                 
-                # Create hover text with geo info when available
-                hover_texts = []
-                for hop in latency_hops:
-                    text = f"TTL: {hop['ttl']}<br>IP: {hop['ip']}<br>Added Latency: {hop['hop_latency']:.2f} ms"
-                    if 'geo' in hop:
-                        geo = hop['geo']
-                        if 'city' in geo and 'country' in geo:
-                            text += f"<br>Location: {geo.get('city')}, {geo.get('country')}"
-                        elif 'country' in geo:
-                            text += f"<br>Country: {geo.get('country')}"
-                        if 'org' in geo:
-                            text += f"<br>Organization: {geo.get('org')}"
-                    hover_texts.append(text)
+                if 'city' in geo and geo['city']:
+                    location_parts.append(geo['city'])
+                if 'region' in geo and geo['region']:
+                    location_parts.append(geo['region'])
+                if 'country' in geo and geo['country']:
+                    location_parts.append(geo['country'])
                 
-                hop_differential.add_trace(go.Bar(
-                    x=ttls,
-                    y=latencies,
-                    name=display_name,
-                    hovertext=hover_texts,
-                    hoverinfo='text'
-                ))
+                hop_data['location'] = ', '.join(location_parts) if location_parts else 'Unknown'
+                hop_data['org'] = geo.get('org', 'Unknown')
+            else:
+                hop_data['location'] = 'Unknown'
+                hop_data['org'] = 'Unknown'
+            
+            map_data.append(hop_data)
+    
+    if map_data:
+        df = pd.DataFrame(map_data)
         
-        hop_differential.update_layout(
-            title="Latency Added by Each Hop",
-            xaxis_title="Hop Number (TTL)",
-            yaxis_title="Latency Added (ms)",
-            template="plotly_white",
-            legend_title="Cloud Provider",
-            barmode='group'
+        # Create the map
+        geo_map = px.scatter_geo(
+            df,
+            lat='lat',
+            lon='lon',
+            color='provider',
+            hover_name='location',
+            hover_data={
+                'provider': True,
+                'ttl': True,
+                'rtt': ':.2f',
+                'org': True,
+                'lat': False,
+                'lon': False,
+                'endpoint': False
+            },
+            size='rtt',
+            size_max=15,
+            projection='natural earth',
+            title='Network Path Visualization'
         )
         
-        # Create world map with route visualization
-        # First, create a dataframe with all the hop points
-        map_data = []
-        
+        # Add lines connecting hops for each provider
         for endpoint in endpoints:
             provider = endpoint.split('.')[0]
             display_name = PROVIDERS.get(provider, provider)
             
-            # Extract valid hops with geo data
-            geo_hops = [h for h in results[endpoint]["hops"] 
-                       if h.get("status") == "success" and "lat" in h and "lon" in h]
-            
-            # Sort by TTL to ensure correct path order
-            geo_hops.sort(key=lambda x: x.get("ttl", 0))
+            # Filter for this provider's hops with geo data and sort by TTL
+            provider_hops = [h for h in results[endpoint]["hops"] 
+                            if h.get("status") == "success" and "lat" in h and "lon" in h]
             
-            for hop in geo_hops:
-                hop_data = {
-                    'provider': display_name,
-                    'endpoint': endpoint,
-                    'ttl': hop['ttl'],
-                    'lat': hop['lat'],
-                    'lon': hop['lon'],
-                    'rtt': hop.get('rtt', 0),
-                }
+            if len(provider_hops) >= 2:
+                # Sort by TTL
+                provider_hops.sort(key=lambda x: x.get("ttl", 0))
                 
-                # Add location information if available
-                if 'geo' in hop:
-                    geo = hop['geo']
-                    location_parts = []
-                    
-                    if 'city' in geo and geo['city']:
-                        location_parts.append(geo['city'])
-                    if 'region' in geo and geo['region']:
-                        location_parts.append(geo['region'])
-                    if 'country' in geo and geo['country']:
-                        location_parts.append(geo['country'])
-                    
-                    hop_data['location'] = ', '.join(location_parts) if location_parts else 'Unknown'
-                    hop_data['org'] = geo.get('org', 'Unknown')
-                else:
-                    hop_data['location'] = 'Unknown'
-                    hop_data['org'] = 'Unknown'
+                # Extract coordinates
+                lats = [h['lat'] for h in provider_hops]
+                lons = [h['lon'] for h in provider_hops]
                 
-                map_data.append(hop_data)
-        
-        if map_data:
-            df = pd.DataFrame(map_data)
-            
-            # Create the map
-            geo_map = px.scatter_geo(
-                df,
-                lat='lat',
-                lon='lon',
-                color='provider',
-                hover_name='location',
-                hover_data={
-                    'provider': True,
-                    'ttl': True,
-                    'rtt': ':.2f',
-                    'org': True,
-                    'lat': False,
-                    'lon': False,
-                    'endpoint': False
-                },
-                size='rtt',
-                size_max=15,
-                projection='natural earth',
-                title='Network Path Visualization'
-            )
-            
-            # Add lines connecting hops for each provider
-            for endpoint in endpoints:
-                provider = endpoint.split('.')[0]
-                display_name = PROVIDERS.get(provider, provider)
-                
-                # Filter for this provider's hops with geo data and sort by TTL
-                provider_hops = [h for h in results[endpoint]["hops"] 
-                                if h.get("status") == "success" and "lat" in h and "lon" in h]
-                
-                if len(provider_hops) >= 2:
-                    # Sort by TTL
-                    provider_hops.sort(key=lambda x: x.get("ttl", 0))
-                    
-                    # Extract coordinates
-                    lats = [h['lat'] for h in provider_hops]
-                    lons = [h['lon'] for h in provider_hops]
-                    
-                    # Add the line trace
-                    geo_map.add_trace(
-                        go.Scattergeo(
-                            lat=lats,
-                            lon=lons,
-                            mode='lines',
-                            line=dict(width=2, color=px.colors.qualitative.Plotly[endpoints.index(endpoint) % len(px.colors.qualitative.Plotly)]),
-                            name=f"{display_name} Path"
-                        )
+                # Add the line trace
+                geo_map.add_trace(
+                    go.Scattergeo(
+                        lat=lats,
+                        lon=lons,
+                        mode='lines',
+                        line=dict(width=2, color=px.colors.qualitative.Plotly[endpoints.index(endpoint) % len(px.colors.qualitative.Plotly)]),
+                        name=f"{display_name} Path"
                     )
-            
-            geo_map.update_layout(
-                height=600,
-                margin=dict(l=0, r=0, t=40, b=0),
-                legend_title_text='Cloud Provider',
-                geo=dict(
-                    showland=True,
-                    landcolor='rgb(243, 243, 243)',
-                    countrycolor='rgb(204, 204, 204)',
-                    showocean=True,
-                    oceancolor='rgb(230, 230, 250)',
-                    showlakes=True,
-                    lakecolor='rgb(230, 230, 250)',
-                    showrivers=True,
-                    rivercolor='rgb(230, 230, 250)'
                 )
-            )
-        else:
-            # Create empty map if no geo data
-            geo_map = go.Figure(go.Scattergeo())
-            geo_map.update_layout(
-                title="No geolocation data available",
-                height=600
-            )
         
-        # Create success rate gauges
-        gauges = []
-        for i, endpoint in enumerate(endpoints):
-            provider = endpoint.split('.')[0]
-            display_name = PROVIDERS.get(provider, provider)
-            
-            gauges.append(
-                go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=results[endpoint]["success_rate"],
-                    title={"text": f"{display_name} Success Rate"},
-                    gauge={
-                        'axis': {'range': [0, 100]},
-                        'bar': {'color': "darkblue"},
-                        'steps': [
-                            {'range': [0, 50], 'color': "red"},
-                            {'range': [50, 80], 'color': "orange"},
-                            {'range': [80, 100], 'color': "green"}
-                        ]
-                    }
-                ))
+        geo_map.update_layout(
+            height=600,
+            margin=dict(l=0, r=0, t=40, b=0),
+            legend_title_text='Cloud Provider',
+            geo=dict(
+                showland=True,
+                landcolor='rgb(243, 243, 243)',
+                countrycolor='rgb(204, 204, 204)',
+                showocean=True,
+                oceancolor='rgb(230, 230, 250)',
+                showlakes=True,
+                lakecolor='rgb(230, 230, 250)',
+                showrivers=True,
+                rivercolor='rgb(230, 230, 250)'
             )
-            gauges[i].update_layout(height=300)
+        )
+    else:
+        # Create empty map if no geo data
+        geo_map = go.Figure(go.Scattergeo())
+        geo_map.update_layout(
+            title="No geolocation data available",
+            height=600
+        )
+    
+    # Create success rate gauges
+    gauges = []
+    for i, endpoint in enumerate(endpoints):
+        provider = endpoint.split('.')[0]
+        display_name = PROVIDERS.get(provider, provider)
         
-        # Convert to JSON
-        charts = {
-            'rtt_bar': rtt_bar.to_json(),
-            'hop_latency': hop_latency.to_json(),
-            'hop_differential': hop_differential.to_json(),
-            'geo_map': geo_map.to_json(),
-            'gauges': [gauge.to_json() for gauge in gauges]
-        }
+        gauges.append(
+            go.Figure(go.Indicator(
+                mode="gauge+number",
+                value=results[endpoint]["success_rate"],
+                title={"text": f"{display_name} Success Rate"},
+                gauge={
+                    'axis': {'range': [0, 100]},
+                    'bar': {'color': "darkblue"},
+                    'steps': [
+                        {'range': [0, 50], 'color': "red"},
+                        {'range': [50, 80], 'color': "orange"},
+                        {'range': [80, 100], 'color': "green"}
+                    ]
+                }
+            ))
+        )
+        gauges[i].update_layout(height=300)
+    
+    # Convert to JSON
+    charts = {
+        'rtt_bar': rtt_bar.to_json(),
+        'hop_latency': hop_latency.to_json(),
+        'hop_differential': hop_differential.to_json(),
+        'geo_map': geo_map.to_json(),
+        'gauges': [gauge.to_json() for gauge in gauges]
+    }
+    
+    return charts
+
+@app.route('/visualize')
+def visualize():
+    result_path = Path('data/latest_results.json')
+    
+    # Check if results file exists
+    if not result_path.exists():
+        return render_template('no_results.html', error="No results file found. Please run a benchmark first.")
+    
+    # Check if file is empty
+    if result_path.stat().st_size == 0:
+        return render_template('no_results.html', error="Results file exists but is empty. Please run the benchmark again.")
+    
+    try:
+        with open(result_path, 'r') as f:
+            results = json.load(f)
+        
+        # Check if results are empty
+        if not results:
+            return render_template('no_results.html', error="Results file exists but contains no data. Please run the benchmark again.")
+        
+        charts = build_charts(results)
+        endpoints = list(results.keys())
         
         # Create a mapping of endpoints to provider display names
         provider_display = {endpoint: PROVIDERS.get(endpoint.split('.')[0], endpoint) for endpoint in endpoints}
@@ -563,4 +690,5 @@ def visualize():
         return render_template('no_results.html', error=str(e))
 
 if __name__ == '__main__':
+    default_resolver.start_refresh()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""
+Microbenchmark: probe packet construction throughput.
+
+Compares the original build_packet + byte-pair checksum loop against
+src.tracer.PacketBuilder and reports probes/second for each.
+
+    python -m benchmarks.bench_packet
+"""
+import os
+import struct
+import sys
+import time
+import timeit
+from socket import htons
+
+from src.constants import ICMP_ECHO_REQUEST
+from src.tracer import PacketBuilder, checksum
+
+def legacy_checksum(source_string):
+    csum = 0
+    countTo = (len(source_string) // 2) * 2
+    count = 0
+    while count < countTo:
+        thisVal = source_string[count+1] * 256 + source_string[count]
+        csum = csum + thisVal
+        csum = csum & 0xffffffff
+        count = count + 2
+    if countTo < len(source_string):
+        csum = csum + source_string[len(source_string) - 1]
+        csum = csum & 0xffffffff
+    csum = (csum >> 16) + (csum & 0xffff)
+    csum = csum + (csum >> 16)
+    answer = ~csum
+    answer = answer & 0xffff
+    answer = answer >> 8 | (answer << 8 & 0xff00)
+    return answer
+
+def legacy_build_packet(seq=1):
+    my_id = os.getpid() & 0xFFFF
+    header = struct.pack("bbHHh", ICMP_ECHO_REQUEST, 0, 0, my_id, seq)
+    data = struct.pack("d", time.time())
+    my_checksum = legacy_checksum(header + data)
+    if sys.platform == 'darwin':
+        my_checksum = htons(my_checksum) & 0xffff
+    else:
+        my_checksum = htons(my_checksum)
+    header = struct.pack("bbHHh", ICMP_ECHO_REQUEST, 0, my_checksum, my_id, seq)
+    return header + data
+
+def probes_per_second(build, number=100000):
+    """Best of three timings of `number` probe builds cycling through a trace's sequence range."""
+    seqs = [seq % 60 + 1 for seq in range(number)]
+    def run():
+        for seq in seqs:
+            build(seq)
+    return number / min(timeit.repeat(run, number=1, repeat=3))
+
+def run():
+    """Run the microbenchmark and return {name: probes_per_second}."""
+    builder = PacketBuilder(os.getpid() & 0xFFFF)
+    sample = os.urandom(1500)
+    assert checksum(sample) == legacy_checksum(sample)
+
+    return {
+        "legacy_build_packet": probes_per_second(legacy_build_packet),
+        "packet_builder": probes_per_second(builder.build),
+    }
+
+if __name__ == "__main__":
+    results = run()
+    baseline = results["legacy_build_packet"]
+    for name, rate in results.items():
+        print(f"{name:24s} {rate:12,.0f} probes/s  ({rate / baseline:.1f}x)")
@@ -0,0 +1,215 @@
+"""
+Performance suite: the CPU-bound stages of the benchmark pipeline on synthetic data.
+
+Times probe construction (checksum, build_packet), post-processing of a
+trace (process_route with a warm geolocation cache), aggregate_runs,
+GeoLocator.geolocate_hops (warm cache), offline geolocation database
+lookups, special-purpose address classification, the results
+serialization done by the web app's benchmark task and the /visualize
+figure construction. No privileges, network access or real traces are
+needed.
+
+Every run is appended to a JSON Lines history file together with the git
+commit and Python version, and compared with the previous entry, so a
+regression shows up as a slowdown against the last recorded version.
+
+    python -m benchmarks.bench_pipeline [--output FILE] [--label NAME] [--fail-on-regression]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.benchmark import aggregate_runs, process_route
+from src.bogons import AddressClassifier
+from src.geo import GeoLocator
+from src.geocache import GeoCache
+from src.geodb import GeoDatabase
+from src.hop import Hop
+from src.tracer import build_packet, checksum
+
+# Default history file, one JSON record per suite run
+HISTORY_FILE = "benchmarks/perf_history.jsonl"
+# A case this much slower than in the previous record counts as a regression
+REGRESSION_THRESHOLD = 0.2
+
+def synthetic_hops(num_hops=20, seed=0):
+    """A plausible trace: mostly answering public hops with growing RTT, some silent ones."""
+    rng = random.Random(seed)
+    hops = []
+    rtt = 0.5
+    for ttl in range(1, num_hops + 1):
+        rtt += rng.uniform(0.2, 8)
+        if rng.random() < 0.1:
+            hops.append(Hop(ttl, None, None, "timeout", attempt=2))
+        else:
+            octets = (rng.choice((52, 185, 198, 203)), rng.randrange(256), rng.randrange(256), ttl)
+            ip = ".".join(map(str, octets))
+            hops.append(Hop(ttl, ip, rng.gauss(rtt, rtt * 0.05), clock="kernel"))
+    return hops
+
+def warm_geolocator(hops):
+    """A GeoLocator whose cache already holds every address in hops (no API calls)."""
+    geolocator = GeoLocator(cache=GeoCache(":memory:"))
+    rng = random.Random(1)
+    geolocator.cache.put_many({
+        hop["ip"]: {"ip": hop["ip"], "city": "City", "region": "Region",
+                    "country": rng.choice(("US", "DE", "NL", "GB")),
+                    "loc": f"{rng.uniform(-60, 60):.4f},{rng.uniform(-180, 180):.4f}",
+                    "org": "AS64500 Example Transit", "asn": "64500"}
+        for hop in hops if hop["ip"]
+    })
+    return geolocator
+
+def synthetic_geo_database(directory, num_ranges=10000):
+    """A GeoDatabase of num_ranges adjacent /20 ranges covering 16.0.0.0 upwards."""
+    path = os.path.join(directory, "geoip.csv")
+    with open(path, "w") as f:
+        f.write("network,country,latitude,longitude,org,asn\n")
+        for i in range(num_ranges):
+            address = (16 << 24) + (i << 12)
+            octets = ".".join(str(address >> shift & 255) for shift in (24, 16, 8, 0))
+            f.write(f"{octets}/20,C{i % 200},{i % 90}.5,{i % 180}.25,AS{i},{i}\n")
+    return GeoDatabase(path)
+
+def measure(func, setup=None, number=200, repeat=5):
+    """
+    Time func, excluding setup.
+
+    Args:
+        func: Called as func(setup()) (or func() without setup)
+        setup: Builds fresh input for every call (e.g. copies of data func mutates)
+        number: Calls per repeat
+        repeat: Repeats; the best one is reported
+
+    Returns:
+        Dictionary with the best per-call time in microseconds and calls per second
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        total = 0.0
+        for _ in range(number):
+            args = (setup(),) if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            total += time.perf_counter() - start
+        best = min(best, total / number)
+    return {"us_per_call": best * 1e6, "calls_per_s": 1 / best}
+
+def run(number=200, repeat=5):
+    """Run every case and return {case: measure() result}."""
+    from app import build_charts, serialize_result
+
+    hops = synthetic_hops()
+    geolocator = warm_geolocator(hops)
+    fresh_hops = lambda: [hop.copy() for hop in hops]
+    packet = build_packet(1)
+    with contextlib.redirect_stdout(io.StringIO()):  # The pipeline logs every trace
+        runs = []
+        for seed in range(10):
+            run_hops = synthetic_hops(seed=seed)
+            runs.append(process_route("aws", "aws.example", run_hops, warm_geolocator(run_hops),
+                                      time.time()))
+        aggregated = aggregate_runs(runs)
+        results = {f"provider{i}.example": aggregated for i in range(8)}
+        serialized = {host: serialize_result(result) for host, result in results.items()}
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        geo_db = synthetic_geo_database(directory)
+    lookup_ips = [f"{16 + i % 2}.{i % 256}.{i * 7 % 256}.{i % 254 + 1}" for i in range(100)]
+    classifier = AddressClassifier()
+    classify_ips = ([hop["ip"] for hop in synthetic_hops(120) if hop["ip"]][:98]
+                    + ["100.64.0.1", "fe80::1"])
+
+    cases = {
+        "checksum": (lambda: checksum(packet), None),
+        "build_packet": (lambda: build_packet(7), None),
+        "process_route": (lambda h: process_route("aws", "aws.example", h, geolocator, time.time()),
+                          fresh_hops),
+        "aggregate_runs": (lambda: aggregate_runs(runs), None),
+        "geolocate_hops_warm": (geolocator.geolocate_hops, fresh_hops),
+        "geodb_lookup_x100": (lambda: [geo_db.lookup(ip) for ip in lookup_ips], None),
+        "classify_x100": (lambda: [classifier.classify(ip) for ip in classify_ips], None),
+        "serialize_results": (lambda: json.dumps({host: serialize_result(result)
+                                                  for host, result in results.items()}), None),
+        "build_charts": (build_charts, lambda: json.loads(json.dumps(serialized))),
+    }
+    measured = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, (func, setup) in cases.items():
+            # Figure construction is orders of magnitude slower than the rest
+            calls = max(number // 20, 1) if name == "build_charts" else number
+            measured[name] = measure(func, setup, number=calls, repeat=repeat)
+    return measured
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(path):
+    """Records previously written by record(), oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def record(results, path=HISTORY_FILE, label=None):
+    """Append a suite run to the history file and return the record."""
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "label": label,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+def compare(results, previous, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare a suite run with an earlier record.
+
+    Returns:
+        {case: time ratio (new / previous)} for the cases in both, and the list
+        of cases more than threshold slower
+    """
+    ratios = {name: results[name]["us_per_call"] / old["us_per_call"]
+              for name, old in previous["results"].items() if name in results}
+    return ratios, [name for name, ratio in ratios.items() if ratio > 1 + threshold]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CloudTrace pipeline performance suite")
+    parser.add_argument("--output", default=HISTORY_FILE, help="History file to append to")
+    parser.add_argument("--label", help="Name for this run in the history (e.g. a branch)")
+    parser.add_argument("--number", type=int, default=200, help="Calls per timing repeat")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help=f"Exit non-zero if a case is over {REGRESSION_THRESHOLD:.0%} slower "
+                             "than in the previous record")
+    args = parser.parse_args()
+
+    history = load_history(args.output)
+    results = run(number=args.number)
+    entry = record(results, args.output, args.label)
+    ratios, regressions = compare(results, history[-1]) if history else ({}, [])
+    since = f" (vs {history[-1]['commit'] or history[-1]['timestamp']})" if history else ""
+    print(f"Commit {entry['commit']}, Python {entry['python']}{since}")
+    for name, timing in results.items():
+        change = f"  {ratios[name]:5.2f}x" if name in ratios else ""
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:22s} {timing['us_per_call']:12.1f} us/call{change}{flag}")
+    print(f"Recorded in {args.output}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
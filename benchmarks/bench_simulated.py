@@ -0,0 +1,38 @@
+"""
+Load test: run_benchmark throughput on the simulated network.
+
+Traces a random tree topology (with loss, silent hops and ICMP rate
+limiting) through the full benchmark pipeline, including post-processing,
+aggregation and geolocation of the (private) hop addresses, and reports
+traces per minute. Needs no privileges or network access.
+
+    python -m benchmarks.bench_simulated
+"""
+import contextlib
+import io
+import time
+
+from src.benchmark import run_benchmark
+from src.simnet import SimulatedNetwork
+
+def traces_per_minute(num_endpoints=10, num_runs=50, pipelined=False, seed=0):
+    """Time one run_benchmark over num_endpoints simulated hosts and return traces/minute."""
+    endpoints = {f"provider{i}": f"provider{i}.example" for i in range(num_endpoints)}
+    network = SimulatedNetwork.random_tree(endpoints.values(), seed=seed, loss=0.01,
+                                           rate_limit=100)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Per-hop logging would dominate
+        run_benchmark(endpoints, num_runs=num_runs, pipelined=pipelined, backend=network)
+    elapsed = time.perf_counter() - start
+    return num_endpoints * num_runs / elapsed * 60
+
+def run():
+    """Run the load test and return {mode: traces_per_minute}."""
+    return {
+        "serial": traces_per_minute(),
+        "pipelined": traces_per_minute(pipelined=True),
+    }
+
+if __name__ == "__main__":
+    for mode, rate in run().items():
+        print(f"{mode:10s} {rate:12,.0f} traces/min")
@@ -1,6 +1,16 @@
 import argparse
-from src.benchmark import run_benchmark
-from src.endpoints import get_endpoints
+import asyncio
+from src.benchmark import iter_benchmark, async_run_benchmark
+from src.simnet import SimulatedNetwork
+from src.constants import (
+    ASYNC_CONCURRENCY, BENCHMARK_WORKERS, PROBE_PROTOCOLS, MONITOR_INTERVAL,
+    MONITOR_PROBES_PER_SECOND, ADAPTIVE_MAX_RUNS, COORDINATOR_TIMEOUT, PROVIDERS
+)
+from src.endpoints import get_endpoints, get_probe_options, get_monitor_intervals
+from src.monitor import Monitor
+from src.resolver import default_resolver, expand_addresses
+from src.agent import Agent, serve_agent
+from src.coordinator import Coordinator
 from src.export import to_csv
 from src.db import Database
 from src.visualize import visualize
@@ -10,7 +20,67 @@ def main():
     parser = argparse.ArgumentParser(description="CloudTrace Benchmark")
     parser.add_argument("--endpoints", nargs="+", default=["aws", "azure", "gcp"])
     parser.add_argument("--web", action="store_true", help="Start the web interface")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Probe all TTLs of a route at once instead of hop by hop")
+    parser.add_argument("--protocol", choices=PROBE_PROTOCOLS,
+                        help="Probe protocol for all endpoints (default: per endpoint config, else icmp)")
+    parser.add_argument("--no-shared-prefix", dest="share_prefix", action="store_false",
+                        help="Probe the local hops common to every endpoint separately for each trace")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Trace endpoints concurrently (runs to one host still one at a time)")
+    parser.add_argument("--workers", type=int, default=BENCHMARK_WORKERS,
+                        help="Maximum number of traces in flight with --parallel")
+    parser.add_argument("--simulate", action="store_true",
+                        help="Trace a simulated network instead of the real one (no root needed)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Trace all endpoints and runs concurrently on one event loop")
+    parser.add_argument("--concurrency", type=int, default=ASYNC_CONCURRENCY,
+                        help="Maximum number of traces in flight with --async")
+    parser.add_argument("--monitor", action="store_true",
+                        help="Keep tracing every endpoint on its interval and store each result")
+    parser.add_argument("--interval", type=float, default=MONITOR_INTERVAL,
+                        help="Seconds between traces of an endpoint with --monitor "
+                             "(unless configured per endpoint)")
+    parser.add_argument("--probe-rate", type=float, default=MONITOR_PROBES_PER_SECOND,
+                        help="Maximum probes per second across all traces with --monitor")
+    parser.add_argument("--target-ci", type=float,
+                        help="Keep running each endpoint until the 95%% confidence interval of its "
+                             "RTT is within +/- this fraction (e.g. 0.05)")
+    parser.add_argument("--ci-statistic", choices=["mean", "p95"], default="mean",
+                        help="RTT statistic the --target-ci interval is on")
+    parser.add_argument("--max-runs", type=int, default=ADAPTIVE_MAX_RUNS,
+                        help="Maximum runs per endpoint with --target-ci")
+    parser.add_argument("--time-budget", type=float,
+                        help="Maximum seconds of runs per endpoint with --target-ci")
+    parser.add_argument("--time-limit", type=float,
+                        help="Stop the benchmark after this many seconds, keeping partial results")
+    parser.add_argument("--trace-timeout", type=float,
+                        help="Cut any single trace short after this many seconds")
+    parser.add_argument("--agent", metavar="NAME",
+                        help="Run as a vantage-point agent: benchmark on request from a "
+                             "coordinator and push results to --collector")
+    parser.add_argument("--coordinate", action="store_true",
+                        help="Run the benchmark on every agent registered with --collector "
+                             "and print the results per vantage point")
+    parser.add_argument("--timeout", type=float, default=COORDINATOR_TIMEOUT,
+                        help="Seconds --coordinate waits for the agents to finish")
+    parser.add_argument("--collector", default="http://127.0.0.1:5000",
+                        help="Base URL of the collector (the web interface) for --agent and "
+                             "--coordinate")
+    parser.add_argument("--listen", default="127.0.0.1:0", metavar="HOST:PORT",
+                        help="Address the --agent API listens on (port 0 picks a free one)")
+    parser.add_argument("--advertise", metavar="HOST",
+                        help="Address the collector should reach the --agent API at "
+                             "(default: the --listen host)")
+    parser.add_argument("--all-addresses", action="store_true",
+                        help="Trace every A record of each endpoint instead of only the first")
     args = parser.parse_args()
+    if args.use_async:
+        check_async_options(parser, args)
+
+    if not args.simulate and not args.coordinate:
+        # Keep the endpoints resolved, so a trace never waits for DNS or uses a stale address
+        default_resolver.start_refresh()
 
     if args.web:
         # Import and run Flask app when --web flag is used
@@ -20,19 +90,116 @@ def main():
         except ImportError:
             print("Error: Flask not installed. Run 'pip install flask' to use the web interface.")
             return
+    elif args.coordinate:
+        coordinate(args)
+    elif args.agent:
+        run_agent(args)
     else:
         # Run traditional CLI benchmark
         endpoints = get_endpoints(args.endpoints)
-        results = run_benchmark(endpoints)
-
+        probe_options = get_probe_options(args.endpoints)
+        intervals = get_monitor_intervals(args.endpoints)
+        if args.all_addresses and not args.simulate:
+            endpoints, probe_options, intervals = expand_addresses(endpoints, probe_options,
+                                                                   intervals)
+        backend = SimulatedNetwork.random_tree(endpoints.values()) if args.simulate else None
         # Ensure data directory exists
         os.makedirs("data", exist_ok=True)
-
         db = Database()
-        db.save_results(results)
+
+        if args.monitor:
+            monitor_endpoints(args, endpoints, backend, db, probe_options, intervals)
+            return
+        
+        if args.use_async:
+            results = asyncio.run(async_run_benchmark(endpoints, concurrency=args.concurrency))
+            db.save_results(results)
+        else:
+            # Store each provider as soon as all of its runs are in
+            results = {}
+            for event in iter_benchmark(endpoints, pipelined=args.pipelined, protocol=args.protocol,
+                                        probe_options=probe_options,
+                                        share_prefix=args.share_prefix, backend=backend,
+                                        parallel=args.parallel, max_workers=args.workers,
+                                        target_ci=args.target_ci, ci_statistic=args.ci_statistic,
+                                        max_runs=args.max_runs, time_budget=args.time_budget,
+                                        time_limit=args.time_limit,
+                                        trace_timeout=args.trace_timeout):
+                if event["type"] == "endpoint":
+                    results[event["key"]] = event["result"]
+                    report_interval(event["name"], event["result"])
+                    db.save_results({event["key"]: event["result"]})
+
         to_csv(results)
         visualize(results)
         print("Results saved to data/results.csv, database, and visualizations in data/")
 
+def check_async_options(parser, args):
+    """Reject options the --async engine (ICMP only, real network, fixed runs) cannot honour"""
+    unsupported = [flag for flag, value in (("--simulate", args.simulate),
+                                            ("--target-ci", args.target_ci),
+                                            ("--time-limit", args.time_limit),
+                                            ("--trace-timeout", args.trace_timeout))
+                   if value]
+    if args.protocol not in (None, "icmp"):
+        unsupported.append(f"--protocol {args.protocol}")
+    if unsupported:
+        parser.error(f"--async cannot be combined with {', '.join(unsupported)}")
+    # --protocol icmp overrides what the endpoints are configured for
+    configured = [name for name, options in get_probe_options(args.endpoints).items()
+                  if options.get("protocol", "icmp") != "icmp"]
+    if configured and args.protocol is None:
+        parser.error(f"--async probes with ICMP only, but {', '.join(configured)} "
+                     "is configured for another protocol (pick --endpoints or --protocol icmp)")
+
+def report_interval(name, result):
+    """Print how precisely an endpoint's RTT was measured"""
+    ci = result.get("rtt_ci")
+    if ci:
+        print(f"{name}: RTT {ci['statistic']} {ci['estimate']:.1f} ms "
+              f"[{ci['low']:.1f}, {ci['high']:.1f}] from {result['runs_used']} runs")
+
+def run_agent(args):
+    """Serve as a vantage-point agent until interrupted"""
+    backend = None
+    if args.simulate:
+        # Seeded by name, so every simulated vantage point sees a different network
+        backend = SimulatedNetwork.random_tree(get_endpoints(PROVIDERS).values(), seed=args.agent)
+    agent = Agent(args.agent, args.collector, backend=backend, pipelined=args.pipelined,
+                  share_prefix=args.share_prefix)
+    host, port = args.listen.rsplit(":", 1)
+    try:
+        serve_agent(agent, host, int(port), args.advertise)
+    except KeyboardInterrupt:
+        print(f"Agent {args.agent} stopped")
+
+def coordinate(args):
+    """Benchmark from every registered agent and print each endpoint's RTT per vantage point"""
+    merged = Coordinator(args.collector).run(args.endpoints, protocol=args.protocol,
+                                             timeout=args.timeout)
+    for name, entry in merged["vantages"].items():
+        state = "finished" if entry["finished"] else "unfinished"
+        error = f" ({entry['error']})" if entry["error"] else ""
+        print(f"{name}: {len(entry['results'])} endpoints, {state}{error}")
+    for endpoint, rtts in merged["endpoints"].items():
+        print(f"{endpoint}: " + ", ".join(f"{name} {rtt:.1f} ms" for name, rtt in rtts.items()))
+
+def monitor_endpoints(args, endpoints, backend, db, probe_options, intervals):
+    """Run the monitoring daemon until interrupted, storing every trace as it completes"""
+    def store(name, host, result):
+        data = result["data"]
+        db.save_results({host: data})
+        print(f"{name}: {data['hop_count']} hops, avg RTT {data['avg_rtt_ms']:.1f} ms")
+    
+    monitor = Monitor(endpoints, intervals=intervals,
+                      default_interval=args.interval, probes_per_second=args.probe_rate,
+                      on_result=store, backend=backend, protocol=args.protocol,
+                      probe_options=probe_options, pipelined=args.pipelined)
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        # Let the traces in flight finish and be stored
+        monitor.stop()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+import threading
+import time
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+from src.benchmark import iter_benchmark
+from src.constants import (
+    AGENT_BATCH_SIZE, AGENT_PUSH_RETRIES, AGENT_PUSH_BACKOFF, AGENT_PUSH_MAX_BACKOFF,
+    AGENT_HTTP_TIMEOUT
+)
+from src.endpoints import get_endpoints, get_probe_options
+
+# Endpoint result fields an agent sends to the collector (hops are sent separately, compacted)
+COMPACT_FIELDS = ("hop_count", "avg_rtt_ms", "max_rtt_ms", "min_rtt_ms", "success_rate",
+                  "packet_loss")
+
+def compact_result(result):
+    """
+    Reduce a run_benchmark entry to what the collector stores.
+
+    Args:
+        result: Aggregated result for one endpoint (see benchmark.aggregate_runs)
+
+    Returns:
+        Dictionary with the summary metrics and the hops as [ttl, ip, rtt] triples
+    """
+    compact = {field: result[field] for field in COMPACT_FIELDS}
+    compact["hops"] = [[hop["ttl"], hop["ip"], hop["rtt"]] for hop in result["hops"]]
+    return compact
+
+class Agent:
+    """
+    Vantage point: runs benchmarks locally on request and pushes the results to a collector.
+
+    Results are pushed in batches of batch_size endpoints as they complete;
+    the last push of a job marks it finished (with the error, if the
+    benchmark failed) and is retried until the collector takes it. Any
+    other batch the collector did not take is kept and sent with the next
+    one.
+    """
+
+    def __init__(self, name, collector_url, batch_size=AGENT_BATCH_SIZE, backend=None,
+                 **benchmark_options):
+        """
+        Args:
+            name: Vantage point name the results are stored under
+            collector_url: Base URL of the collector (the web app)
+            batch_size: Endpoint results per push
+            backend: Probe backend (default: raw sockets; see tracer.get_route)
+            **benchmark_options: Passed on to benchmark.iter_benchmark (e.g. pipelined=True)
+        """
+        self.name = name
+        self.collector_url = collector_url.rstrip('/')
+        self.batch_size = batch_size
+        self.backend = backend
+        self.benchmark_options = benchmark_options
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.jobs = {}  # job -> "running", "complete" or "error"
+
+    def register(self, url):
+        """Tell the collector where this agent accepts benchmark requests."""
+        response = self.session.post(f"{self.collector_url}/collector/agents",
+                                     json={"name": self.name, "url": url},
+                                     timeout=AGENT_HTTP_TIMEOUT)
+        response.raise_for_status()
+
+    def start(self, job, providers, num_runs=3, protocol=None):
+        """Run a benchmark job in a background thread; False if one is already running."""
+        with self.lock:
+            if "running" in self.jobs.values():
+                return False
+            self.jobs[job] = "running"
+        threading.Thread(target=self.run, args=(job, providers, num_runs, protocol),
+                         daemon=True).start()
+        return True
+
+    def run(self, job, providers, num_runs=3, protocol=None):
+        """Benchmark the providers and push their results to the collector."""
+        print(f"Agent {self.name}: starting job {job} for {providers}")
+        pending = {}
+        error = None
+        try:
+            endpoints = get_endpoints(providers)
+            for event in iter_benchmark(endpoints, num_runs, protocol=protocol,
+                                        probe_options=get_probe_options(providers),
+                                        backend=self.backend, **self.benchmark_options):
+                if event["type"] != "endpoint":
+                    continue
+                pending[event["key"]] = compact_result(event["result"])
+                if len(pending) >= self.batch_size:
+                    pending = self._push(job, pending)
+        except Exception as exc:
+            print(f"Agent {self.name}: job {job} failed: {exc}")
+            error = str(exc)
+        pending = self._push(job, pending, finished=True, error=error)
+        with self.lock:
+            self.jobs[job] = "error" if error or pending else "complete"
+
+    def _push(self, job, results, finished=False, error=None):
+        """
+        Send a batch to the collector, backing off between attempts.
+
+        Returns:
+            What is still unsent: nothing once the collector took the batch,
+            else the batch (after AGENT_PUSH_RETRIES attempts; the finishing
+            push is retried until it goes through, so the collector always
+            learns that the job is over)
+        """
+        payload = {"job": job, "vantage": self.name, "results": results,
+                   "finished": finished, "error": error}
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(f"{self.collector_url}/collector/results",
+                                             json=payload, timeout=AGENT_HTTP_TIMEOUT)
+                response.raise_for_status()
+                return {}
+            except requests.RequestException as exc:
+                attempt += 1
+                limit = "" if finished else f"/{AGENT_PUSH_RETRIES}"
+                print(f"Agent {self.name}: push {attempt}{limit} failed: {exc}")
+                if not finished and attempt >= AGENT_PUSH_RETRIES:
+                    return results
+                time.sleep(min(AGENT_PUSH_BACKOFF * 2 ** (attempt - 1), AGENT_PUSH_MAX_BACKOFF))
+
+def create_agent_app(agent):
+    """Flask app through which a coordinator starts benchmarks on an agent"""
+    app = Flask(__name__)
+
+    @app.route('/run', methods=['POST'])
+    def run():
+        data = request.json
+        if not agent.start(data["job"], data.get('providers', ['aws', 'azure', 'gcp']),
+                           int(data.get('num_runs', 3)), data.get('protocol')):
+            return jsonify({"status": "error", "message": "A job is already running"}), 409
+        return jsonify({"status": "started", "job": data["job"], "vantage": agent.name})
+
+    @app.route('/status')
+    def status():
+        with agent.lock:
+            return jsonify({"vantage": agent.name, "jobs": dict(agent.jobs)})
+
+    return app
+
+def serve_agent(agent, host="127.0.0.1", port=0, advertise_host=None):
+    """
+    Serve an agent's API, register it with the collector and block until interrupted.
+
+    Args:
+        agent: Agent to serve
+        host: Address to listen on
+        port: Port to listen on (0 picks a free one)
+        advertise_host: Address the collector should reach the agent at (default: host)
+    """
+    server = make_server(host, port, create_agent_app(agent), threaded=True)
+    url = f"http://{advertise_host or host}:{server.port}"
+    agent.register(url)
+    print(f"Agent {agent.name} listening on {url}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,195 @@
+import warnings
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom (normal beyond)
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+CI_STATISTICS = ("mean", "p95")
+BOOTSTRAP_RESAMPLES = 2000
+
+def _probed_hops(run):
+    """Hops of a run that stand for a probe (not the placeholder of a failed trace)"""
+    return [hop for hop in run["data"]["hops"] if not hop["status"].startswith("error")]
+
+def hop_matrix(runs):
+    """
+    Align the hops of several runs of one endpoint by TTL.
+
+    Shared prefix hops (see tracer.discover_common_prefix) are one
+    measurement copied into every run, so each is kept only in the first run
+    that carries it; the later runs have no probe at those TTLs.
+
+    Args:
+        runs: List of result dictionaries from process_endpoint, in run order
+
+    Returns:
+        (ttls, rtts, attempts, ip_codes, ips, shared) where ttls is the sorted
+        array of probed TTLs, rtts a (runs x ttls) matrix of reply RTTs (NaN
+        where the TTL did not answer), attempts the number of probes sent per
+        cell, ip_codes the index into ips of the address that answered (-1
+        where silent) and shared flags the TTLs taken from a shared prefix
+    """
+    seen = set()
+    hops = []
+    for i, run in enumerate(runs):
+        for hop in _probed_hops(run):
+            if hop.get("shared_prefix"):
+                key = (hop["ttl"], hop["ip"], hop["rtt"], hop["status"])
+                if key in seen:
+                    continue
+                seen.add(key)
+            hops.append((i, hop))
+    run_idx = np.array([i for i, _ in hops], dtype=np.intp)
+    ttl = np.array([hop["ttl"] for _, hop in hops], dtype=np.intp)
+    ttls, ttl_idx = np.unique(ttl, return_inverse=True)
+
+    shape = (len(runs), len(ttls))
+    attempts = np.zeros(shape, dtype=np.intp)
+    np.add.at(attempts, (run_idx, ttl_idx), 1)
+
+    answered = np.array([hop["status"] == "success" for _, hop in hops], dtype=bool)
+    rtts = np.full(shape, np.nan)
+    replies = [hop for _, hop in hops if hop["status"] == "success"]
+    rtts[run_idx[answered], ttl_idx[answered]] = [hop["rtt"] for hop in replies]
+
+    ips, codes = np.unique(np.array([hop["ip"] for hop in replies], dtype=str), return_inverse=True)
+    ip_codes = np.full(shape, -1, dtype=np.intp)
+    ip_codes[run_idx[answered], ttl_idx[answered]] = codes
+
+    prefix = np.array([bool(hop.get("shared_prefix")) for _, hop in hops], dtype=bool)
+    shared = np.zeros(len(ttls), dtype=bool)
+    shared[ttl_idx[prefix]] = True
+    return ttls, rtts, attempts, ip_codes, ips, shared
+
+def _rtt_stats(rtts):
+    """Column-wise RTT statistics of a (samples x columns) matrix, ignoring NaNs."""
+    with warnings.catch_warnings():
+        # All-NaN columns (hops that never answered) come out as NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        percentiles = np.nanpercentile(rtts, PERCENTILES, axis=0)
+        stats = {f"rtt_p{p}": row for p, row in zip(PERCENTILES, percentiles)}
+        stats["rtt_mean"] = np.nanmean(rtts, axis=0)
+        stats["rtt_std"] = np.nanstd(rtts, axis=0)
+        stats["rtt_min"] = np.nanmin(rtts, axis=0)
+        stats["rtt_max"] = np.nanmax(rtts, axis=0)
+        # Mean RTT change between consecutive samples (RFC 3550-style jitter)
+        stats["jitter"] = np.nanmean(np.abs(np.diff(rtts, axis=0)), axis=0)
+    stats["samples"] = np.count_nonzero(~np.isnan(rtts), axis=0)
+    return stats
+
+def _plain(value):
+    """numpy scalar to a JSON-ready Python value (NaN becomes None)."""
+    value = value.item()
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+def hop_statistics(runs):
+    """
+    Per-hop and end-to-end RTT distribution, loss and route flaps across runs.
+
+    Every statistic is computed column-wise over the (runs x ttl) matrix from
+    hop_matrix, so the cost grows with the number of hops but the work per
+    hop stays in NumPy.
+
+    Args:
+        runs: List of result dictionaries from process_endpoint, in run order,
+            including runs that failed (they count towards end-to-end loss)
+
+    Returns:
+        Dictionary with "hop_stats" (one entry per TTL: primary IP, IP counts,
+        loss %, route flaps and RTT p50/p95/p99/mean/std/min/max/jitter in ms;
+        "shared_prefix" where the TTL was probed once for all runs, so its
+        statistics cover those probes only),
+        "end_to_end" (the same RTT statistics for the destination hop plus the %
+        of runs that did not reach it) and "route_flaps" (TTLs answered by more
+        than one address)
+    """
+    if not any(_probed_hops(run) for run in runs):
+        return {"hop_stats": [], "end_to_end": {}, "route_flaps": []}
+    ttls, rtts, attempts, ip_codes, ips, shared = hop_matrix(runs)
+    stats = _rtt_stats(rtts)
+
+    probes = attempts.sum(axis=0)
+    replies = stats["samples"]
+    loss = np.divide(probes - replies, probes, out=np.zeros(len(ttls)), where=probes > 0) * 100
+
+    # Address changes at a TTL between consecutive runs that both got an answer
+    both = (ip_codes[1:] >= 0) & (ip_codes[:-1] >= 0)
+    flaps = np.count_nonzero(both & (ip_codes[1:] != ip_codes[:-1]), axis=0)
+
+    # Replies per (ttl, address), most frequent address first
+    col, code = np.nonzero(ip_codes.T >= 0)
+    pairs, counts = np.unique(np.stack([col, ip_codes.T[col, code]]), axis=1, return_counts=True)
+    order = np.lexsort((-counts, pairs[0]))
+    ip_counts = [{} for _ in ttls]
+    for column, ip_code, count in zip(pairs[0][order], pairs[1][order], counts[order]):
+        ip_counts[column][str(ips[ip_code])] = int(count)
+
+    hop_stats = []
+    for column, ttl in enumerate(ttls):
+        entry = {"ttl": int(ttl), "ip": next(iter(ip_counts[column]), None),
+                 "ips": ip_counts[column], "loss": float(loss[column]), "flaps": int(flaps[column])}
+        entry.update({name: _plain(values[column]) for name, values in stats.items()})
+        if shared[column]:
+            entry["shared_prefix"] = True
+        hop_stats.append(entry)
+
+    # End to end: the last answering hop of every run that reached its destination
+    reached = np.array([run["data"].get("stop_reason") == "destination_reached" for run in runs])
+    answered = ~np.isnan(rtts)
+    last = rtts.shape[1] - 1 - np.argmax(answered[:, ::-1], axis=1)
+    final_rtts = np.where(reached & answered.any(axis=1), rtts[np.arange(len(runs)), last], np.nan)
+    end_to_end = {name: _plain(values[0])
+                  for name, values in _rtt_stats(final_rtts[:, None]).items()}
+    end_to_end["loss"] = float(np.count_nonzero(np.isnan(final_rtts)) / len(runs) * 100)
+
+    return {
+        "hop_stats": hop_stats,
+        "end_to_end": end_to_end,
+        "route_flaps": [int(ttl) for ttl, counts in zip(ttls, ip_counts) if len(counts) > 1]
+    }
+
+def confidence_interval(values, statistic="mean", resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    """
+    95% confidence interval of the mean or the 95th percentile of a sample.
+
+    The mean uses the Student t interval; p95 has no closed form, so its
+    interval comes from a (vectorized, seeded) percentile bootstrap.
+
+    Args:
+        values: Sample, e.g. the avg_rtt_ms of each run
+        statistic: "mean" or "p95"
+        resamples: Bootstrap resamples for p95
+        seed: Bootstrap seed, so the same sample always gets the same interval
+
+    Returns:
+        Dictionary with the statistic, sample count, estimate, low, high,
+        half_width and relative_half_width (half width / estimate, None for a
+        zero estimate), or None with fewer than two values
+    """
+    if statistic not in CI_STATISTICS:
+        raise ValueError(f"Unknown statistic: {statistic}")
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n < 2:
+        return None
+    if statistic == "mean":
+        estimate = values.mean()
+        t = T_95[n - 2] if n - 1 <= len(T_95) else 1.96
+        half_width = t * values.std(ddof=1) / np.sqrt(n)
+        low, high = estimate - half_width, estimate + half_width
+    else:
+        estimate = np.percentile(values, 95)
+        samples = np.random.default_rng(seed).choice(values, size=(resamples, n))
+        low, high = np.percentile(np.percentile(samples, 95, axis=1), [2.5, 97.5])
+        half_width = (high - low) / 2
+    return {
+        "statistic": statistic,
+        "samples": n,
+        "estimate": float(estimate),
+        "low": float(low),
+        "high": float(high),
+        "half_width": float(half_width),
+        "relative_half_width": float(half_width / abs(estimate)) if estimate else None
+    }
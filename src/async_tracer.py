@@ -0,0 +1,184 @@
+from socket import *
+import asyncio
+import struct
+import time
+from src.constants import MAX_HOPS, TIMEOUT, TRIES, PIPELINE_WINDOW
+from src.resolver import default_resolver
+from src.hop import Hop
+from src.tracer import (
+    PacketBuilder, parse_reply, assemble_hops, allocate_probe_id, enable_rx_timestamps,
+    rx_timestamp, probe_rtt, Route
+)
+
+class AsyncTracer:
+    """
+    Traceroute engine that runs many traces concurrently on one event loop.
+
+    A single raw ICMP socket is registered with the loop; every trace gets
+    its own ICMP id, and replies are routed to the waiting probe by
+    (id, sequence) as soon as the socket becomes readable.
+    """
+
+    def __init__(self, sock=None):
+        """
+        Args:
+            sock: Socket to probe through once opened (default: a new raw ICMP socket)
+        """
+        self.loop = None
+        self.sock = None
+        self.given_sock = sock
+        self.waiters = {}  # (packet_id, seq) -> future resolved with (ip, rx_kernel_ns, rx_perf_ns)
+
+    def open(self):
+        """Create the shared socket and register it with the running loop."""
+        self.loop = asyncio.get_running_loop()
+        if self.given_sock is not None:
+            self.sock = self.given_sock
+        else:
+            self.sock = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        # Kernel receive stamps keep RTTs honest while the loop is busy with other traces
+        enable_rx_timestamps(self.sock)
+        self.loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def close(self):
+        if self.sock:
+            self.loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        for future in self.waiters.values():
+            if not future.done():
+                future.cancel()
+        self.waiters.clear()
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _on_readable(self):
+        """Drain the socket and wake up the probes the replies belong to."""
+        while True:
+            try:
+                recvPacket, ancdata, _, addr = self.sock.recvmsg(1024, 256)
+            except (BlockingIOError, InterruptedError):
+                return
+            rx_perf_ns = time.perf_counter_ns()
+            reply = parse_reply(recvPacket)
+            if reply is None:
+                continue
+            future = self.waiters.pop((reply[1], reply[2]), None)
+            if future is not None and not future.done():
+                future.set_result((addr[0], rx_timestamp(ancdata), rx_perf_ns))
+
+    async def trace(self, hostname, window=PIPELINE_WINDOW):
+        """
+        Trace the route to a host without blocking the event loop.
+
+        Args:
+            hostname: Host name or IP address to trace
+            window: Number of TTLs in flight per burst
+
+        Returns:
+            tracer.Route of Hops with its stop_reason ("destination_reached",
+            "max_hops", "dns_error" or "permission_error"), as from tracer.get_route
+        """
+        hops = Route()
+        try:
+            dest_ip = await self.loop.run_in_executor(None, default_resolver.resolve, hostname)
+        except Exception as e:
+            print(f"Error resolving hostname {hostname}: {e}")
+            hops.stop_reason = "dns_error"
+            return hops
+
+        if self.sock is None:
+            hops.append(Hop(1, status="error: Insufficient permissions. Run as root/administrator."))
+            hops.stop_reason = "permission_error"
+            return hops
+
+        # Each trace gets its own ICMP id so concurrent traces never share a sequence space
+        my_id = allocate_probe_id()
+        builder = PacketBuilder(my_id)
+        dest_ttl = None
+        first_ttl = 1
+        while first_ttl <= MAX_HOPS and dest_ttl is None:
+            last_ttl = min(first_ttl + window - 1, MAX_HOPS)
+            replies = {}  # ttl -> (ip, rtt, attempt, clock)
+            failures = {ttl: [] for ttl in range(first_ttl, last_ttl + 1)}
+            errored = set()
+
+            for attempt in range(TRIES):
+                pending = {}  # future -> (seq, ttl, send_stamp)
+                for ttl in range(first_ttl, last_ttl + 1):
+                    if ttl in replies or ttl in errored:
+                        continue
+                    if dest_ttl is not None and ttl > dest_ttl:
+                        continue
+                    seq = attempt * MAX_HOPS + ttl
+                    future = self.loop.create_future()
+                    send_stamp = (time.time_ns(), time.perf_counter_ns())
+                    try:
+                        # Safe on a shared socket: nothing else runs between these two calls
+                        self.sock.setsockopt(IPPROTO_IP, IP_TTL, struct.pack('I', ttl))
+                        self.sock.sendto(builder.build(seq), (dest_ip, 0))
+                    except Exception as e:
+                        failures[ttl].append((attempt + 1, f"error: {str(e)}"))
+                        errored.add(ttl)
+                        continue
+                    self.waiters[(my_id, seq)] = future
+                    pending[future] = (seq, ttl, send_stamp)
+
+                deadline = self.loop.time() + TIMEOUT
+                while pending:
+                    remaining = deadline - self.loop.time()
+                    if remaining <= 0:
+                        break
+                    done, _ = await asyncio.wait(pending, timeout=remaining,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for future in done:
+                        seq, ttl, send_stamp = pending.pop(future)
+                        if future.cancelled():
+                            continue
+                        ip, rx_kernel_ns, rx_perf_ns = future.result()
+                        rtt, clock = probe_rtt(send_stamp, rx_kernel_ns, rx_perf_ns)
+                        replies[ttl] = (ip, rtt, attempt + 1, clock)
+                        if ip == dest_ip and (dest_ttl is None or ttl < dest_ttl):
+                            dest_ttl = ttl
+                    if dest_ttl is not None:
+                        for future, (seq, ttl, _) in list(pending.items()):
+                            if ttl > dest_ttl:
+                                self._forget(my_id, seq, future)
+                                del pending[future]
+
+                for future, (seq, ttl, _) in pending.items():
+                    self._forget(my_id, seq, future)
+                    failures[ttl].append((attempt + 1, "timeout"))
+                if not pending:
+                    break
+
+            hops.extend(assemble_hops(first_ttl, last_ttl, dest_ttl, failures, replies))
+            first_ttl = last_ttl + 1
+
+        hops.stop_reason = "destination_reached" if dest_ttl is not None else "max_hops"
+        print(f"Completed async route trace to {hostname}, collected {len(hops)} hops")
+        return hops
+
+    def _forget(self, my_id, seq, future):
+        self.waiters.pop((my_id, seq), None)
+        future.cancel()
+
+async def async_get_route(hostname, window=PIPELINE_WINDOW):
+    """Trace a single route on the current event loop with a private engine."""
+    tracer = AsyncTracer()
+    try:
+        tracer.open()
+    except PermissionError:
+        print("ERROR: Insufficient permissions to create raw socket. Run as administrator/root.")
+    try:
+        return await tracer.trace(hostname, window)
+    finally:
+        tracer.close()
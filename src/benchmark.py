@@ -1,44 +1,48 @@
-from src.tracer import get_route
+from src.tracer import get_route, SharedPrefixCache
+from src.async_tracer import AsyncTracer
 from src.geo import GeoLocator
+from src.hop import Hop
+from src.aggregate import hop_statistics, confidence_interval
+from src.progress import progress_bus
+from src.cancel import CancelToken
+from src.constants import (
+    ASYNC_CONCURRENCY, SHARE_PATH_PREFIX, BENCHMARK_WORKERS, ADAPTIVE_MAX_RUNS
+)
+import asyncio
 import concurrent.futures
+import queue
+import threading
 import time
-import json
 
-def process_endpoint(name, host, geolocator):
+def process_endpoint(name, host, geolocator, **trace_options):
     """Process a single endpoint in parallel"""
     start_time = time.time()
     
     print(f"Processing endpoint: {name} ({host})")
     
     # Get route for this endpoint
-    hops = get_route(host)
+    hops = get_route(host, **trace_options)
+    return process_route(name, host, hops, geolocator, start_time)
+
+def process_route(name, host, hops, geolocator, start_time):
+    """Turn the raw hops of one trace into a result entry (geolocation and metrics)"""
+    stop_reason = getattr(hops, "stop_reason", None)
     
     # Check if we got any hops
     if not hops:
         print(f"Warning: No hops returned for {host}, using fallback dummy hop")
         # Create a fallback hop for visualization
-        hops = [{
-            "ttl": 1,
-            "ip": "127.0.0.1",
-            "rtt": 1.0,
-            "status": "error: No route data available. May need elevated permissions.",
-            "attempt": 1,
-            "fallback": True
-        }]
+        hops = [Hop(1, "127.0.0.1", 1.0, "error: No route data available. May need elevated permissions.",
+                    fallback=True)]
     
     # Check for permission errors and generate fallback data if needed
     permission_errors = [h for h in hops if h.get("status", "").startswith("error: Insufficient permissions")]
     if permission_errors:
         print(f"Permission error detected for {host}, using fallback data")
         # Create fallback data for visualization
-        hops = [{
-            "ttl": 1,
-            "ip": "127.0.0.1",
-            "rtt": 1.0,
-            "status": "error: Insufficient permissions to create raw socket. Run as administrator/root.",
-            "attempt": 1,
-            "fallback": True
-        }]
+        hops = [Hop(1, "127.0.0.1", 1.0,
+                    "error: Insufficient permissions to create raw socket. Run as administrator/root.",
+                    fallback=True)]
     
     # Add geolocation data to hops
     hops = geolocator.geolocate_hops(hops)
@@ -84,122 +88,451 @@ def process_endpoint(name, host, geolocator):
             "countries_traversed": len(hop_countries),
             "hops": hops,  # Store raw hop data for visualization
             "benchmark_duration": duration,  # Store the processing time
-            "has_permission_error": bool(permission_errors)
+            "has_permission_error": bool(permission_errors),
+            "stop_reason": stop_reason,  # Why the trace ended (see tracer.get_route)
+            "truncated": stop_reason in ("cancelled", "deadline")  # Trace cut short
         }
     }
 
-def run_benchmark(endpoints, num_runs=3):
+def result_keys(endpoints):
+    """
+    Key of each endpoint's entry in a results dictionary.
+
+    Results are keyed by host; providers that share a host (aliases, or the
+    --all-addresses expansion of overlapping names) get "host (name)" so
+    their entries do not overwrite each other.
+
+    Args:
+        endpoints: Dictionary of provider name to hostname
+
+    Returns:
+        Dictionary of provider name to result key
+    """
+    names_per_host = {}
+    for name, host in endpoints.items():
+        names_per_host.setdefault(host, []).append(name)
+    return {name: host if len(names_per_host[host]) == 1 else f"{host} ({name})"
+            for name, host in endpoints.items()}
+
+def run_benchmark(endpoints, num_runs=3, **options):
     """
     Run benchmark for all endpoints with support for multiple runs per provider.
     
     Args:
         endpoints: Dictionary of provider name to hostname
         num_runs: Number of runs per provider to average results (default: 3)
+        **options: Tracing and scheduling options (see iter_benchmark)
     
     Returns:
         Dictionary of results
     """
-    geolocator = GeoLocator()
     results = {}
-    aggregated_results = {}
+    for event in iter_benchmark(endpoints, num_runs, **options):
+        if event["type"] == "endpoint":
+            results[event["key"]] = event["result"]
+    # Endpoint order, whatever order they finished in
+    return {key: results[key] for key in result_keys(endpoints).values() if key in results}
+
+def iter_benchmark(endpoints, num_runs=3, pipelined=False, protocol=None, probe_options=None,
+                   share_prefix=SHARE_PATH_PREFIX, backend=None, geolocator=None, parallel=False,
+                   max_workers=BENCHMARK_WORKERS, serialize_per_host=True, target_ci=None,
+                   ci_statistic="mean", max_runs=ADAPTIVE_MAX_RUNS, time_budget=None, cancel=None,
+                   time_limit=None, trace_timeout=None):
+    """
+    Run the benchmark, yielding results as soon as they are available.
+    
+    Each endpoint's runs are kept only until the endpoint is aggregated, so
+    consumers that handle events as they arrive hold one endpoint's hops at
+    a time (per worker when parallel).
+    
+    Args:
+        endpoints: Dictionary of provider name to hostname
+        num_runs: Number of runs per provider to average results (default: 3)
+        pipelined: Probe all TTLs of a route at once instead of hop by hop
+        protocol: Probe protocol for every endpoint ("icmp", "tcp" or "udp"); overrides
+            the per-endpoint setting
+        probe_options: Dictionary of provider name to {"protocol": ..., "port": ...}
+            (see endpoints.get_probe_options)
+        share_prefix: Probe the hops common to all endpoints once and reuse them,
+            starting each trace at the first TTL where the paths diverge
+        backend: Probe backend (default: raw sockets; see tracer.get_route)
+        geolocator: GeoLocator to use (default: a new one)
+        parallel: Trace endpoints concurrently on a thread pool instead of one at a time
+        max_workers: Maximum number of traces in flight when parallel
+        serialize_per_host: When parallel, still run the traces to any one host one
+            after the other (also across providers sharing it), so runs to the same
+            destination never overlap
+        target_ci: Sample adaptively: after num_runs runs, keep running an endpoint until
+            the 95% confidence interval of ci_statistic is within +/- target_ci (a
+            fraction, e.g. 0.05) of the estimate, max_runs runs were made or its runs
+            took time_budget seconds. None runs every endpoint exactly num_runs times
+        ci_statistic: "mean" or "p95" of the per-run avg RTT (see aggregate.confidence_interval)
+        max_runs: Most runs per endpoint when sampling adaptively
+        time_budget: Most seconds of runs per endpoint when sampling adaptively (None: no limit)
+        cancel: src.cancel.CancelToken; cancelling it aborts the traces in flight and
+            starts no more runs
+        time_limit: Seconds the whole benchmark may take (None: no limit); like cancel
+            once it has passed
+        trace_timeout: Seconds a single trace may take (None: no limit)
     
-    # Track overall progress
+    Yields:
+        {"type": "run", "name", "host", "run", "result"} after every run (result is
+        the process_endpoint entry, None if the run raised), then
+        {"type": "endpoint", "name", "host", "key", "result"} with the run_benchmark
+        entry for a provider (stored under "key", see result_keys) once all of its runs
+        are done; its "rtt_ci" holds the interval
+        achieved and "runs_used" the number of successful runs behind it. When the
+        benchmark is cancelled or out of time, every endpoint with at least one run
+        still gets its endpoint event; "truncated" is True in entries missing runs
+        or holding a trace that was cut short
+    """
+    token = CancelToken(time_limit, parent=cancel)
+    adaptive = target_ci is not None
+    if adaptive:
+        max_runs = max(max_runs, num_runs)
+        # Runs of one endpoint have to be in order to decide when to stop
+        serialize_per_host = True
+    else:
+        max_runs = num_runs
+    geolocator = geolocator or GeoLocator()
+    keys = result_keys(endpoints)
+    # Only worth it when there is more than one destination to share the prefix with
+    prefix_cache = None
+    if share_prefix and len(endpoints) > 1:
+        prefix_cache = SharedPrefixCache(backend=backend)
+    endpoint_runs = {name: {} for name in endpoints}  # name -> {run: result}, until aggregated
+    # Runs each endpoint gets; decided as it goes when sampling adaptively
+    expected_runs = {name: None if adaptive else num_runs for name in endpoints}
+    
+    # Track overall progress (adaptive sampling: the total shrinks as endpoints stop early)
     total_endpoints = len(endpoints)
-    total_runs = total_endpoints * num_runs
+    total_runs = total_endpoints * max_runs
     completed = 0
+    active = []  # "name (run i/n)" of the traces in flight
+    progress_lock = threading.Lock()
     
     start_time = time.time()
     
     # Initialize progress
-    with open('data/benchmark_progress.json', 'w') as f:
-        json.dump({
-            "progress": 10,  # Start at 10% (initialization complete)
-            "completed": 0,
-            "total": total_runs,
-            "current_provider": "Starting trace routes...",
-            "status": "running",
-            "start_time": start_time
-        }, f)
-        
-    # Process each endpoint sequentially for more consistency
-    for name, host in endpoints.items():
-        print(f"Processing {name} ({host}), running {num_runs} times...")
-        # Store runs for this endpoint
-        endpoint_runs = []
-        
-        for run in range(num_runs):
-            try:
-                print(f"Run {run+1}/{num_runs} for {name}")
-                # Update progress file for this run
-                with open('data/benchmark_progress.json', 'w') as f:
-                    json.dump({
-                        "progress": 10 + (completed / total_runs) * 80,
-                        "completed": completed,
-                        "total": total_runs,
-                        "current_provider": f"{name} (run {run+1}/{num_runs})",
-                        "status": "running",
-                        "start_time": start_time
-                    }, f)
-                
-                # Process this endpoint
-                result = process_endpoint(name, host, geolocator)
-                endpoint_runs.append(result)
-                
-                # Update progress
-                completed += 1
-                
-            except Exception as exc:
-                print(f'Endpoint {name} (run {run+1}) generated an exception: {exc}')
-                # Still count as completed
+    _write_progress(10, 0, total_runs, "Starting trace routes...", start_time)
+
+    def report():
+        # Caller holds progress_lock
+        _write_progress(10 + (completed / total_runs) * 80, completed, total_runs,
+                        ", ".join(active) or "Waiting for traces...", start_time)
+
+    def run_once(name, host, run):
+        nonlocal completed
+        if token.reason:
+            return  # Cancelled or out of time before this run started
+        label = f"{name} (run {run+1}/{max_runs})"
+        result = None
+        try:
+            print(f"Run {run+1}/{max_runs} for {name}")
+            # Update progress file for this run
+            with progress_lock:
+                active.append(label)
+                report()
+            
+            # Process this endpoint
+            prefix_hops = prefix_cache.get(endpoints.values(), token) if prefix_cache else None
+            result = process_endpoint(
+                name, host, geolocator, pipelined=pipelined, prefix_hops=prefix_hops,
+                backend=backend, cancel=token, trace_timeout=trace_timeout,
+                **_probe_settings(name, protocol, probe_options))
+        except Exception as exc:
+            print(f'Endpoint {name} (run {run+1}) generated an exception: {exc}')
+        finally:
+            # Failed runs still count as completed
+            with progress_lock:
+                active.remove(label)
                 completed += 1
+                report()
+                endpoint_runs[name][run] = result
+                finished = len(endpoint_runs[name]) == expected_runs[name]
+        yield {"type": "run", "name": name, "host": host, "run": run, "result": result}
+        if finished:
+            yield finish(name, host)
+
+    def finish(name, host, sampling_stop=None, truncated=False):
+        runs = endpoint_runs.pop(name)
+        result = _aggregate_endpoint(name, [runs[r] for r in sorted(runs)], ci_statistic)
+        result["truncated"] = truncated or result["truncated"]
+        if adaptive and result.get("rtt_ci") is not None:
+            result["rtt_ci"].update(target=target_ci, sampling_stop=sampling_stop)
+        return {"type": "endpoint", "name": name, "host": host, "key": keys[name],
+                "result": result}
+
+    def run_endpoint(name, host):
+        if not adaptive:
+            print(f"Processing {name} ({host}), running {num_runs} times...")
+            for run in range(num_runs):
+                if token.reason:
+                    break
+                yield from run_once(name, host, run)
+            return
         
-        # Aggregate multiple runs for this endpoint if we have successful runs
-        successful_runs = [r for r in endpoint_runs if r and "data" in r and r["data"].get("hop_count", 0) > 0]
-        
-        if successful_runs:
-            # Average the metrics from all successful runs
-            host_data = aggregate_runs(successful_runs)
-            results[host] = host_data
-            print(f"Successfully aggregated {len(successful_runs)} runs for {name}")
+        nonlocal total_runs
+        print(f"Processing {name} ({host}), running until the RTT interval is within "
+              f"+/-{target_ci:.0%} (at most {max_runs} runs)...")
+        endpoint_start = time.time()
+        run = 0
+        sampling_stop = None
+        while sampling_stop is None:
+            yield from run_once(name, host, run)
+            run += 1
+            sampling_stop = token.reason or _sampling_stop(
+                endpoint_runs[name].values(), run, num_runs, max_runs, target_ci, ci_statistic,
+                time_budget, time.time() - endpoint_start)
+        if not endpoint_runs[name]:
+            return  # Stopped before its first run
+        print(f"Stopped sampling {name} after {run} runs: {sampling_stop}")
+        with progress_lock:
+            total_runs -= max_runs - run
+            report()
+        yield finish(name, host, sampling_stop, truncated=sampling_stop == token.reason)
+
+    def run_host(host, names):
+        for name in names:
+            yield from run_endpoint(name, host)
+
+    if not parallel:
+        # Process each endpoint sequentially for more consistency
+        for name, host in endpoints.items():
+            yield from run_endpoint(name, host)
+    else:
+        if serialize_per_host:
+            # One task per destination: providers sharing a host take turns
+            names_per_host = {}
+            for name, host in endpoints.items():
+                names_per_host.setdefault(host, []).append(name)
+            tasks = [(run_host, host, names) for host, names in names_per_host.items()]
         else:
-            # If all runs failed, create an error entry
-            print(f"All runs for {name} failed, creating error entry")
-            results[host] = {
-                "status": "error",
-                "error": "All benchmark runs failed",
-                "hop_count": 0,
-                "avg_rtt_ms": 0,
-                "max_rtt_ms": 0,
-                "min_rtt_ms": 0,
-                "success_rate": 0,
-                "packet_loss": 100,
-                "countries_traversed": 0,
-                "hops": []
-            }
+            tasks = [(run_once, name, host, run)
+                     for name, host in endpoints.items() for run in range(num_runs)]
+        try:
+            yield from _iter_parallel(tasks, max_workers)
+        except GeneratorExit:
+            # The consumer stopped early: a host's remaining runs must not go on in the background
+            token.cancel()
+            raise
+    
+    # Endpoints whose runs were cut short by cancellation or the time limit
+    for name in [name for name, runs in endpoint_runs.items() if runs]:
+        print(f"Benchmark {token.reason}: {name} has only {len(endpoint_runs[name])} runs")
+        yield finish(name, endpoints[name], truncated=True)
     
     # Add total benchmark time
     benchmark_time = time.time() - start_time
     
     # Store final progress (90% - leave final 10% for post-processing)
-    with open('data/benchmark_progress.json', 'w') as f:
-        json.dump({
-            "progress": 90,
-            "completed": total_runs,
-            "total": total_runs,
-            "current_provider": "Processing results...",
-            "status": "running",
-            "start_time": start_time,
-            "benchmark_time": benchmark_time
-        }, f)
-    
-    return results
-
-def aggregate_runs(runs):
+    if token.reason:
+        _write_progress(90, completed, total_runs, f"Stopped early ({token.reason})", start_time,
+                        benchmark_time=benchmark_time)
+    else:
+        _write_progress(90, total_runs, total_runs, "Processing results...", start_time,
+                        benchmark_time=benchmark_time)
+
+def _sampling_stop(runs, run_count, min_runs, max_runs, target_ci, ci_statistic, time_budget,
+                   elapsed):
+    """Why adaptive sampling of an endpoint should stop after run_count runs, or None to go on"""
+    if run_count < min_runs:
+        return None
+    ci = confidence_interval(_run_rtts(runs), ci_statistic) or {}
+    if ci.get("relative_half_width") is not None and ci["relative_half_width"] <= target_ci:
+        return "converged"
+    if run_count >= max_runs:
+        return "max_runs"
+    if time_budget is not None and elapsed >= time_budget:
+        return "time_budget"
+    return None
+
+def _run_rtts(runs):
+    """avg_rtt_ms of the runs that produced hops (the sample the RTT interval is computed from)"""
+    return [r["data"]["avg_rtt_ms"] for r in runs
+            if r and "data" in r and r["data"].get("hop_count", 0) > 0]
+
+def _iter_parallel(tasks, max_workers):
+    """Run (generator function, *args) tasks on a thread pool, yielding their events as they come"""
+    events = queue.Queue()
+    task_done = object()
+
+    def drain(task, *args):
+        try:
+            for event in task(*args):
+                events.put(event)
+        finally:
+            events.put(task_done)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(drain, *task) for task in tasks]
+        remaining = len(futures)
+        while remaining:
+            event = events.get()
+            if event is task_done:
+                remaining -= 1
+            else:
+                yield event
+        for future in futures:
+            future.result()
+    finally:
+        # Stops queued tasks if the consumer gave up early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def async_run_benchmark(endpoints, num_runs=3, concurrency=ASYNC_CONCURRENCY, tracer=None):
+    """
+    Run benchmark for all endpoints with every trace in flight at once.
+    
+    Args:
+        endpoints: Dictionary of provider name to hostname
+        num_runs: Number of runs per provider to average results (default: 3)
+        concurrency: Maximum number of traces in flight
+        tracer: AsyncTracer to trace with, not yet opened (default: a new one)
+    
+    Returns:
+        Dictionary of results, in the same shape as run_benchmark
+    """
+    results = {}
+    async for event in aiter_benchmark(endpoints, num_runs, concurrency, tracer):
+        if event["type"] == "endpoint":
+            results[event["key"]] = event["result"]
+    return {key: results[key] for key in result_keys(endpoints).values() if key in results}
+
+async def aiter_benchmark(endpoints, num_runs=3, concurrency=ASYNC_CONCURRENCY, tracer=None):
+    """
+    Async counterpart of iter_benchmark, yielding the same events.
+    
+    All providers and all their runs are traced concurrently on one event
+    loop through a shared AsyncTracer; at most `concurrency` traces are in
+    flight at any time. Post-processing (geolocation) runs in worker threads.
+    The async engine probes with ICMP echo only.
+    
+    Args:
+        endpoints: Dictionary of provider name to hostname
+        num_runs: Number of runs per provider to average results (default: 3)
+        concurrency: Maximum number of traces in flight
+        tracer: AsyncTracer to trace with, not yet opened (default: a new one on a
+            raw ICMP socket)
+    
+    Yields:
+        "run" and "endpoint" event dictionaries (see iter_benchmark)
+    """
+    loop = asyncio.get_running_loop()
+    geolocator = GeoLocator()
+    semaphore = asyncio.Semaphore(concurrency)
+    endpoint_runs = {name: {} for name in endpoints}  # name -> {run: result}, until aggregated
+    keys = result_keys(endpoints)
+    
+    total_runs = len(endpoints) * num_runs
+    completed = 0
+    start_time = time.time()
+    _write_progress(10, 0, total_runs, "Starting trace routes...", start_time)
+    
+    async def traced_run(tracer, name, host, run):
+        nonlocal completed
+        try:
+            async with semaphore:
+                run_start = time.time()
+                hops = await tracer.trace(host)
+            return await loop.run_in_executor(None, process_route, name, host, hops,
+                                              geolocator, run_start)
+        except Exception as exc:
+            print(f'Endpoint {name} (run {run+1}) generated an exception: {exc}')
+            return None
+        finally:
+            completed += 1
+            _write_progress(10 + (completed / total_runs) * 80, completed, total_runs,
+                            f"{name} (run {run+1}/{num_runs})", start_time)
+    
+    async def tagged_run(tracer, name, host, run):
+        return name, host, run, await traced_run(tracer, name, host, run)
+    
+    tracer = tracer or AsyncTracer()
+    try:
+        tracer.open()
+    except PermissionError:
+        print("ERROR: Insufficient permissions to create raw socket. Run as administrator/root.")
+    tasks = [asyncio.ensure_future(tagged_run(tracer, name, host, run))
+             for name, host in endpoints.items() for run in range(num_runs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            name, host, run, result = await next_done
+            yield {"type": "run", "name": name, "host": host, "run": run, "result": result}
+            runs = endpoint_runs[name]
+            runs[run] = result
+            if len(runs) == num_runs:
+                del endpoint_runs[name]
+                yield {"type": "endpoint", "name": name, "host": host, "key": keys[name],
+                       "result": _aggregate_endpoint(name, [runs[r] for r in sorted(runs)])}
+    finally:
+        for task in tasks:
+            task.cancel()
+        tracer.close()
+    
+    benchmark_time = time.time() - start_time
+    _write_progress(90, total_runs, total_runs, "Processing results...", start_time,
+                    benchmark_time=benchmark_time)
+
+def _probe_settings(name, protocol, probe_options):
+    """Protocol/port to trace an endpoint with: the benchmark-wide protocol wins over its config"""
+    settings = dict((probe_options or {}).get(name, {}))
+    if protocol:
+        settings = {"protocol": protocol}
+    return settings
+
+def _write_progress(progress, completed, total, current_provider, start_time, **extra):
+    """Publish benchmark progress to the progress bus (streamed to the web UI)"""
+    progress_bus.publish({
+        "progress": progress,
+        "completed": completed,
+        "total": total,
+        "current_provider": current_provider,
+        "status": "running",
+        "start_time": start_time,
+        **extra
+    })
+
+def _aggregate_endpoint(name, endpoint_runs, ci_statistic="mean"):
+    """Aggregate the runs of one endpoint, or build an error entry if all of them failed"""
+    # Aggregate multiple runs for this endpoint if we have successful runs
+    completed_runs = [r for r in endpoint_runs if r and "data" in r]
+    successful_runs = [r for r in completed_runs if r["data"].get("hop_count", 0) > 0]
+    
+    if successful_runs:
+        # Average the metrics from all successful runs
+        print(f"Successfully aggregated {len(successful_runs)} runs for {name}")
+        # Loss and reachability also count the runs that got no route at all
+        return aggregate_runs(successful_runs, ci_statistic, all_runs=completed_runs)
+    
+    # If all runs failed, create an error entry
+    print(f"All runs for {name} failed, creating error entry")
+    return {
+        "status": "error",
+        "error": "All benchmark runs failed",
+        "hop_count": 0,
+        "avg_rtt_ms": 0,
+        "max_rtt_ms": 0,
+        "min_rtt_ms": 0,
+        "success_rate": 0,
+        "packet_loss": 100,
+        "countries_traversed": 0,
+        "hops": [],
+        "runs_used": 0,
+        "rtt_ci": None,
+        "truncated": any(r["data"].get("truncated") for r in endpoint_runs if r and "data" in r)
+    }
+
+def aggregate_runs(runs, ci_statistic="mean", all_runs=None):
     """
     Aggregate multiple benchmark runs for the same endpoint.
     
     Args:
         runs: List of result dictionaries from process_endpoint
+        ci_statistic: Statistic of the per-run avg RTT to put a confidence interval
+            on ("mean" or "p95")
+        all_runs: Every completed run, failed ones included, for the per-hop and
+            end-to-end statistics (default: runs)
         
     Returns:
         Aggregated result dictionary
@@ -221,7 +554,9 @@ def aggregate_runs(runs):
         "countries_traversed": best_run["data"]["countries_traversed"],
         "countries_list": best_run["data"].get("countries_list", []),
         "benchmark_duration": sum(run["data"]["benchmark_duration"] for run in runs) / len(runs),
-        "has_permission_error": any(run["data"].get("has_permission_error", False) for run in runs)
+        "has_permission_error": any(run["data"].get("has_permission_error", False) for run in runs),
+        "stop_reason": best_run["data"].get("stop_reason"),
+        "truncated": any(run["data"].get("truncated", False) for run in runs)
     }
     
     # Average the numeric metrics
@@ -232,4 +567,11 @@ def aggregate_runs(runs):
     aggregated["success_rate"] = sum(run["data"]["success_rate"] for run in runs) / len(runs)
     aggregated["packet_loss"] = sum(run["data"]["packet_loss"] for run in runs) / len(runs)
     
+    # Per-hop distribution across all runs (percentiles, jitter, loss, route flaps)
+    aggregated.update(hop_statistics(all_runs if all_runs is not None else runs))
+    
+    # How precise avg_rtt_ms is (None with a single run)
+    aggregated["runs_used"] = len(runs)
+    aggregated["rtt_ci"] = confidence_interval(_run_rtts(runs), ci_statistic)
+    
     return aggregated
@@ -0,0 +1,140 @@
+import ipaddress
+import os
+import socket
+from bisect import bisect_right
+from pathlib import Path
+from src.constants import BOGON_LIST_PATH
+
+# IANA IPv4 and IPv6 special-purpose address registries (RFC 6890 and updates), plus the
+# multicast and reserved space, as (network, category). Blocks the registries mark
+# globally reachable (e.g. 64:ff9b::/96, 2002::/16) are left out: they geolocate.
+SPECIAL_PURPOSE_BLOCKS = [
+    ("0.0.0.0/8", "this-network"),
+    ("10.0.0.0/8", "private"),
+    ("100.64.0.0/10", "shared"),  # Carrier-grade NAT (RFC 6598)
+    ("127.0.0.0/8", "loopback"),
+    ("169.254.0.0/16", "link-local"),
+    ("172.16.0.0/12", "private"),
+    ("192.0.0.0/24", "ietf-protocol"),
+    ("192.0.2.0/24", "documentation"),
+    ("192.31.196.0/24", "as112"),
+    ("192.52.193.0/24", "amt"),
+    ("192.88.99.0/24", "deprecated-6to4-relay"),
+    ("192.168.0.0/16", "private"),
+    ("192.175.48.0/24", "as112"),
+    ("198.18.0.0/15", "benchmarking"),
+    ("198.51.100.0/24", "documentation"),
+    ("203.0.113.0/24", "documentation"),
+    ("224.0.0.0/4", "multicast"),
+    ("240.0.0.0/4", "reserved"),
+    ("255.255.255.255/32", "broadcast"),
+    ("::/128", "unspecified"),
+    ("::1/128", "loopback"),
+    ("64:ff9b:1::/48", "translation"),
+    ("100::/64", "discard"),
+    ("2001::/23", "ietf-protocol"),
+    ("2001:db8::/32", "documentation"),
+    ("3fff::/20", "documentation"),
+    ("5f00::/16", "srv6"),
+    ("fc00::/7", "unique-local"),
+    ("fe80::/10", "link-local"),
+    ("ff00::/8", "multicast"),
+]
+# Category of the ranges from a user-supplied bogon list
+USER_CATEGORY = "bogon"
+# IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) are classified by their IPv4 address
+MAPPED_IPV4 = (0xFFFF << 32, (0xFFFF << 32) | 0xFFFFFFFF)
+
+def load_bogon_list(path):
+    """Networks of a bogon list file: one CIDR per line, blank lines and "#" comments ignored"""
+    networks = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                networks.append(line)
+    return networks
+
+def _paint(intervals, start, end, category):
+    """Lay [start, end] over sorted disjoint intervals, replacing what it covers"""
+    painted = []
+    for first, last, existing in intervals:
+        if last < start or first > end:
+            painted.append((first, last, existing))
+            continue
+        if first < start:
+            painted.append((first, start - 1, existing))
+        if last > end:
+            painted.append((end + 1, last, existing))
+    painted.append((start, end, category))
+    painted.sort()
+    return painted
+
+class AddressClassifier:
+    """
+    Classifies addresses that belong to no one on the public internet (bogons).
+
+    The special-purpose blocks (and any extra ranges) are compiled once into
+    sorted, disjoint integer intervals per IP version, so classifying an
+    address is one parse and one bisection of a table of a few dozen
+    entries. Where ranges overlap the more specific one wins, so a user list
+    can refine a built-in category.
+    """
+
+    def __init__(self, extra=()):
+        """
+        Args:
+            extra: Further networks (CIDR strings) to classify as USER_CATEGORY
+        """
+        entries = [(ipaddress.ip_network(network), category)
+                   for network, category in SPECIAL_PURPOSE_BLOCKS]
+        entries += [(ipaddress.ip_network(network, strict=False), USER_CATEGORY)
+                    for network in extra]
+        self.tables = {}
+        for version in (4, 6):
+            intervals = []
+            # Shortest prefixes first, so more specific ranges are painted over them
+            for network, category in sorted((e for e in entries if e[0].version == version),
+                                            key=lambda e: e[0].prefixlen):
+                intervals = _paint(intervals, int(network.network_address),
+                                   int(network.broadcast_address), category)
+            self.tables[version] = ([first for first, _, _ in intervals],
+                                    [last for _, last, _ in intervals],
+                                    [category for _, _, category in intervals])
+
+    def classify(self, ip_address):
+        """
+        Category of a special-purpose or listed address ("private", "shared",
+        "loopback", "documentation", "multicast", USER_CATEGORY, ...), or None
+        for a globally routable (or unparseable) address.
+        """
+        try:
+            if ":" in ip_address:
+                version = 6
+                value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_address), "big")
+                if MAPPED_IPV4[0] <= value <= MAPPED_IPV4[1]:
+                    version, value = 4, value & 0xFFFFFFFF
+            else:
+                version = 4
+                value = int.from_bytes(socket.inet_pton(socket.AF_INET, ip_address), "big")
+        except (OSError, TypeError):
+            return None
+        starts, ends, categories = self.tables[version]
+        i = bisect_right(starts, value) - 1
+        if i < 0 or value > ends[i]:
+            return None
+        return categories[i]
+
+    def is_bogon(self, ip_address):
+        return self.classify(ip_address) is not None
+
+def open_classifier(path=None):
+    """A classifier with the bogon list at path (default: $BOGON_LIST or BOGON_LIST_PATH), if any"""
+    path = Path(path or os.getenv("BOGON_LIST", BOGON_LIST_PATH))
+    if not path.exists():
+        return AddressClassifier()
+    try:
+        return AddressClassifier(load_bogon_list(path))
+    except (OSError, ValueError) as e:
+        print(f"Could not load bogon list {path}: {e}")
+        return AddressClassifier()
@@ -0,0 +1,64 @@
+import threading
+import time
+from src.constants import CANCEL_POLL_INTERVAL
+
+class CancelToken:
+    """
+    Cancellation and deadline shared by everything working towards one result.
+
+    A token is cancelled explicitly (cancel()) or by running past its
+    deadline; a child token (child()) is also cancelled with its parent, so
+    a per-trace deadline can sit under a per-benchmark one and a single
+    cancel() reaches every trace. Traces poll the token between probe waits
+    (see tracer.get_route), so in-flight traces stop within
+    CANCEL_POLL_INTERVAL.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        """
+        Args:
+            timeout: Seconds from now until the token expires (None: no deadline)
+            parent: Token whose cancellation and deadline also apply to this one
+        """
+        self.parent = parent
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.event = threading.Event()
+
+    def child(self, timeout=None):
+        """A token cancelled with this one, or after timeout seconds."""
+        return CancelToken(timeout, self)
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def reason(self):
+        """None while live, else "cancelled" or "deadline" (whichever stopped it first)."""
+        if self.event.is_set():
+            return "cancelled"
+        if self.parent is not None:
+            reason = self.parent.reason
+            if reason:
+                return reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        return None
+
+    def remaining(self):
+        """Seconds until the nearest deadline of this token or its parents (None: no deadline)."""
+        remaining = None if self.deadline is None else self.deadline - time.monotonic()
+        if self.parent is not None:
+            inherited = self.parent.remaining()
+            if inherited is not None and (remaining is None or inherited < remaining):
+                remaining = inherited
+        return remaining
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds, waking early once the token stops; returns reason."""
+        end = time.monotonic() + timeout
+        while not self.reason:
+            left = end - time.monotonic()
+            if left <= 0:
+                break
+            self.event.wait(min(left, CANCEL_POLL_INTERVAL))
+        return self.reason
@@ -0,0 +1,39 @@
+from flask import Blueprint, jsonify, request
+from src.db import Database
+
+# Routes through which vantage-point agents register and push their results
+# (see agent.Agent); registered on the web app
+collector = Blueprint('collector', __name__, url_prefix='/collector')
+
+@collector.route('/agents', methods=['POST'])
+def register_agent():
+    data = request.json
+    if not data or not data.get('name') or not data.get('url'):
+        return jsonify({"status": "error", "message": "name and url are required"}), 400
+    Database().register_agent(data['name'], data['url'])
+    print(f"Registered agent {data['name']} at {data['url']}")
+    return jsonify({"status": "registered", "name": data['name']})
+
+@collector.route('/agents')
+def list_agents():
+    return jsonify(Database().get_agents())
+
+@collector.route('/results', methods=['POST'])
+def ingest_results():
+    """Store one batch of agent results (all of them in one transaction)"""
+    data = request.json
+    if not data or not data.get('job') or not data.get('vantage'):
+        return jsonify({"status": "error", "message": "job and vantage are required"}), 400
+    results = data.get('results', {})
+    try:
+        Database().save_vantage_results(data['job'], data['vantage'], results,
+                                        finished=data.get('finished', False),
+                                        error=data.get('error'))
+    except (KeyError, TypeError, AttributeError) as e:
+        return jsonify({"status": "error", "message": f"Malformed results: {e}"}), 400
+    return jsonify({"status": "stored", "count": len(results)})
+
+@collector.route('/jobs/<job>')
+def job_results(job):
+    """Results of a job per vantage point, and which vantage points have finished"""
+    return jsonify(Database().get_vantage_results(job))
@@ -1,7 +1,65 @@
 ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_TIME_EXCEEDED = 11
 MAX_HOPS = 30
 TIMEOUT = 2.0
 TRIES = 2
+# Size probe timeouts from the smoothed RTT of the path, never below MIN_TIMEOUT
+ADAPTIVE_TIMEOUT = True
+MIN_TIMEOUT = 0.5
+# Stop tracing after this many consecutive TTLs without an answer (0 disables)
+MAX_SILENT_HOPS = 5
+# Number of TTLs probed at once in pipelined mode (MAX_HOPS = whole path in one burst)
+PIPELINE_WINDOW = MAX_HOPS
+# Probe protocols: ICMP echo, TCP SYN (destination answers SYN-ACK/RST) or UDP
+# (destination answers port-unreachable) for endpoints that filter ICMP echo
+PROBE_PROTOCOLS = ("icmp", "tcp", "udp")
+DEFAULT_PROBE_PROTOCOL = "icmp"
+TCP_PROBE_PORT = 443
+UDP_BASE_PORT = 33434
+# Shared path prefix: the first hops common to every destination are probed once
+# (towards up to PREFIX_SAMPLE_HOSTS endpoints, at most PREFIX_MAX_TTL deep) and
+# reused for PREFIX_CACHE_TTL seconds
+SHARE_PATH_PREFIX = True
+PREFIX_MAX_TTL = 8
+PREFIX_SAMPLE_HOSTS = 3
+PREFIX_CACHE_TTL = 60
+# Benchmark progress is mirrored to this file (None to disable), at most once per interval
+PROGRESS_SNAPSHOT_FILE = 'data/benchmark_progress.json'
+PROGRESS_SNAPSHOT_INTERVAL = 1.0
+# Seconds between keep-alive comments on an idle /benchmark/events stream
+SSE_KEEPALIVE = 15
+# Monitoring mode: seconds between traces of an endpoint (unless configured per
+# endpoint), +/- this fraction of random jitter, and the probe budget for all traces
+MONITOR_INTERVAL = 300
+MONITOR_JITTER = 0.1
+MONITOR_PROBES_PER_SECOND = 20
+MONITOR_WORKERS = 4
+# Maximum number of traces in flight at once in parallel run_benchmark
+BENCHMARK_WORKERS = 8
+# Maximum number of traces in flight at once in the asyncio engine
+ASYNC_CONCURRENCY = 32
+# Upper bound on runs per endpoint when run_benchmark samples until the RTT interval is tight
+ADAPTIVE_MAX_RUNS = 20
+# Longest a trace waits for a reply between checks for cancellation / an expired deadline
+CANCEL_POLL_INTERVAL = 0.05
+# Seconds POST /benchmark/cancel waits for the in-flight traces to stop before replying
+CANCEL_GRACE = 2.0
+# Agents push endpoint results to the collector in batches of this many (plus a last,
+# partial one), retrying a failed push this many times before keeping it for later; the
+# last push of a job is retried until it gets through. Retries back off exponentially
+# from AGENT_PUSH_BACKOFF seconds up to AGENT_PUSH_MAX_BACKOFF
+AGENT_BATCH_SIZE = 4
+AGENT_PUSH_RETRIES = 3
+AGENT_PUSH_BACKOFF = 1.0
+AGENT_PUSH_MAX_BACKOFF = 60.0
+# Seconds an agent/coordinator HTTP request may take
+AGENT_HTTP_TIMEOUT = 10
+# Seconds between coordinator polls of the collector while agents are running
+COORDINATOR_POLL_INTERVAL = 1.0
+# Seconds a coordinator waits for its agents to finish a job by default
+COORDINATOR_TIMEOUT = 3600
 
 PROVIDERS = {
     "aws": "Amazon Web Services",
@@ -29,7 +87,104 @@ RESULTS_SCHEMA = {
     "timestamp": "TEXT DEFAULT CURRENT_TIMESTAMP"
 }
 
-# IP Geolocation API settings
-IPINFO_API_URL = "https://ipinfo.io/{}/json"
+# Distributed mode: vantage-point agents register with the collector and push
+# compact per-endpoint results to it, tagged with the job that requested them
+AGENTS_TABLE = "vantage_agents"
+AGENTS_SCHEMA = {
+    "name": "TEXT PRIMARY KEY",
+    "url": "TEXT NOT NULL",
+    "registered": "TEXT DEFAULT CURRENT_TIMESTAMP"
+}
+VANTAGE_RESULTS_TABLE = "vantage_results"
+VANTAGE_RESULTS_SCHEMA = {
+    "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "job": "TEXT NOT NULL",
+    "vantage": "TEXT NOT NULL",
+    "endpoint": "TEXT NOT NULL",
+    "hop_count": "INTEGER",
+    "avg_rtt_ms": "REAL",
+    "max_rtt_ms": "REAL",
+    "min_rtt_ms": "REAL",
+    "success_rate": "REAL",
+    "packet_loss": "REAL",
+    "hops": "TEXT",
+    "timestamp": "TEXT DEFAULT CURRENT_TIMESTAMP"
+}
+# (job, agent) pairs whose agent pushed its last batch
+VANTAGE_JOBS_TABLE = "vantage_jobs"
+VANTAGE_JOBS_SCHEMA = {
+    "job": "TEXT NOT NULL",
+    "vantage": "TEXT NOT NULL",
+    "error": "TEXT",
+    "finished": "TEXT DEFAULT CURRENT_TIMESTAMP",
+    "PRIMARY KEY": "(job, vantage)"
+}
+
+# DNS resolution (src/resolver.py): nameservers from DNS_RESOLV_CONF, queried for up to
+# DNS_TIMEOUT seconds each, DNS_RETRIES more rounds; answers are cached for their record
+# TTL and failures for the zone's negative TTL (from its SOA) or else DNS_NEGATIVE_TTL,
+# both clamped to [DNS_MIN_TTL, DNS_MAX_TTL]
+DNS_RESOLV_CONF = "/etc/resolv.conf"
+DNS_TIMEOUT = 2.0
+DNS_RETRIES = 1
+DNS_MIN_TTL = 30
+DNS_MAX_TTL = 3600
+DNS_NEGATIVE_TTL = 60
+# TTL given to answers of the system resolver (used when no nameserver answers), which
+# does not report one
+DNS_SYSTEM_TTL = 60
+# Background refresh re-resolves a host once this fraction of its answer's TTL has passed
+# (failed lookups only once they expire), up to DNS_REFRESH_WORKERS hosts at once
+DNS_REFRESH_FRACTION = 0.8
+DNS_REFRESH_WORKERS = 4
+
+# IP Geolocation API settings (GET {base}/{ip}/json, POST {base}/batch)
+IPINFO_BASE_URL = "https://ipinfo.io"
+# Most addresses sent in one batch request
+IPINFO_BATCH_SIZE = 100
+# Seconds a batch waits for addresses from other traces before it is sent
+IPINFO_BATCH_LINGER = 0.05
+# API requests per second across the whole process (free tier: about 1)
+IPINFO_REQUESTS_PER_SECOND = 1.0
+# Retries of a request answered with HTTP 429 or failing to connect
+IPINFO_MAX_RETRIES = 3
+# Seconds before the first retry when the API sends no Retry-After; doubles every retry
+IPINFO_BACKOFF = 1.0
+# Keep-alive connections kept open to the API
+IPINFO_POOL_SIZE = 4
+# Seconds to wait for an API response
+IPINFO_HTTP_TIMEOUT = 10
 # Free tier API key limit
 DEFAULT_IPINFO_TOKEN = None
+# Offline geolocation database (CSV of IP ranges, or its compiled .idx), consulted
+# before the API; override with the GEOIP_DB environment variable
+GEO_DB_PATH = "data/geoip.csv"
+# Optional list of extra bogon ranges (one CIDR per line, "#" comments) classified like the
+# IANA special-purpose blocks and never geolocated; override with the BOGON_LIST env var
+BOGON_LIST_PATH = "config/bogons.txt"
+# Persistent geolocation cache (SQLite in WAL mode, under data/geo_cache): API answers
+# are kept for GEO_CACHE_TTL seconds, the most recently used GEO_CACHE_MEMORY_ENTRIES
+# of them also in memory
+GEO_CACHE_TABLE = "geo_cache"
+GEO_CACHE_SCHEMA = {
+    "ip": "TEXT PRIMARY KEY",
+    "data": "TEXT NOT NULL",
+    "expires": "REAL NOT NULL"
+}
+GEO_CACHE_TTL = 30 * 24 * 3600
+GEO_CACHE_MEMORY_ENTRIES = 10000
+# Prefix-level inference: an address without an answer of its own takes the cached answer
+# of an address in the same prefix of this length (per IP version), marked as inferred.
+# The wide-prefix level only supplies org/asn, when the API has no answer either; a /16
+# often spans several networks, so that org/asn is a guess, not the address's own ASN
+GEO_PREFIX_LENGTHS = {4: 24, 6: 48}
+GEO_WIDE_PREFIX_LENGTHS = {4: 16, 6: 32}
+GEO_PREFIX_TABLE = "geo_prefix_cache"
+GEO_PREFIX_SCHEMA = {
+    "level": "TEXT NOT NULL",
+    "prefix": "TEXT NOT NULL",
+    "source": "TEXT NOT NULL",
+    "data": "TEXT NOT NULL",
+    "expires": "REAL NOT NULL",
+    "PRIMARY KEY": "(level, prefix)"
+}
@@ -0,0 +1,137 @@
+import time
+import uuid
+import requests
+from src.constants import AGENT_HTTP_TIMEOUT, COORDINATOR_POLL_INTERVAL, COORDINATOR_TIMEOUT
+
+class Coordinator:
+    """
+    Fans a benchmark out to every agent registered with a collector and merges the results.
+
+    Agents push their results to the collector, not back to the
+    coordinator, so the coordinator only starts the job and then polls the
+    collector until every agent it started has finished. Agents the
+    collector has not heard the end from are asked directly, so one that
+    lost the job (e.g. restarted) does not keep the coordinator waiting.
+    """
+
+    def __init__(self, collector_url, poll_interval=COORDINATOR_POLL_INTERVAL):
+        self.collector_url = collector_url.rstrip('/')
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+
+    def agents(self):
+        """Registered agents as {name: url}"""
+        response = self.session.get(f"{self.collector_url}/collector/agents",
+                                    timeout=AGENT_HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def start(self, providers, num_runs=3, protocol=None, agents=None):
+        """
+        Start a benchmark job on every agent.
+
+        Args:
+            providers: Provider keys to benchmark (see endpoints.get_endpoints)
+            num_runs: Runs per provider on each agent
+            protocol: Probe protocol (None: per provider config)
+            agents: {name: url} of the agents to use (default: all registered)
+
+        Returns:
+            (job id, {name: url} of the agents that accepted it)
+        """
+        job = uuid.uuid4().hex
+        started = {}
+        for name, url in (agents if agents is not None else self.agents()).items():
+            try:
+                response = self.session.post(f"{url.rstrip('/')}/run", timeout=AGENT_HTTP_TIMEOUT,
+                                             json={"job": job, "providers": providers,
+                                                   "num_runs": num_runs, "protocol": protocol})
+                response.raise_for_status()
+                started[name] = url
+            except requests.RequestException as exc:
+                print(f"Agent {name} at {url} did not start job {job}: {exc}")
+        print(f"Job {job} started on {len(started)} agents: {', '.join(started)}")
+        return job, started
+
+    def wait(self, job, agents, timeout=COORDINATOR_TIMEOUT):
+        """
+        Poll the collector until all agents have finished a job.
+
+        An agent whose own status says the job is over (or unknown to it)
+        while the collector still has it running counts as finished after one
+        more poll, with an error saying why.
+
+        Args:
+            job: Job id from start()
+            agents: {name: url} of the agents running it (or just their names,
+                to rely on the collector alone)
+            timeout: Seconds to wait at most (None: no limit)
+
+        Returns:
+            Merged results, see merge(); agents that did not finish in time are
+            included with what they pushed so far and "finished" False
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        urls = agents if isinstance(agents, dict) else {}
+        gone = {}  # name -> job state the agent reported after its end was not collected
+        while True:
+            response = self.session.get(f"{self.collector_url}/collector/jobs/{job}",
+                                        timeout=AGENT_HTTP_TIMEOUT)
+            response.raise_for_status()
+            vantages = response.json()
+            running = [name for name in agents if not vantages.get(name, {}).get("finished")]
+            for name in running:
+                if name in gone:
+                    entry = vantages.setdefault(name, {"error": None, "results": {}})
+                    entry["finished"] = True
+                    entry["error"] = entry["error"] or (f"Agent reports job {gone[name]} but "
+                                                        "never delivered its end to the collector")
+            running = [name for name in running if name not in gone]
+            if not running:
+                break
+            if deadline is not None and time.time() >= deadline:
+                print(f"Timed out waiting for job {job}")
+                break
+            for name in running:
+                state = self._agent_state(urls.get(name), job)
+                if state in ("complete", "error", "unknown"):
+                    gone[name] = state
+            time.sleep(self.poll_interval)
+        return merge(vantages, agents)
+
+    def _agent_state(self, url, job):
+        """Job state from an agent's /status ("unknown" if it does not know the job), or None"""
+        if url is None:
+            return None
+        try:
+            response = self.session.get(f"{url.rstrip('/')}/status", timeout=AGENT_HTTP_TIMEOUT)
+            response.raise_for_status()
+            return response.json()["jobs"].get(job, "unknown")
+        except (requests.RequestException, ValueError, KeyError):
+            return None  # Unreachable for now: keep waiting
+
+    def run(self, providers, num_runs=3, protocol=None, timeout=COORDINATOR_TIMEOUT):
+        """start() and wait() in one call; returns the merged results"""
+        job, agents = self.start(providers, num_runs, protocol)
+        return self.wait(job, agents, timeout)
+
+def merge(vantages, agents):
+    """
+    Merge per-vantage job results.
+
+    Args:
+        vantages: Collector job results ({vantage: {"finished", "error", "results"}})
+        agents: Names of the agents expected to report
+
+    Returns:
+        Dictionary with "vantages" (the per-vantage entries, one per expected
+        agent) and "endpoints" ({endpoint: {vantage: avg_rtt_ms}}) for
+        comparing an endpoint across vantage points
+    """
+    merged = {name: vantages.get(name, {"finished": False, "error": None, "results": {}})
+              for name in agents}
+    endpoints = {}
+    for name, entry in merged.items():
+        for endpoint, data in entry["results"].items():
+            endpoints.setdefault(endpoint, {})[name] = data["avg_rtt_ms"]
+    return {"vantages": merged, "endpoints": endpoints}
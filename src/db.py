@@ -1,8 +1,12 @@
+import json
 import os
 import sqlite3
 from dotenv import load_dotenv
 from pathlib import Path
-from src.constants import RESULTS_TABLE, RESULTS_SCHEMA
+from src.constants import (
+    RESULTS_TABLE, RESULTS_SCHEMA, AGENTS_TABLE, AGENTS_SCHEMA, VANTAGE_RESULTS_TABLE,
+    VANTAGE_RESULTS_SCHEMA, VANTAGE_JOBS_TABLE, VANTAGE_JOBS_SCHEMA
+)
 
 load_dotenv()
 
@@ -14,8 +18,11 @@ class Database:
     def _create_table(self):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        columns = ", ".join(f"{k} {v}" for k, v in RESULTS_SCHEMA.items())
-        cursor.execute(f"CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} ({columns})")
+        for table, schema in ((RESULTS_TABLE, RESULTS_SCHEMA), (AGENTS_TABLE, AGENTS_SCHEMA),
+                              (VANTAGE_RESULTS_TABLE, VANTAGE_RESULTS_SCHEMA),
+                              (VANTAGE_JOBS_TABLE, VANTAGE_JOBS_SCHEMA)):
+            columns = ", ".join(f"{k} {v}" for k, v in schema.items())
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
         conn.commit()
         conn.close()
 
@@ -29,3 +36,52 @@ class Database:
             )
         conn.commit()
         conn.close()
+
+    def register_agent(self, name, url):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"INSERT OR REPLACE INTO {AGENTS_TABLE} (name, url) VALUES (?, ?)",
+                     (name, url))
+        conn.commit()
+        conn.close()
+
+    def get_agents(self):
+        conn = sqlite3.connect(self.db_path)
+        agents = dict(conn.execute(f"SELECT name, url FROM {AGENTS_TABLE} ORDER BY name"))
+        conn.close()
+        return agents
+
+    def save_vantage_results(self, job, vantage, results, finished=False, error=None):
+        """Store one batch of compact agent results in a single transaction"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {VANTAGE_RESULTS_TABLE} (job, vantage, endpoint, hop_count, avg_rtt_ms, max_rtt_ms, min_rtt_ms, success_rate, packet_loss, hops) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job, vantage, endpoint, data["hop_count"], data["avg_rtt_ms"], data["max_rtt_ms"],
+                  data["min_rtt_ms"], data["success_rate"], data["packet_loss"],
+                  json.dumps(data.get("hops", [])))
+                 for endpoint, data in results.items()]
+            )
+            if finished:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {VANTAGE_JOBS_TABLE} (job, vantage, error) VALUES (?, ?, ?)",
+                    (job, vantage, error)
+                )
+        conn.close()
+
+    def get_vantage_results(self, job):
+        """Results of a job as {vantage: {"finished", "error", "results": {endpoint: data}}}"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        vantages = {}
+        def entry(vantage):
+            return vantages.setdefault(vantage, {"finished": False, "error": None, "results": {}})
+        rows = conn.execute(f"SELECT * FROM {VANTAGE_RESULTS_TABLE} WHERE job = ? ORDER BY id", (job,))
+        for row in rows:
+            data = {k: row[k] for k in row.keys() if k not in ("id", "job", "vantage", "endpoint")}
+            data["hops"] = json.loads(data["hops"])
+            entry(row["vantage"])["results"][row["endpoint"]] = data
+        rows = conn.execute(f"SELECT vantage, error FROM {VANTAGE_JOBS_TABLE} WHERE job = ?", (job,))
+        for row in rows:
+            entry(row["vantage"]).update(finished=True, error=row["error"])
+        conn.close()
+        return vantages
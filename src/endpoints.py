@@ -5,6 +5,26 @@ def load_static_endpoints():
     with open("config/endpoints.json", "r") as f:
         return json.load(f)
 
+def _host(entry):
+    # Entries are either a hostname or {"host": ..., "protocol": ..., "port": ..., "interval": ...}
+    return entry["host"] if isinstance(entry, dict) else entry
+
 def get_endpoints(providers):
     endpoints = load_static_endpoints()
-    return {key: endpoints[key] for key in providers if key in endpoints}
+    return {key: _host(endpoints[key]) for key in providers if key in endpoints}
+
+def get_probe_options(providers):
+    """Per-provider probe settings (protocol/port) from config/endpoints.json, where configured."""
+    endpoints = load_static_endpoints()
+    options = {}
+    for key in providers:
+        entry = endpoints.get(key)
+        if isinstance(entry, dict):
+            options[key] = {k: entry[k] for k in ("protocol", "port") if k in entry}
+    return options
+
+def get_monitor_intervals(providers):
+    """Per-provider monitoring intervals in seconds from config/endpoints.json, where configured."""
+    endpoints = load_static_endpoints()
+    return {key: endpoints[key]["interval"] for key in providers
+            if isinstance(endpoints.get(key), dict) and "interval" in endpoints[key]}
@@ -0,0 +1,221 @@
+import ipaddress
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from src.constants import (
+    GEO_CACHE_TABLE, GEO_CACHE_SCHEMA, GEO_CACHE_TTL, GEO_CACHE_MEMORY_ENTRIES, GEO_PREFIX_TABLE,
+    GEO_PREFIX_SCHEMA, GEO_PREFIX_LENGTHS, GEO_WIDE_PREFIX_LENGTHS
+)
+
+# PRAGMA user_version once the legacy JSON cache has been imported
+MIGRATED_VERSION = 1
+# Fields a wide-prefix inference carries over
+WIDE_PREFIX_FIELDS = ("org", "asn")
+
+def _prefix(ip_address, lengths):
+    """The network of the given length (per IP version) containing an address, as a string"""
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    length = lengths.get(address.version)
+    if length is None:
+        return None
+    return str(ipaddress.ip_network((address, length), strict=False))
+
+class GeoCache:
+    """
+    Persistent geolocation cache: SQLite in WAL mode behind a bounded in-memory LRU.
+
+    Every put() is written through in its own small transaction, so nothing
+    is lost on exit and no periodic rewrite of the whole cache is needed.
+    Entries expire ttl seconds after they were stored, so geolocations are
+    refreshed from the API once they get stale. Safe to share between threads.
+
+    Every stored answer also becomes the answer for its prefix (and its org
+    and ASN that of a wider prefix), so infer() can answer for other
+    interfaces of the same router, or guess the operator of a nearby one;
+    see GEO_PREFIX_LENGTHS.
+    """
+
+    def __init__(self, path, ttl=GEO_CACHE_TTL, memory_entries=GEO_CACHE_MEMORY_ENTRIES,
+                 prefix_lengths=GEO_PREFIX_LENGTHS, wide_prefix_lengths=GEO_WIDE_PREFIX_LENGTHS):
+        """
+        Args:
+            path: SQLite file (":memory:" for a cache that is not persisted)
+            ttl: Seconds an entry stays valid
+            memory_entries: Most entries kept in memory (least recently used are dropped)
+            prefix_lengths: {IP version: prefix length} for full answers ({}: no inference)
+            wide_prefix_lengths: {IP version: prefix length} for org/asn answers
+        """
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.levels = {"prefix": prefix_lengths, "wide-prefix": wide_prefix_lengths}
+        self.memory = OrderedDict()  # ip -> (record, expires), most recently used last
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; one fsync less
+        with self.conn:
+            for table, schema in ((GEO_CACHE_TABLE, GEO_CACHE_SCHEMA),
+                                  (GEO_PREFIX_TABLE, GEO_PREFIX_SCHEMA)):
+                columns = ", ".join(f"{k} {v}" for k, v in schema.items())
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+                self.conn.execute(f"DELETE FROM {table} WHERE expires <= ?", (time.time(),))
+            # Rows of levels this cache no longer has (e.g. the former "asn" level)
+            self.conn.execute(f"DELETE FROM {GEO_PREFIX_TABLE} WHERE level NOT IN (?, ?)",
+                              tuple(self.levels))
+            # Caches from before prefix inference: derive the prefixes of what is stored
+            if not self.conn.execute(f"SELECT 1 FROM {GEO_PREFIX_TABLE} LIMIT 1").fetchone():
+                rows = self.conn.execute(f"SELECT ip, data, expires FROM {GEO_CACHE_TABLE}")
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO {GEO_PREFIX_TABLE} "
+                    "(level, prefix, source, data, expires) VALUES (?, ?, ?, ?, ?)",
+                    [row for ip, data, expires in rows.fetchall()
+                     for row in self._prefix_rows(ip, json.loads(data), expires)]
+                )
+
+    def get(self, ip_address):
+        """Cached record for an address, or None if there is none or it has expired"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(ip_address)
+            if entry is None:
+                row = self.conn.execute(
+                    f"SELECT data, expires FROM {GEO_CACHE_TABLE} WHERE ip = ?", (ip_address,)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1])
+            if entry[1] <= now:
+                self.memory.pop(ip_address, None)
+                return None
+            self._remember(ip_address, entry)
+            return entry[0]
+
+    def put(self, ip_address, record, ttl=None):
+        """Store a record (valid for ttl seconds, default the cache's)"""
+        self.put_many({ip_address: record}, ttl)
+
+    def put_many(self, records, ttl=None, stored=None):
+        """
+        Store {ip: record} in one transaction.
+
+        Args:
+            records: Records to store
+            ttl: Seconds they stay valid (default: the cache's)
+            stored: When they were fetched (default: now)
+        """
+        expires = (stored or time.time()) + (self.ttl if ttl is None else ttl)
+        rows = [(ip, json.dumps(record), expires) for ip, record in records.items()]
+        prefix_rows = [row for ip, record in records.items()
+                       for row in self._prefix_rows(ip, record, expires)]
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(f"INSERT OR REPLACE INTO {GEO_CACHE_TABLE} "
+                                      "(ip, data, expires) VALUES (?, ?, ?)", rows)
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO {GEO_PREFIX_TABLE} "
+                    "(level, prefix, source, data, expires) VALUES (?, ?, ?, ?, ?)", prefix_rows
+                )
+            for ip, record in records.items():
+                self._remember(ip, (record, expires))
+
+    def _prefix_rows(self, ip_address, record, expires):
+        """Prefix table rows an answer for ip_address provides"""
+        rows = []
+        for level, lengths in self.levels.items():
+            prefix = _prefix(ip_address, lengths)
+            data = record
+            if level == "wide-prefix":
+                data = {key: record[key] for key in WIDE_PREFIX_FIELDS if key in record}
+            if prefix is not None and data:
+                rows.append((level, prefix, ip_address, json.dumps(data), expires))
+        return rows
+
+    def prefix(self, ip_address, level="prefix"):
+        """The prefix infer() answers ip_address from at a level, or None if it never does"""
+        return _prefix(ip_address, self.levels[level])
+
+    def infer(self, ip_address, level="prefix"):
+        """
+        Answer for an address from the cached answer of another one in the same prefix.
+
+        Args:
+            ip_address: Address to geolocate
+            level: "prefix" for a full answer from the same GEO_PREFIX_LENGTHS
+                prefix, "wide-prefix" for only org/asn from the same (wider)
+                GEO_WIDE_PREFIX_LENGTHS prefix; that prefix may hold other
+                networks, so its org/asn need not be the address's
+
+        Returns:
+            The record with "ip" set to ip_address, "confidence" set to level and
+            "inferred_from" to {"ip", "prefix"} of the answer it is based on, or
+            None if no unexpired answer covers the address
+        """
+        prefix = self.prefix(ip_address, level)
+        if prefix is None:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT source, data FROM {GEO_PREFIX_TABLE} "
+                "WHERE level = ? AND prefix = ? AND expires > ?", (level, prefix, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[1]), "ip": ip_address, "confidence": level,
+                "inferred_from": {"ip": row[0], "prefix": prefix}}
+
+    def _remember(self, ip_address, entry):
+        """Put an entry in the memory front (lock held)"""
+        self.memory[ip_address] = entry
+        self.memory.move_to_end(ip_address)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def __len__(self):
+        """Number of stored entries, expired ones not yet dropped included"""
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {GEO_CACHE_TABLE}").fetchone()[0]
+
+    def migrate_json(self, json_path):
+        """
+        Import the JSON cache file GeoLocator used to keep, once per database.
+
+        Entries are dated by the file's modification time, so they expire ttl
+        after it was last written. The file itself is left in place.
+
+        Returns:
+            Number of entries imported
+        """
+        json_path = Path(json_path)
+        with self.lock:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] >= MIGRATED_VERSION:
+                return 0
+        records = {}
+        if json_path.exists():
+            try:
+                with open(json_path) as f:
+                    legacy = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Could not read legacy geolocation cache {json_path}: {e}")
+                legacy = {}
+            # Private addresses are classified without the cache; errors were never meant to stay
+            records = {ip: record for ip, record in legacy.items()
+                       if isinstance(record, dict) and "error" not in record
+                       and not record.get("private")}
+            if records:
+                self.put_many(records, stored=json_path.stat().st_mtime)
+                print(f"Imported {len(records)} geolocations from {json_path}")
+        with self.lock:
+            self.conn.execute(f"PRAGMA user_version = {MIGRATED_VERSION}")
+        return len(records)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,184 @@
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+# Index file layout: header, then n range starts, n range ends and n record ids
+# (uint32 each, native byte order), then m + 1 offsets into the record blob
+# (uint32) and the blob of UTF-8 JSON records. Identical records are stored once.
+INDEX_MAGIC = b"CTGEO1" + (b"L" if sys.byteorder == "little" else b"B") + b"\0"
+INDEX_HEADER = struct.Struct("=8sII")  # magic, ranges, records
+INDEX_SUFFIX = ".idx"
+
+# CSV columns that hold a field of the ipinfo-style record (first present one wins)
+CSV_FIELDS = {
+    "country": ("country", "country_code", "country_iso_code"),
+    "region": ("region", "subdivision", "subdivision_1_name"),
+    "city": ("city", "city_name"),
+    "lat": ("lat", "latitude"),
+    "lon": ("lon", "lng", "longitude"),
+    "org": ("org", "organization", "autonomous_system_organization", "isp"),
+    "asn": ("asn", "autonomous_system_number"),
+}
+
+def _column(row, names):
+    for name in names:
+        if row.get(name) not in (None, ""):
+            return row[name]
+    return None
+
+def _record(row):
+    """ipinfo-style geo record (see GeoLocator.geolocate_ip) from one CSV row"""
+    fields = {key: _column(row, names) for key, names in CSV_FIELDS.items()}
+    record = {key: fields[key] for key in ("city", "region", "country", "org")
+              if fields[key] is not None}
+    if fields["lat"] is not None and fields["lon"] is not None:
+        record["loc"] = f"{float(fields['lat']):.4f},{float(fields['lon']):.4f}"
+    if fields["asn"] is not None:
+        record["asn"] = str(fields["asn"]).upper().removeprefix("AS")
+    return record
+
+def _range(row):
+    """(first, last) IPv4 address of a row as integers, or None for other rows"""
+    if row.get("network"):
+        network = ipaddress.ip_network(row["network"], strict=False)
+        if network.version != 4:
+            return None
+        return int(network.network_address), int(network.broadcast_address)
+    first = ipaddress.ip_address(row["start_ip"])
+    last = ipaddress.ip_address(row["end_ip"])
+    if first.version != 4 or last.version != 4:
+        return None
+    return int(first), int(last)
+
+def build_index(csv_path, index_path=None):
+    """
+    Compile a CSV of IP ranges into the binary index GeoDatabase maps.
+
+    The CSV needs either start_ip and end_ip columns or a network (CIDR)
+    column, plus any of country, region, city, lat/latitude, lon/longitude,
+    org and asn (MaxMind GeoLite2 column names work too). Only IPv4 ranges
+    are indexed. A range overlapping the previous one (in address order) is
+    skipped.
+
+    Args:
+        csv_path: CSV file to read
+        index_path: Index file to write (default: csv_path + ".idx")
+
+    Returns:
+        Path of the index file
+    """
+    index_path = Path(index_path or str(csv_path) + INDEX_SUFFIX)
+    ranges = []
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            bounds = _range(row)
+            if bounds is not None:
+                ranges.append((*bounds, json.dumps(_record(row), sort_keys=True)))
+    ranges.sort()
+
+    starts, ends, ids = array("I"), array("I"), array("I")
+    record_ids = {}  # JSON -> id
+    skipped = 0
+    for first, last, record in ranges:
+        if ends and first <= ends[-1]:
+            skipped += 1
+            continue
+        starts.append(first)
+        ends.append(last)
+        ids.append(record_ids.setdefault(record, len(record_ids)))
+    if skipped:
+        print(f"Skipped {skipped} overlapping ranges in {csv_path}")
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for record in record_ids:
+        blob += record.encode()
+        offsets.append(len(blob))
+
+    tmp_path = index_path.with_suffix(index_path.suffix + f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(starts), len(record_ids)))
+        for table in (starts, ends, ids, offsets):
+            table.tofile(f)
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+    print(f"Indexed {len(starts)} ranges ({len(record_ids)} distinct records) into {index_path}")
+    return index_path
+
+class GeoDatabase:
+    """
+    Offline IPv4 geolocation from a memory-mapped, sorted interval index.
+
+    Lookups binary-search the mapped range starts directly, so opening a
+    database costs no parsing and a lookup a few microseconds; records are
+    decoded on first use and kept. Pass a CSV to have its index built (and
+    rebuilt whenever the CSV is newer), or an index from build_index.
+    """
+
+    def __init__(self, path):
+        path = Path(path)
+        if path.suffix != INDEX_SUFFIX:
+            index_path = Path(str(path) + INDEX_SUFFIX)
+            if not index_path.exists() or index_path.stat().st_mtime < path.stat().st_mtime:
+                build_index(path, index_path)
+            path = index_path
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, ranges, records = INDEX_HEADER.unpack_from(self.map)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Not a geolocation index for this machine: {path}")
+        self.views = []  # every view of the map, released before it is closed
+        words = self._view(memoryview(self.map)[INDEX_HEADER.size:])
+        size = array("I").itemsize
+        tables = self._view(words[:(3 * ranges + records + 1) * size].cast("I"))
+        self.starts = tables[:ranges]
+        self.ends = tables[ranges:2 * ranges]
+        self.ids = tables[2 * ranges:3 * ranges]
+        self.offsets = tables[3 * ranges:]
+        self.blob = words[(3 * ranges + records + 1) * size:]
+        self.views += [self.starts, self.ends, self.ids, self.offsets, self.blob]
+        self.records = {}  # id -> decoded record
+
+    def _view(self, view):
+        self.views.append(view)
+        return view
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, ip_address):
+        """
+        Geo record for an IPv4 address.
+
+        Returns:
+            Dictionary in the shape of an ipinfo.io response (ip, city, region,
+            country, loc, org, asn; fields the database lacks are left out),
+            or None if no range contains the address
+        """
+        try:
+            ip = int.from_bytes(socket.inet_aton(ip_address), "big")
+        except (OSError, TypeError):
+            return None  # Not an IPv4 address
+        i = bisect_right(self.starts, ip) - 1
+        if i < 0 or ip > self.ends[i]:
+            return None
+        record_id = self.ids[i]
+        record = self.records.get(record_id)
+        if record is None:
+            start, end = self.offsets[record_id], self.offsets[record_id + 1]
+            record = self.records[record_id] = json.loads(bytes(self.blob[start:end]))
+        return {"ip": ip_address, **record}
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.map.close()
@@ -0,0 +1,99 @@
+import sys
+
+class Hop:
+    """
+    One hop of a trace: a compact, slotted record with dict-style access.
+
+    Hops used to be plain dictionaries, and code throughout reads them as
+    such (hop["rtt"], hop.get("geo"), "lat" in hop), so Hop supports the
+    same mapping operations. Addresses, statuses and clock names are
+    interned so the many hops of a long history share one string each, and
+    geo is a reference to the geolocator's cache entry rather than a copy.
+    to_dict() gives the plain dictionary for JSON and other API boundaries.
+
+    The core fields (ttl, ip, rtt, status, attempt) are always present; the
+    optional ones count as absent while they are None.
+    """
+
+    __slots__ = ("ttl", "ip", "rtt", "status", "attempt", "clock", "geo", "lat", "lon",
+                 "hop_latency", "shared_prefix", "fallback")
+    CORE_FIELDS = ("ttl", "ip", "rtt", "status", "attempt")
+
+    def __init__(self, ttl, ip=None, rtt=None, status="success", attempt=1, clock=None, geo=None,
+                 lat=None, lon=None, hop_latency=None, shared_prefix=None, fallback=None):
+        self.ttl = ttl
+        self.ip = _intern(ip)
+        self.rtt = rtt
+        self.status = _intern(status)
+        self.attempt = attempt
+        self.clock = _intern(clock)
+        self.geo = geo
+        self.lat = lat
+        self.lon = lon
+        self.hop_latency = hop_latency
+        self.shared_prefix = shared_prefix
+        self.fallback = fallback
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Hop from its dictionary form (unknown keys are ignored)."""
+        return cls(**{key: value for key, value in data.items() if key in cls.__slots__})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.keys()}
+
+    def copy(self, **changes):
+        """Shallow copy, with the given fields replaced."""
+        hop = Hop.__new__(Hop)
+        for key in self.__slots__:
+            setattr(hop, key, getattr(self, key))
+        for key, value in changes.items():
+            hop[key] = value
+        return hop
+
+    def keys(self):
+        return [key for key in self.__slots__ if key in self]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self else default
+
+    def __contains__(self, key):
+        if key in self.CORE_FIELDS:
+            return True
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        if key in ("ip", "status", "clock"):
+            value = _intern(value)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, Hop):
+            return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Hop({self.to_dict()!r})"
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
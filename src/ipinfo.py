@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from src.constants import (
+    IPINFO_BASE_URL, DEFAULT_IPINFO_TOKEN, IPINFO_BATCH_SIZE, IPINFO_BATCH_LINGER,
+    IPINFO_REQUESTS_PER_SECOND, IPINFO_MAX_RETRIES, IPINFO_BACKOFF, IPINFO_POOL_SIZE,
+    IPINFO_HTTP_TIMEOUT
+)
+from src.ratelimit import TokenBucket
+
+load_dotenv()
+
+class IpinfoClient:
+    """
+    ipinfo.io client that batches lookups from every caller into as few requests as possible.
+
+    Addresses requested while a batch is being collected or sent join the
+    next batch, so concurrent traces share requests, and an address already
+    in flight is never requested twice. The caller that finds no batch in
+    progress sends the batches itself (after IPINFO_BATCH_LINGER, to let
+    others join); everyone else waits for their addresses. All requests go
+    over one pooled keep-alive session, take a token from the shared bucket
+    first and back off on HTTP 429. With a token the batch endpoint is used,
+    without one (the batch endpoint needs one) one request per address.
+    """
+
+    def __init__(self, token=None, base_url=IPINFO_BASE_URL, bucket=None,
+                 batch_size=IPINFO_BATCH_SIZE, linger=IPINFO_BATCH_LINGER,
+                 max_retries=IPINFO_MAX_RETRIES, backoff=IPINFO_BACKOFF):
+        """
+        Args:
+            token: API token (default: $IPINFO_TOKEN)
+            base_url: API root, e.g. a local stand-in server in tests
+            bucket: TokenBucket every request takes a token from (default: one
+                allowing IPINFO_REQUESTS_PER_SECOND)
+            batch_size: Most addresses per batch request
+            linger: Seconds to wait for more addresses before sending a batch
+            max_retries: Retries of a request answered with 429 or failing to connect
+            backoff: First retry delay in seconds, doubled on every retry (a
+                Retry-After header takes precedence)
+        """
+        self.token = token if token is not None else os.getenv('IPINFO_TOKEN', DEFAULT_IPINFO_TOKEN)
+        self.base_url = base_url.rstrip('/')
+        self.bucket = bucket or TokenBucket(IPINFO_REQUESTS_PER_SECOND)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=IPINFO_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.pending = []  # addresses waiting for the next batch, in request order
+        self.futures = {}  # address -> Future, while pending or in flight
+        self.sending = False  # whether some caller is sending batches
+        self.requests = 0  # HTTP requests made, retries included
+
+    def lookup(self, ip_address):
+        """Geolocation of one address (see resolve())"""
+        return self.resolve([ip_address])[ip_address]
+
+    def resolve(self, ip_addresses):
+        """
+        Geolocate addresses, batched with those of concurrent callers.
+
+        Returns:
+            Dictionary of address to the ipinfo.io response (with "asn" parsed
+            from "org"), or to {"error": ..., "ip": ...} if it failed
+        """
+        futures = {}
+        with self.lock:
+            for ip in dict.fromkeys(ip_addresses):
+                if ip not in self.futures:
+                    self.futures[ip] = Future()
+                    self.pending.append(ip)
+                futures[ip] = self.futures[ip]
+            send = bool(self.pending) and not self.sending
+            if send:
+                self.sending = True
+        if send:
+            self._send_pending()
+        return {ip: future.result() for ip, future in futures.items()}
+
+    def _send_pending(self):
+        """Send batches until nothing is pending (run by one caller at a time)"""
+        time.sleep(self.linger)
+        while True:
+            with self.lock:
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                if not batch:
+                    self.sending = False
+                    return
+            try:
+                results = self._fetch(batch)
+            except Exception as e:
+                results = {ip: {"error": str(e), "ip": ip} for ip in batch}
+            with self.lock:
+                futures = [(self.futures.pop(ip), ip) for ip in batch]
+            for future, ip in futures:
+                future.set_result(results.get(ip) or {"error": "Missing from response", "ip": ip})
+
+    def _fetch(self, batch):
+        if not self.token:
+            return {ip: self._fetch_one(ip) for ip in batch}
+        response = self._request('POST', f"{self.base_url}/batch", json=batch)
+        if response.status_code != 200:
+            return {ip: {"error": f"API returned status code {response.status_code}", "ip": ip}
+                    for ip in batch}
+        return {ip: _with_asn(result) for ip, result in response.json().items()}
+
+    def _fetch_one(self, ip_address):
+        response = self._request('GET', f"{self.base_url}/{ip_address}/json")
+        if response.status_code != 200:
+            return {"error": f"API returned status code {response.status_code}", "ip": ip_address}
+        return _with_asn(response.json())
+
+    def _request(self, method, url, **kwargs):
+        """One rate-limited request, retried with backoff on 429 and connection errors"""
+        params = {'token': self.token} if self.token else {}
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self.requests += 1
+            try:
+                response = self.session.request(method, url, params=params,
+                                                timeout=IPINFO_HTTP_TIMEOUT, **kwargs)
+            except requests.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            delay = _retry_after(response)
+            delay = self.backoff * 2 ** attempt if delay is None else delay
+            print(f"ipinfo rate limit hit, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def _retry_after(response):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+def _with_asn(result):
+    """Add "asn" from an "org" like "AS15169 Google LLC" when the response has none"""
+    if isinstance(result, dict) and 'org' in result and 'asn' not in result:
+        org_parts = result['org'].split()
+        if org_parts and org_parts[0].startswith('AS'):
+            result['asn'] = org_parts[0][2:]  # Remove 'AS' prefix
+    return result
+
+# Shared by every GeoLocator, so the rate limit holds for the whole process
+ipinfo_client = IpinfoClient()
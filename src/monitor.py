@@ -0,0 +1,114 @@
+import concurrent.futures
+import heapq
+import random
+import threading
+import time
+from src.benchmark import process_endpoint, _probe_settings
+from src.constants import (
+    MONITOR_INTERVAL, MONITOR_JITTER, MONITOR_PROBES_PER_SECOND, MONITOR_WORKERS
+)
+from src.geo import GeoLocator
+from src.ratelimit import TokenBucket
+from src.tracer import RateLimitedBackend, raw_socket_backend
+
+class Monitor:
+    """
+    Long-running scheduler that re-traces every endpoint on its own interval.
+
+    First traces are staggered evenly over each endpoint's interval and every
+    later one is due one interval (+/- jitter) after the previous was due, so
+    traces stay spread out instead of lining up. All probes share one token
+    bucket, which caps the probe rate of all concurrent traces together. A
+    trace still running when its endpoint is due again is not doubled up;
+    that slot is skipped.
+    """
+
+    def __init__(self, endpoints, intervals=None, default_interval=MONITOR_INTERVAL,
+                 jitter=MONITOR_JITTER, probes_per_second=MONITOR_PROBES_PER_SECOND,
+                 max_workers=MONITOR_WORKERS, on_result=None, backend=None, geolocator=None,
+                 protocol=None, probe_options=None, seed=None, **trace_options):
+        """
+        Args:
+            endpoints: Dictionary of provider name to hostname
+            intervals: Dictionary of provider name to seconds between its traces
+                (see endpoints.get_monitor_intervals)
+            default_interval: Seconds between traces of the other providers
+            jitter: Random spread of each interval, as a fraction of it
+            probes_per_second: Probe budget shared by all traces
+            max_workers: Maximum number of traces in flight
+            on_result: Called as on_result(name, host, result) with every
+                process_endpoint result, from a worker thread
+            backend: Probe backend (default: raw sockets; see tracer.get_route)
+            geolocator: GeoLocator to use (default: a new one)
+            protocol: Probe protocol for every endpoint; overrides probe_options
+            probe_options: Dictionary of provider name to {"protocol": ..., "port": ...}
+            seed: Seed for the jitter
+            **trace_options: Passed on to tracer.get_route (e.g. pipelined=True)
+        """
+        self.endpoints = endpoints
+        self.intervals = {name: (intervals or {}).get(name, default_interval) for name in endpoints}
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.on_result = on_result
+        self.backend = RateLimitedBackend(backend or raw_socket_backend,
+                                          TokenBucket(probes_per_second))
+        self.geolocator = geolocator or GeoLocator()
+        self.protocol = protocol
+        self.probe_options = probe_options
+        self.trace_options = trace_options
+        self.random = random.Random(seed)
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.running = set()  # names of the endpoints being traced
+        self.traces = {name: 0 for name in endpoints}  # traces completed per endpoint
+        self.skipped = {name: 0 for name in endpoints}  # due while the previous trace still ran
+
+    def _next_due(self, name, due):
+        interval = self.intervals[name]
+        return due + interval * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    def run(self, duration=None):
+        """Trace endpoints until stop() is called or duration seconds have passed."""
+        start = time.monotonic()
+        end = start + duration if duration is not None else None
+        schedule = [(start + self.intervals[name] * i / len(self.endpoints), name)
+                    for i, name in enumerate(self.endpoints)]
+        heapq.heapify(schedule)
+        print(f"Monitoring {len(self.endpoints)} endpoints")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self.stopped.is_set() and schedule:
+                now = time.monotonic()
+                if end is not None and now >= end:
+                    break
+                due, name = schedule[0]
+                if due > now:
+                    self.stopped.wait(min(due, end) - now if end is not None else due - now)
+                    continue
+                heapq.heapreplace(schedule, (self._next_due(name, due), name))
+                with self.lock:
+                    if name in self.running:
+                        print(f"Skipping {name}: previous trace still running")
+                        self.skipped[name] += 1
+                        continue
+                    self.running.add(name)
+                executor.submit(self._trace, name, self.endpoints[name])
+            self.stop()
+        print("Monitoring stopped")
+
+    def _trace(self, name, host):
+        try:
+            result = process_endpoint(name, host, self.geolocator, backend=self.backend,
+                                      **self.trace_options,
+                                      **_probe_settings(name, self.protocol, self.probe_options))
+            if self.on_result:
+                self.on_result(name, host, result)
+        except Exception as exc:
+            print(f'Monitoring {name} generated an exception: {exc}')
+        finally:
+            with self.lock:
+                self.running.discard(name)
+                self.traces[name] += 1
+
+    def stop(self):
+        self.stopped.set()
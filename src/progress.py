@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from src.constants import PROGRESS_SNAPSHOT_FILE, PROGRESS_SNAPSHOT_INTERVAL
+
+class ProgressBus:
+    """
+    In-process benchmark progress: the latest state plus a way to wait for the next one.
+
+    Publishers replace the whole state (the same dictionary the progress file
+    used to hold); subscribers wait on a version number, so a slow subscriber
+    skips straight to the newest state instead of queueing stale ones.
+    The state is optionally mirrored to a snapshot file for other processes,
+    at most once per snapshot_interval and atomically (write + rename).
+    """
+
+    def __init__(self, snapshot_path=PROGRESS_SNAPSHOT_FILE,
+                 snapshot_interval=PROGRESS_SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.condition = threading.Condition()
+        self.state = {"progress": 0, "status": "unknown"}
+        self.version = 0
+        self.snapshot_time = 0
+        self.snapshot_lock = threading.Lock()
+
+    def publish(self, state):
+        """Replace the current state and wake up every subscriber."""
+        with self.condition:
+            self.state = dict(state)
+            self.version += 1
+            self.condition.notify_all()
+        if self.snapshot_path:
+            with self.snapshot_lock:
+                self._snapshot(state)
+
+    def current(self):
+        """(version, state) of the latest publication."""
+        with self.condition:
+            return self.version, self.state
+
+    def wait(self, version, timeout=None):
+        """
+        Wait for a state newer than version.
+
+        Returns:
+            (version, state) of the newest state, or (version, None) if nothing
+            was published within timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.version != version, timeout):
+                return version, None
+            return self.version, self.state
+
+    def _snapshot(self, state):
+        now = time.time()
+        # Finished (and nearly finished) states are always written, running ones throttled
+        final = state.get("status") != "running" or state.get("progress", 0) >= 90
+        if not final and now - self.snapshot_time < self.snapshot_interval:
+            return
+        self.snapshot_time = now
+        path = Path(self.snapshot_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Per-process temporary file: several processes (e.g. agents) may share the snapshot
+        tmp_path = path.with_suffix(path.suffix + f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+progress_bus = ProgressBus()
@@ -0,0 +1,47 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: on average `rate` tokens per second, at most `burst` at once.
+
+    Callers that have to wait are served one after the other, each as soon
+    as its token is due, so a burst of requests is spread evenly over time.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if they are available right now."""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, sleeping until they are available.
+
+        Returns:
+            Seconds spent waiting
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve now (the balance may go negative) so later callers queue behind us
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
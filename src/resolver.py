@@ -0,0 +1,297 @@
+import ipaddress
+import random
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.constants import (
+    DNS_RESOLV_CONF, DNS_TIMEOUT, DNS_RETRIES, DNS_MIN_TTL, DNS_MAX_TTL, DNS_NEGATIVE_TTL,
+    DNS_SYSTEM_TTL, DNS_REFRESH_FRACTION, DNS_REFRESH_WORKERS
+)
+from src.endpoints import load_static_endpoints, get_endpoints
+
+DNS_PORT = 53
+DNS_TYPE_A = 1
+DNS_TYPE_SOA = 6
+DNS_CLASS_IN = 1
+DNS_RCODE_NXDOMAIN = 3
+
+def read_nameservers(path=DNS_RESOLV_CONF):
+    """(address, port) of the nameservers in a resolv.conf, empty if there is none"""
+    nameservers = []
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    nameservers.append((fields[1], DNS_PORT))
+    except OSError:
+        pass
+    return nameservers
+
+def build_query(hostname, query_id, qtype=DNS_TYPE_A):
+    """A recursive DNS query (RFC 1035) for one name"""
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)  # RD set, one question
+    labels = hostname.rstrip(".").encode("idna").split(b".")
+    qname = b"".join(bytes([len(label)]) + label for label in labels) + b"\0"
+    return header + qname + struct.pack("!HH", qtype, DNS_CLASS_IN)
+
+def _skip_name(data, offset):
+    """Offset just past a (possibly compressed) domain name"""
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:  # Pointer: the name ends here
+            return offset + 2
+        offset += length + 1
+
+def parse_response(data, query_id):
+    """
+    Parse the answer to a build_query() query.
+
+    Returns:
+        (rcode, [(address, ttl)] of the A records, lowest TTL in the answer
+        section (CNAMEs included) or None, negative TTL from an SOA in the
+        authority section or None, whether the response was truncated (TC))
+
+    Raises:
+        ValueError: The packet is not a response to this query
+    """
+    if len(data) < 12:
+        raise ValueError("Truncated DNS response")
+    response_id, flags, questions, answers, authority, _ = struct.unpack_from("!HHHHHH", data)
+    if response_id != query_id or not flags & 0x8000:
+        raise ValueError("Not a response to this query")
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(data, offset) + 4
+    addresses = []
+    ttl = negative_ttl = None
+    for i in range(answers + authority):
+        offset = _skip_name(data, offset)
+        rtype, rclass, record_ttl, length = struct.unpack_from("!HHIH", data, offset)
+        offset += 10
+        rdata = data[offset:offset + length]
+        offset += length
+        if i < answers:
+            ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+            if rtype == DNS_TYPE_A and rclass == DNS_CLASS_IN and length == 4:
+                addresses.append((socket.inet_ntoa(rdata), record_ttl))
+        elif rtype == DNS_TYPE_SOA and length >= 4:
+            # RFC 2308: negative answers live for min(SOA TTL, SOA MINIMUM)
+            negative_ttl = min(record_ttl, struct.unpack("!I", rdata[-4:])[0])
+    return flags & 0xF, addresses, ttl, negative_ttl, bool(flags & 0x0200)
+
+class Resolver:
+    """
+    Caching IPv4 resolver that honours record TTLs.
+
+    Queries go straight to the nameservers of resolv.conf over UDP, so the
+    TTL of every answer is known: entries expire with their records, and
+    failed lookups are cached for the zone's negative TTL. Different names
+    are resolved concurrently; concurrent lookups of one name share a single
+    query. The system resolver (with DNS_SYSTEM_TTL) is used for single-label
+    names, when no nameserver answers, when a response is truncated (it
+    retries over TCP) and before a name is given up as nonexistent, so
+    /etc/hosts entries and search domains keep working.
+    """
+
+    def __init__(self, nameservers=None, timeout=DNS_TIMEOUT, retries=DNS_RETRIES,
+                 min_ttl=DNS_MIN_TTL, max_ttl=DNS_MAX_TTL, negative_ttl=DNS_NEGATIVE_TTL):
+        """
+        Args:
+            nameservers: (address, port) pairs to query (default: from DNS_RESOLV_CONF)
+            timeout: Seconds to wait for each nameserver
+            retries: Further rounds over all nameservers after the first
+            min_ttl, max_ttl: Bounds of the time an answer is cached
+            negative_ttl: Seconds a failure is cached when the zone gives no SOA
+        """
+        self.nameservers = read_nameservers() if nameservers is None else list(nameservers)
+        self.timeout = timeout
+        self.retries = retries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.cache = {}  # hostname -> (addresses, expires, error, refresh_at)
+        self.inflight = {}  # hostname -> Future of its cache entry
+        self.queries = 0  # DNS queries sent
+        self.refresh_stop = None
+
+    def resolve(self, hostname):
+        """First IPv4 address of a host (raises socket.gaierror if it does not resolve)"""
+        return self.resolve_all(hostname)[0]
+
+    def resolve_all(self, hostname):
+        """Every IPv4 address (A record) of a host, as the nameserver ordered them"""
+        try:
+            ipaddress.ip_address(hostname)
+            return [hostname]
+        except ValueError:
+            pass
+        with self.lock:
+            entry = self.cache.get(hostname)
+            if entry is not None and entry[1] > time.monotonic():
+                future = None
+            else:
+                future = self.inflight.get(hostname)
+                owner = future is None
+                if owner:
+                    future = self.inflight[hostname] = Future()
+        if future is not None:
+            if owner:
+                entry = self._refresh(hostname)
+                future.set_result(entry)
+            else:
+                entry = future.result()
+        addresses, _, error, _ = entry
+        if error:
+            raise socket.gaierror(socket.EAI_NONAME, error)
+        return list(addresses)
+
+    def _refresh(self, hostname):
+        """Look a host up and store the result (and release waiting callers)"""
+        try:
+            addresses, ttl, error = self._lookup(hostname)
+        except Exception as e:
+            addresses, ttl, error = [], self.negative_ttl, str(e)
+        now = time.monotonic()
+        entry = (addresses, now + ttl, error, now + ttl * DNS_REFRESH_FRACTION)
+        with self.lock:
+            self.cache[hostname] = entry
+            self.inflight.pop(hostname, None)
+        return entry
+
+    def _lookup(self, hostname):
+        """(addresses, seconds to cache, error or None) for a host"""
+        if "." not in hostname.rstrip(".") or not self.nameservers:
+            return self._system_lookup(hostname)
+        for _ in range(self.retries + 1):
+            for nameserver in self.nameservers:
+                try:
+                    response = self._query(nameserver, hostname)
+                except (OSError, ValueError):
+                    continue  # Timed out or garbled: next nameserver
+                rcode, records, ttl, negative_ttl, truncated = response
+                if truncated:
+                    return self._system_lookup(hostname)
+                if rcode == 0 and records:
+                    ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+                    return list(dict.fromkeys(ip for ip, _ in records)), ttl, None
+                if rcode in (0, DNS_RCODE_NXDOMAIN):
+                    addresses, system_ttl, _ = self._system_lookup(hostname)
+                    if addresses:  # /etc/hosts or a search domain
+                        return addresses, system_ttl, None
+                    reason = "no such host" if rcode else "no IPv4 address"
+                    ttl = self.negative_ttl if negative_ttl is None else negative_ttl
+                    ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+                    return [], ttl, f"{hostname}: {reason}"
+                # SERVFAIL, REFUSED, ...: ask the next nameserver
+        return self._system_lookup(hostname)
+
+    def _query(self, nameserver, hostname):
+        """Send one query and wait for its response (raises OSError on timeout)"""
+        query_id = random.getrandbits(16)
+        family = socket.AF_INET6 if ":" in nameserver[0] else socket.AF_INET
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(nameserver)
+            with self.lock:
+                self.queries += 1
+            sock.send(build_query(hostname, query_id))
+            deadline = time.monotonic() + self.timeout
+            while True:
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                data = sock.recv(4096)
+                try:
+                    return parse_response(data, query_id)
+                except (ValueError, struct.error, IndexError):
+                    continue  # A stray or late packet: keep waiting for ours
+
+    def _system_lookup(self, hostname):
+        try:
+            infos = socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            return [], self.negative_ttl, f"{hostname}: {e}"
+        return list(dict.fromkeys(info[4][0] for info in infos)), DNS_SYSTEM_TTL, None
+
+    def start_refresh(self, hostnames=None):
+        """
+        Keep hosts resolved in the background, re-resolving each before it expires.
+
+        An answer is refreshed once DNS_REFRESH_FRACTION of its TTL has passed;
+        a failed lookup only once it has expired.
+
+        Args:
+            hostnames: Hosts to keep fresh (default: every endpoint in config/endpoints.json)
+        """
+        self.stop_refresh()
+        if hostnames is None:
+            hostnames = get_endpoints(load_static_endpoints()).values()
+        hostnames = list(dict.fromkeys(hostnames))
+        if not hostnames:
+            return
+        self.refresh_stop = threading.Event()
+        thread = threading.Thread(target=self._refresh_loop, args=(hostnames, self.refresh_stop),
+                                  daemon=True)
+        thread.start()
+
+    def stop_refresh(self):
+        if self.refresh_stop is not None:
+            self.refresh_stop.set()
+            self.refresh_stop = None
+
+    def _refresh_loop(self, hostnames, stop):
+        with ThreadPoolExecutor(max_workers=DNS_REFRESH_WORKERS) as executor:
+            while not stop.is_set():
+                with self.lock:
+                    due_at = {host: self._due_at(self.cache.get(host)) for host in hostnames}
+                now = time.monotonic()
+                due = [host for host, at in due_at.items() if at <= now]
+                list(executor.map(self._refresh, due))
+                with self.lock:
+                    next_due = min(self._due_at(self.cache.get(host)) for host in hostnames)
+                stop.wait(max(next_due - time.monotonic(), 1.0))
+
+    @staticmethod
+    def _due_at(entry):
+        """When the background refresh should re-resolve a cache entry"""
+        if entry is None:
+            return 0
+        addresses, expires, error, refresh_at = entry
+        return expires if error else refresh_at
+
+def expand_addresses(endpoints, *settings, resolver=None):
+    """
+    One endpoint per A record, to trace every address of a host.
+
+    Args:
+        endpoints: Dictionary of provider name to hostname
+        settings: Further dictionaries keyed by provider name (e.g. probe
+            options, monitor intervals) to re-key along with the endpoints
+        resolver: Resolver to use (default: default_resolver)
+
+    Returns:
+        (endpoints, *settings) with every provider replaced by "name@address"
+        entries (hosts that do not resolve are kept as they are)
+    """
+    resolver = resolver or default_resolver
+    expanded = {}
+    keys = {}  # new key -> provider name
+    for name, host in endpoints.items():
+        try:
+            addresses = resolver.resolve_all(host)
+        except OSError as e:
+            print(f"Error resolving hostname {host}: {e}")
+            addresses = None
+        for key, target in ([(f"{name}@{ip}", ip) for ip in addresses] if addresses
+                            else [(name, host)]):
+            expanded[key] = target
+            keys[key] = name
+    return (expanded, *({key: setting[name] for key, name in keys.items() if name in setting}
+                        for setting in settings))
+
+# Shared by every trace in the process
+default_resolver = Resolver()
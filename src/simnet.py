@@ -0,0 +1,221 @@
+import heapq
+import random
+import threading
+from src.constants import DEFAULT_PROBE_PROTOCOL, PROBE_PROTOCOLS
+
+class Router:
+    """
+    One simulated hop: the address that answers probes expiring at it, and how it answers.
+
+    Args:
+        ip: Address in replies from this hop
+        rtt: Mean round-trip time to this hop in milliseconds
+        jitter: Spread of the RTT in milliseconds (standard deviation for "normal",
+            half-width for "uniform", mean queueing delay for "exponential")
+        distribution: "normal", "uniform" or "exponential" (rtt plus an exponential
+            tail, for congested links)
+        loss: Probability that a packet crossing this hop is dropped; applies to
+            every probe that reaches this hop or goes beyond it
+        rate_limit: ICMP replies per second this hop generates (None for unlimited)
+        burst: Token bucket depth for rate_limit (default: one second's worth)
+        silent: Never answer probes expiring here (still forwards traffic)
+    """
+
+    def __init__(self, ip, rtt=1.0, jitter=0.0, distribution="normal", loss=0.0,
+                 rate_limit=None, burst=None, silent=False):
+        if distribution not in ("normal", "uniform", "exponential"):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.ip = ip
+        self.rtt = rtt
+        self.jitter = jitter
+        self.distribution = distribution
+        self.loss = loss
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+        self.silent = silent
+        self.tokens = self.burst
+        self.refilled_at = 0.0
+
+    def sample_rtt(self, rng):
+        """Draw one RTT (ms) from this hop's latency distribution."""
+        if not self.jitter:
+            return self.rtt
+        if self.distribution == "normal":
+            rtt = rng.gauss(self.rtt, self.jitter)
+        elif self.distribution == "uniform":
+            rtt = rng.uniform(self.rtt - self.jitter, self.rtt + self.jitter)
+        else:
+            rtt = self.rtt + rng.expovariate(1 / self.jitter)
+        return max(rtt, self.rtt * 0.1)
+
+    def allow_reply(self, now):
+        """Take a token from the ICMP rate limiter at virtual time now (seconds)."""
+        if self.rate_limit is None:
+            return True
+        if now > self.refilled_at:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate_limit)
+            self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class SimulatedNetwork:
+    """
+    Deterministic in-process network for tracing without privileges or a real network.
+
+    A probe backend (see tracer.RawSocketBackend): pass it as backend= to
+    get_route, process_endpoint or run_benchmark. Each route is the list of
+    Routers a probe crosses, ending with the destination. Routers are shared
+    by address across routes, so rate limits apply to all traces crossing a
+    hop. Time is virtual: waiting for a reply advances the session's clock
+    instead of sleeping, so traces with timeouts finish in microseconds.
+
+    Results depend only on the seed and on the order of traces to each
+    destination; with concurrent traces, shared rate limiters are the one
+    source of ordering effects. TCP and UDP probes are answered like ICMP.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.routers = {}  # ip -> Router
+        self.routes = {}  # destination ip -> [Router, ...]
+        self.hostnames = {}  # hostname -> destination ip
+        self.trace_counts = {}  # destination ip -> number of sessions opened
+        self.clock = 0.0  # virtual seconds, advanced as sessions finish
+        self.rtt_history = {}  # dest_ip -> RttEstimator (see tracer.get_route)
+
+    def router(self, hop):
+        """Return the Router for a hop spec (Router, dict of Router args, or IP string)."""
+        if isinstance(hop, Router):
+            self.routers.setdefault(hop.ip, hop)
+            return self.routers[hop.ip]
+        if isinstance(hop, str):
+            hop = {"ip": hop}
+        if hop["ip"] not in self.routers:
+            self.routers[hop["ip"]] = Router(**hop)
+        return self.routers[hop["ip"]]
+
+    def add_route(self, hops, hostname=None):
+        """
+        Add a path; the last hop is the destination.
+
+        Args:
+            hops: Hop specs in TTL order (see router())
+            hostname: Name that resolves to the destination
+
+        Returns:
+            The destination IP
+        """
+        path = [self.router(hop) for hop in hops]
+        dest_ip = path[-1].ip
+        self.routes[dest_ip] = path
+        if hostname:
+            self.hostnames[hostname] = dest_ip
+        return dest_ip
+
+    @classmethod
+    def random_tree(cls, hostnames, seed=0, shared_hops=3, path_hops=(5, 12), loss=0.0,
+                    silent_rate=0.1, rate_limit=None):
+        """
+        Build a tree topology: a common access path, then one branch per host.
+
+        Args:
+            hostnames: Destination names (e.g. endpoint hosts)
+            seed: Seed for both the topology and the probe outcomes
+            shared_hops: Number of hops all destinations share
+            path_hops: (min, max) total hop count per destination
+            loss: Per-hop loss probability
+            silent_rate: Fraction of transit routers that never answer
+            rate_limit: ICMP replies per second per router (None for unlimited)
+
+        Returns:
+            SimulatedNetwork
+        """
+        network = cls(seed)
+        rng = random.Random(seed)
+        def hop(ip, rtt, transit=True):
+            return Router(ip, rtt=rtt, jitter=rtt * rng.uniform(0.05, 0.3),
+                          distribution=rng.choice(("normal", "uniform", "exponential")),
+                          loss=loss, rate_limit=rate_limit,
+                          silent=transit and rng.random() < silent_rate)
+
+        prefix = [hop(f"10.0.0.{ttl}", ttl * rng.uniform(0.5, 3), transit=ttl > 1)
+                  for ttl in range(1, shared_hops + 1)]
+        for branch, hostname in enumerate(hostnames, start=1):
+            path = list(prefix)
+            rtt = prefix[-1].rtt if prefix else 0.0
+            length = max(rng.randint(*path_hops), shared_hops + 1)
+            for ttl in range(shared_hops + 1, length + 1):
+                rtt += rng.uniform(0.5, 15)
+                path.append(hop(f"10.{branch}.{ttl}.1", rtt, transit=ttl < length))
+            network.add_route(path, hostname)
+        return network
+
+    def resolve(self, hostname):
+        if hostname in self.routes:
+            return hostname
+        if hostname not in self.hostnames:
+            raise OSError(f"Unknown host in simulated network: {hostname}")
+        return self.hostnames[hostname]
+
+    def open_session(self, dest_ip, protocol=DEFAULT_PROBE_PROTOCOL, port=None):
+        if protocol not in PROBE_PROTOCOLS:
+            raise ValueError(f"Unknown probe protocol: {protocol}")
+        if dest_ip not in self.routes:
+            raise OSError(f"No route to {dest_ip} in simulated network")
+        with self.lock:
+            count = self.trace_counts.get(dest_ip, 0)
+            self.trace_counts[dest_ip] = count + 1
+            start = self.clock
+        rng = random.Random(f"{self.seed}:{dest_ip}:{count}")
+        return SimulatedSession(self, dest_ip, self.routes[dest_ip], rng, start)
+
+class SimulatedSession:
+    """Probe session on a SimulatedNetwork; replies are scheduled on a virtual clock."""
+
+    def __init__(self, network, dest_ip, path, rng, start):
+        self.network = network
+        self.dest_ip = dest_ip
+        self.path = path
+        self.rng = rng
+        self.clock = start
+        self.in_flight = []  # heap of (arrival time, seq, ip, rtt_ms)
+
+    def now(self):
+        return self.clock
+
+    def send(self, ttl, seq):
+        # Probes with a TTL past the destination are answered by the destination
+        path = self.path[:ttl]
+        responder = path[-1]
+        if any(self.rng.random() < hop.loss for hop in path):
+            return
+        if responder.silent:
+            return
+        with self.network.lock:
+            if not responder.allow_reply(self.clock):
+                return
+        rtt = responder.sample_rtt(self.rng)
+        heapq.heappush(self.in_flight, (self.clock + rtt / 1000, seq, responder.ip, rtt))
+
+    def recv(self, timeout):
+        """Next reply within timeout, as (seq, ip, rtt_ms, "simulated"), else None."""
+        timeout = max(timeout, 0)
+        if not self.in_flight or self.in_flight[0][0] > self.clock + timeout:
+            self.clock += timeout
+            return None
+        arrival, seq, ip, rtt = heapq.heappop(self.in_flight)
+        self.clock = max(self.clock, arrival)
+        return seq, ip, rtt, "simulated"
+
+    def close(self):
+        with self.network.lock:
+            self.network.clock = max(self.network.clock, self.clock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -3,101 +3,995 @@ import os
 import sys
 import struct
 import time
-import select
-from src.constants import ICMP_ECHO_REQUEST, MAX_HOPS, TIMEOUT, TRIES
-from src.geo import cached_gethostbyname
+import errno
+import queue
+import threading
+import selectors
+from array import array
+from src.constants import (
+    ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY, ICMP_DEST_UNREACHABLE, ICMP_TIME_EXCEEDED,
+    MAX_HOPS, TIMEOUT, TRIES, PIPELINE_WINDOW, ADAPTIVE_TIMEOUT, MIN_TIMEOUT, MAX_SILENT_HOPS,
+    PROBE_PROTOCOLS, DEFAULT_PROBE_PROTOCOL, TCP_PROBE_PORT, UDP_BASE_PORT,
+    PREFIX_MAX_TTL, PREFIX_SAMPLE_HOSTS, PREFIX_CACHE_TTL, CANCEL_POLL_INTERVAL
+)
+from src.cancel import CancelToken
+from src.resolver import default_resolver
+from src.hop import Hop
+
+ICMP_HEADER = struct.Struct("bbHHh")
+ICMP_PAYLOAD = struct.Struct("d")
+# The payload as the little-endian words the checksum is computed over
+ICMP_PAYLOAD_WORDS = struct.Struct("<4H")
+
+def _word_sum(data):
+    """Sum of the 16-bit little-endian words of data (odd length is zero-padded)."""
+    if len(data) % 2:
+        data += b"\x00"
+    words = array("H", data)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return sum(words)
+
+def _fold(csum):
+    """Fold a word sum into the byte-swapped ones'-complement checksum."""
+    while csum >> 16:
+        csum = (csum & 0xffff) + (csum >> 16)
+    answer = ~csum & 0xffff
+    return answer >> 8 | (answer << 8 & 0xff00)
 
 def checksum(source_string):
-    csum = 0
-    countTo = (len(source_string) // 2) * 2
-    count = 0
-    while count < countTo:
-        thisVal = source_string[count+1] * 256 + source_string[count]
-        csum = csum + thisVal
-        csum = csum & 0xffffffff
-        count = count + 2
-    if countTo < len(source_string):
-        csum = csum + source_string[len(source_string) - 1]
-        csum = csum & 0xffffffff
-    csum = (csum >> 16) + (csum & 0xffff)
-    csum = csum + (csum >> 16)
-    answer = ~csum
-    answer = answer & 0xffff
-    answer = answer >> 8 | (answer << 8 & 0xff00)
-    return answer
-
-def build_packet():
-    my_id = os.getpid() & 0xFFFF
-    header = struct.pack("bbHHh", ICMP_ECHO_REQUEST, 0, 0, my_id, 1)
-    data = struct.pack("d", time.time())
+    return _fold(_word_sum(source_string))
+
+def build_packet(seq=1, my_id=None):
+    if my_id is None:
+        my_id = os.getpid() & 0xFFFF
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, my_id, seq)
+    data = ICMP_PAYLOAD.pack(time.time())
     my_checksum = checksum(header + data)
     if sys.platform == 'darwin':
         my_checksum = htons(my_checksum) & 0xffff
     else:
         my_checksum = htons(my_checksum)
-    header = struct.pack("bbHHh", ICMP_ECHO_REQUEST, 0, my_checksum, my_id, 1)
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, my_checksum, my_id, seq)
     return header + data
 
-def get_route(hostname):
+class PacketBuilder:
+    """
+    Builds echo-request probes for one ICMP id from cached header sums.
+
+    The word sum of the constant header fields plus each sequence number in
+    the trace's range is computed once; building a probe then only adds the
+    four words of the timestamp payload and folds, instead of packing the
+    header twice and checksumming the whole packet.
+    """
+
+    def __init__(self, my_id, seq_range=range(TRIES * MAX_HOPS + 1)):
+        self.my_id = my_id
+        self.seq_sums = {seq: self._header_sum(seq) for seq in seq_range}
+
+    def _header_sum(self, seq):
+        return _word_sum(ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, self.my_id, seq))
+
+    def build(self, seq, timestamp=None):
+        """Return the probe packet for seq, stamped with timestamp (default: now)."""
+        data = ICMP_PAYLOAD.pack(time.time() if timestamp is None else timestamp)
+        header_sum = self.seq_sums.get(seq)
+        if header_sum is None:
+            header_sum = self.seq_sums[seq] = self._header_sum(seq)
+        my_checksum = htons(_fold(header_sum + sum(ICMP_PAYLOAD_WORDS.unpack(data))))
+        return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, my_checksum, self.my_id, seq) + data
+
+def parse_reply(packet):
+    """
+    Work out which probe an ICMP packet answers.
+
+    Echo replies carry the probe's id/sequence directly; Time-Exceeded and
+    Destination-Unreachable messages quote the original IP header plus the
+    first 8 bytes of the probe: our echo request's id/sequence, or the
+    source/destination ports of a UDP or TCP probe.
+
+    Returns:
+        (icmp_type, packet_id, seq) for ICMP probes, (icmp_type, ("udp"|"tcp", src_port),
+        dst_port) for UDP/TCP probes, or None if the packet is not a reply to a probe
+    """
+    ip_header_len = (packet[0] & 0x0F) * 4
+    icmp_header = packet[ip_header_len:ip_header_len + 8]
+    if len(icmp_header) < 8:
+        return None
+    icmp_type, _, _, packet_id, seq = ICMP_HEADER.unpack(icmp_header)
+    if icmp_type == ICMP_ECHO_REPLY:
+        return icmp_type, packet_id, seq
+    if icmp_type in (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACHABLE):
+        inner = packet[ip_header_len + 8:]
+        if len(inner) < 20:
+            return None
+        inner_header_len = (inner[0] & 0x0F) * 4
+        inner_protocol = inner[9]
+        quoted = inner[inner_header_len:inner_header_len + 8]
+        if len(quoted) < 8:
+            return None
+        if inner_protocol in (IPPROTO_UDP, IPPROTO_TCP):
+            src_port, dst_port = struct.unpack("!HH", quoted[:4])
+            protocol = "udp" if inner_protocol == IPPROTO_UDP else "tcp"
+            return icmp_type, (protocol, src_port), dst_port
+        quoted_type, _, _, packet_id, seq = ICMP_HEADER.unpack(quoted)
+        if quoted_type != ICMP_ECHO_REQUEST:
+            return None
+        return icmp_type, packet_id, seq
+    return None
+
+def assemble_hops(first_ttl, last_ttl, dest_ttl, failures, replies):
+    """
+    Turn the outcome of a pipelined probe window into Hop records.
+
+    Args:
+        first_ttl, last_ttl: TTL range of the window
+        dest_ttl: TTL at which the destination answered, or None
+        failures: Dictionary of ttl to list of (attempt, status) for unanswered attempts
+        replies: Dictionary of ttl to (ip, rtt, attempt, clock) for answered TTLs
+
+    Returns:
+        List of Hops in the order the serial trace would produce
+    """
     hops = []
-    # Use cached DNS resolution
-    try:
-        print(f"Resolving hostname: {hostname}")
-        dest_ip = cached_gethostbyname(hostname)
-        print(f"Resolved {hostname} to {dest_ip}")
-    except Exception as e:
-        print(f"Error resolving hostname {hostname}: {e}")
-        return hops
-    
-    # Check socket permissions early
+    for ttl in range(first_ttl, last_ttl + 1):
+        if dest_ttl is not None and ttl > dest_ttl:
+            break
+        for attempt, status in failures.get(ttl, []):
+            hops.append(Hop(ttl, status=status, attempt=attempt))
+        if ttl in replies:
+            ip, rtt, attempt, clock = replies[ttl]
+            hops.append(Hop(ttl, ip, rtt, "success", attempt, clock))
+    return hops
+
+# Linux kernel timestamping (not all exported by the socket module)
+SO_TIMESTAMPNS = 35
+SO_TIMESTAMPING = 37
+SOF_TIMESTAMPING_TX_SOFTWARE = 1 << 1
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_OPT_ID = 1 << 7
+SOF_TIMESTAMPING_OPT_TSONLY = 1 << 11
+SO_EE_ORIGIN_TIMESTAMPING = 4
+TIMESPEC = struct.Struct("qq")
+SOCK_EXTENDED_ERR = struct.Struct("IBBBBII")
+# A kernel TX stamp further than this from the userland send time belongs to another probe
+MAX_TX_STAMP_SKEW_NS = 50_000_000
+MAX_PENDING_TX_STAMPS = 4096
+
+def enable_rx_timestamps(sock):
+    """Ask the kernel to stamp every received packet (SO_TIMESTAMPNS); False if unsupported."""
+    if not sys.platform.startswith("linux"):
+        return False
     try:
-        test_socket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
-        test_socket.close()
-    except PermissionError:
-        print("ERROR: Insufficient permissions to create raw socket. Run as administrator/root.")
-        error_hop = {
-            "ttl": 1, 
-            "ip": None, 
-            "rtt": None, 
-            "status": "error: Insufficient permissions. Run as root/administrator.",
-            "attempt": 1
-        }
-        hops.append(error_hop)
-        return hops
-    except Exception as e:
-        print(f"Error creating test socket: {e}")
-    
-    for ttl in range(1, MAX_HOPS + 1):
+        sock.setsockopt(SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return True
+    except OSError:
+        return False
+
+def rx_timestamp(ancdata):
+    """Kernel receive time in ns (CLOCK_REALTIME) from recvmsg ancillary data, or None."""
+    for level, cmsg_type, data in ancdata:
+        if level == SOL_SOCKET and cmsg_type == SO_TIMESTAMPNS and len(data) >= TIMESPEC.size:
+            sec, nsec = TIMESPEC.unpack(data[:TIMESPEC.size])
+            return sec * 1_000_000_000 + nsec
+    return None
+
+def probe_rtt(send_stamp, rx_kernel_ns, rx_perf_ns, tx_kernel_ns=None):
+    """
+    RTT of a probe from the best pair of timestamps available.
+
+    Args:
+        send_stamp: (time.time_ns(), time.perf_counter_ns()) taken just before sending
+        rx_kernel_ns: Kernel receive timestamp, or None
+        rx_perf_ns: perf_counter_ns() when the reply was read
+        tx_kernel_ns: Kernel transmit timestamp, or None
+
+    Returns:
+        (rtt_ms, clock) where clock is "kernel" (kernel TX and RX stamps),
+        "kernel_rx" (userland send time, kernel RX stamp) or "perf_counter"
+    """
+    if rx_kernel_ns is not None:
+        if tx_kernel_ns is not None:
+            return (rx_kernel_ns - tx_kernel_ns) / 1e6, "kernel"
+        return (rx_kernel_ns - send_stamp[0]) / 1e6, "kernel_rx"
+    return (rx_perf_ns - send_stamp[1]) / 1e6, "perf_counter"
+
+def allocate_probe_id():
+    """Hand out a distinct ICMP id for each trace in this process."""
+    global _next_probe_id
+    with _probe_id_lock:
+        _next_probe_id = (_next_probe_id + 1) & 0xFFFF
+        return _next_probe_id
+
+_next_probe_id = os.getpid() & 0xFFFF
+_probe_id_lock = threading.Lock()
+
+class ProbeSocketManager:
+    """
+    Long-lived raw ICMP socket shared by every trace in the process.
+
+    ICMP probes carry their TTL as per-packet ancillary data (falling back to
+    a locked setsockopt on kernels that reject it), so one socket serves all
+    TTLs, traces and threads. A dispatcher thread reads every ICMP packet
+    once and routes it to the session that owns the probe it quotes (by ICMP
+    id, or by source port for UDP/TCP probes). It also watches in-flight TCP
+    SYN probes, whose SYN-ACK or RST completes a non-blocking connect.
+
+    Where the kernel supports it, replies carry their kernel receive time and
+    ICMP probes their kernel transmit time (SO_TIMESTAMPING, matched to the
+    probe by the per-socket send counter), so RTTs do not include the time a
+    busy process takes to get around to reading the socket.
+    """
+
+    def __init__(self, sock=None):
+        """
+        Args:
+            sock: Socket to probe through (default: a new raw ICMP socket)
+        """
+        self.sock = sock if sock is not None else socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        self.send_lock = threading.Lock()
+        self.sessions = {}  # routing key -> queue of (key, value, ip, rx_kernel_ns, rx_perf_ns)
+        self.sessions_lock = threading.Lock()
+        self.ttl_cmsg = hasattr(self.sock, "sendmsg")
+        self.rx_timestamps = enable_rx_timestamps(self.sock)
+        self.tx_timestamps = self._enable_tx_timestamps()
+        self.tx_counter = 0  # kernel's SOF_TIMESTAMPING_OPT_ID of the next send
+        self.tx_pending = {}  # send counter -> (session, seq)
+        self.tx_lock = threading.Lock()  # Guards tx_pending between senders and the dispatcher
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.wakeup_recv, self.wakeup_send = socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ)
+        self.connect_requests = queue.Queue()  # (sock, key) to watch, (sock, None) to drop
+        self.closed = False
+        self.dispatcher = threading.Thread(target=self._dispatch, name="probe-dispatcher",
+                                           daemon=True)
+        self.dispatcher.start()
+
+    def _enable_tx_timestamps(self):
+        if not self.rx_timestamps:
+            return False
+        flags = (SOF_TIMESTAMPING_TX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE |
+                 SOF_TIMESTAMPING_OPT_ID | SOF_TIMESTAMPING_OPT_TSONLY)
+        try:
+            self.sock.setsockopt(SOL_SOCKET, SO_TIMESTAMPING, flags)
+            return True
+        except OSError:
+            return False
+
+    def open_session(self, dest_ip, protocol=DEFAULT_PROBE_PROTOCOL, port=None):
+        """Register a new trace and return its ProbeSession."""
+        return ProbeSession(self, dest_ip, protocol, port)
+
+    def route(self, key, replies):
+        """Deliver replies quoting key (ICMP id or (protocol, src_port)) to the replies queue."""
+        with self.sessions_lock:
+            self.sessions[key] = replies
+
+    def unroute(self, key):
+        with self.sessions_lock:
+            self.sessions.pop(key, None)
+
+    def send(self, packet, dest_ip, ttl, session=None, seq=None):
+        """Send one ICMP probe with the given TTL (session/seq receive its kernel TX stamp)."""
+        # Sends are serialized so the kernel's send counter identifies each TX stamp
+        with self.send_lock:
+            stamped = self.tx_timestamps and session is not None
+            if stamped:
+                # Registered before sending: the dispatcher may read the stamp before
+                # the send call returns
+                with self.tx_lock:
+                    self.tx_pending[self.tx_counter] = (session, seq)
+                    if len(self.tx_pending) > MAX_PENDING_TX_STAMPS:
+                        # Stamp never arrived; forget the oldest probe
+                        self.tx_pending.pop(next(iter(self.tx_pending)))
+            try:
+                self._send_packet(packet, dest_ip, ttl)
+            except Exception:
+                if stamped:
+                    with self.tx_lock:
+                        self.tx_pending.pop(self.tx_counter, None)
+                raise
+            if self.tx_timestamps:
+                self.tx_counter += 1
+
+    def _send_packet(self, packet, dest_ip, ttl):
+        """Put one packet on the wire with the given TTL (send_lock held)."""
+        if self.ttl_cmsg:
+            try:
+                self.sock.sendmsg([packet], [(IPPROTO_IP, IP_TTL, struct.pack('i', ttl))], 0,
+                                  (dest_ip, 0))
+                return
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                # Kernel does not accept IP_TTL as ancillary data
+                self.ttl_cmsg = False
+        self.sock.setsockopt(IPPROTO_IP, IP_TTL, struct.pack('I', ttl))
+        self.sock.sendto(packet, (dest_ip, 0))
+
+    def watch_connect(self, sock, key):
+        """Report the outcome of a TCP probe's non-blocking connect to the owner of key."""
+        self.connect_requests.put((sock, key))
+        self.wakeup_send.send(b"\0")
+
+    def drop_connect(self, sock):
+        """Stop watching a TCP probe and close its socket (from the dispatcher thread)."""
+        self.connect_requests.put((sock, None))
+        self.wakeup_send.send(b"\0")
+
+    def _deliver(self, key, value, ip, rx_kernel_ns, rx_perf_ns):
+        with self.sessions_lock:
+            replies = self.sessions.get(key)
+        if replies is not None:
+            replies.put((key, value, ip, rx_kernel_ns, rx_perf_ns))
+
+    def _dispatch(self):
+        """Route incoming ICMP packets and finished TCP connects to their sessions."""
+        while not self.closed:
+            for selector_key, _ in self.selector.select():
+                if selector_key.fileobj is self.sock:
+                    self._read_replies()
+                elif selector_key.fileobj is self.wakeup_recv:
+                    self._apply_connect_requests()
+                else:
+                    self._connect_done(selector_key)
+        self.selector.close()
+        self.sock.close()
+
+    def _read_replies(self):
+        received = []
+        while True:
+            try:
+                recvPacket, ancdata, _, addr = self.sock.recvmsg(1024, 256)
+            except (BlockingIOError, InterruptedError):
+                break
+            rx_perf_ns = time.perf_counter_ns()
+            reply = parse_reply(recvPacket)
+            if reply is not None:
+                received.append((reply[1], reply[2], addr[0], rx_timestamp(ancdata), rx_perf_ns))
+        if self.tx_timestamps:
+            # On fast paths the reply can be queued before the probe's TX stamp,
+            # so stamps are handed out before the replies they belong to
+            self._read_tx_timestamps()
+        for reply in received:
+            self._deliver(*reply)
+
+    def _read_tx_timestamps(self):
+        """Drain kernel TX stamps from the error queue and hand them to their sessions."""
+        while True:
+            try:
+                _, ancdata, _, _ = self.sock.recvmsg(0, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                return
+            tx_ns = counter = None
+            for level, cmsg_type, data in ancdata:
+                if level == SOL_SOCKET and cmsg_type == SO_TIMESTAMPING:
+                    sec, nsec = TIMESPEC.unpack(data[:TIMESPEC.size])  # software stamp
+                    tx_ns = sec * 1_000_000_000 + nsec
+                elif level == IPPROTO_IP and len(data) >= SOCK_EXTENDED_ERR.size:
+                    extended_err = SOCK_EXTENDED_ERR.unpack(data[:SOCK_EXTENDED_ERR.size])
+                    if extended_err[1] == SO_EE_ORIGIN_TIMESTAMPING:
+                        counter = extended_err[6]
+            with self.tx_lock:
+                probe = self.tx_pending.pop(counter, None)
+            if probe is not None and tx_ns is not None:
+                session, seq = probe
+                session.record_tx(seq, tx_ns)
+
+    def _apply_connect_requests(self):
+        try:
+            while self.wakeup_recv.recv(512):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                sock, key = self.connect_requests.get_nowait()
+            except queue.Empty:
+                return
+            if key is not None:
+                self.selector.register(sock, selectors.EVENT_WRITE, key)
+                continue
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass  # Already finished
+            sock.close()
+
+    def _connect_done(self, selector_key):
+        """A TCP probe's connect finished: SYN-ACK or RST, either way the destination answered."""
+        rx_perf_ns = time.perf_counter_ns()
+        sock = selector_key.fileobj
+        if sock.fileno() == -1:
+            return  # Dropped earlier in the same select() batch
+        self.selector.unregister(sock)
+        error = sock.getsockopt(SOL_SOCKET, SO_ERROR)
+        if error in (0, errno.ECONNREFUSED):
+            peer_ip = selector_key.data[2]
+            self._deliver(selector_key.data[:2], None, peer_ip, None, rx_perf_ns)
+        sock.close()
+
+    def close(self):
+        self.closed = True
+        self.wakeup_send.send(b"\0")
+
+class ProbeSession:
+    """
+    One trace's view of the shared manager: sends probes and receives their replies.
+
+    ICMP probes are echo requests on the shared raw socket. UDP probes go to
+    UDP_BASE_PORT + seq from a per-session socket, so the quoted destination
+    port identifies them; the destination answers with port-unreachable.
+    TCP probes are SYNs from a fresh non-blocking connect per probe, told
+    apart by source port; the destination answers with SYN-ACK or RST.
+    """
+
+    def __init__(self, manager, dest_ip, protocol=DEFAULT_PROBE_PROTOCOL, port=None):
+        if protocol not in PROBE_PROTOCOLS:
+            raise ValueError(f"Unknown probe protocol: {protocol}")
+        self.manager = manager
+        self.dest_ip = dest_ip
+        self.protocol = protocol
+        self.replies = queue.Queue()
+        self.sent = {}  # seq -> (time_ns, perf_counter_ns) taken just before sending
+        self.tx_stamps = {}  # seq -> kernel TX timestamp (ns)
+        self.keys = []  # routing keys registered with the manager
+        if protocol == "icmp":
+            self.packet_id = allocate_probe_id()
+            self.builder = PacketBuilder(self.packet_id)
+            self._route(self.packet_id)
+        elif protocol == "udp":
+            self.port = port or UDP_BASE_PORT
+            self.udp_sock = socket(AF_INET, SOCK_DGRAM)
+            self.udp_sock.bind(("", 0))
+            self._route(("udp", self.udp_sock.getsockname()[1]))
+        else:
+            self.port = port or TCP_PROBE_PORT
+            self.tcp_probes = {}  # src_port -> (seq, sock)
+
+    def _route(self, key):
+        self.manager.route(key, self.replies)
+        self.keys.append(key)
+
+    def send(self, ttl, seq):
+        packet = self.builder.build(seq) if self.protocol == "icmp" else None
+        # Recorded first: the dispatcher may deliver the reply before send() returns
+        self.sent[seq] = (time.time_ns(), time.perf_counter_ns())
+        try:
+            if self.protocol == "icmp":
+                self.manager.send(packet, self.dest_ip, ttl, self, seq)
+            elif self.protocol == "udp":
+                self.udp_sock.setsockopt(IPPROTO_IP, IP_TTL, ttl)
+                self.udp_sock.sendto(b"\0" * 8, (self.dest_ip, self.port + seq))
+            else:
+                self._send_syn(ttl, seq)
+        except Exception:
+            self.sent.pop(seq, None)
+            raise
+
+    def _send_syn(self, ttl, seq):
+        sock = socket(AF_INET, SOCK_STREAM)
+        try:
+            sock.setsockopt(IPPROTO_IP, IP_TTL, ttl)
+            sock.setblocking(False)
+            sock.bind(("", 0))
+            src_port = sock.getsockname()[1]
+            self._route(("tcp", src_port))
+            error = sock.connect_ex((self.dest_ip, self.port))
+            if error not in (0, errno.EINPROGRESS):
+                raise OSError(error, os.strerror(error))
+        except Exception:
+            sock.close()
+            raise
+        self.tcp_probes[src_port] = (seq, sock)
+        self.manager.watch_connect(sock, ("tcp", src_port, self.dest_ip))
+
+    def record_tx(self, seq, tx_ns):
+        """Kernel TX stamp for a probe (called from the dispatcher thread)."""
+        send_stamp = self.sent.get(seq)
+        if send_stamp is not None and abs(tx_ns - send_stamp[0]) < MAX_TX_STAMP_SKEW_NS:
+            self.tx_stamps[seq] = tx_ns
+
+    def _seq_of(self, key, value):
+        """Map a delivered reply back to the sequence number of its probe."""
+        if self.protocol == "icmp":
+            return value
+        if self.protocol == "udp":
+            return value - self.port
+        probe = self.tcp_probes.pop(key[1], None)
+        if probe is None:
+            return None
+        self.manager.drop_connect(probe[1])
+        return probe[0]
+
+    def recv(self, timeout):
+        """
+        Wait for the next reply to one of this session's probes.
+
+        Returns:
+            (seq, ip, rtt_ms, clock) tuple, or None if nothing arrived within
+            timeout; clock names the timestamps the RTT came from (see probe_rtt)
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                key, value, ip, rx_kernel_ns, rx_perf_ns = self.replies.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            seq = self._seq_of(key, value)
+            send_stamp = self.sent.pop(seq, None)
+            if send_stamp is not None:
+                rtt, clock = probe_rtt(send_stamp, rx_kernel_ns, rx_perf_ns,
+                                       self.tx_stamps.pop(seq, None))
+                return seq, ip, rtt, clock
+
+    def now(self):
+        """Clock (in seconds) the trace's probe deadlines are measured against."""
+        return time.time()
+
+    def close(self):
+        for key in self.keys:
+            self.manager.unroute(key)
+        if self.protocol == "udp":
+            self.udp_sock.close()
+        elif self.protocol == "tcp":
+            for _, sock in self.tcp_probes.values():
+                self.manager.drop_connect(sock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def get_socket_manager():
+    """Return the process-wide ProbeSocketManager, creating it on first use."""
+    global _socket_manager
+    with _socket_manager_lock:
+        if _socket_manager is None:
+            _socket_manager = ProbeSocketManager()
+        return _socket_manager
+
+_socket_manager = None
+_socket_manager_lock = threading.Lock()
+
+class RawSocketBackend:
+    """
+    Probe backend that sends real packets through the shared ProbeSocketManager.
+
+    A probe backend resolves host names and opens probe sessions; a session
+    has send(ttl, seq), recv(timeout), now() and close() and is a context
+    manager (see ProbeSession). src.simnet.SimulatedNetwork is the other
+    implementation.
+    """
+
+    def __init__(self):
+        self.rtt_history = {}  # dest_ip -> RttEstimator of the last trace to it
+
+    def resolve(self, hostname):
+        return default_resolver.resolve(hostname)
+
+    def open_session(self, dest_ip, protocol=DEFAULT_PROBE_PROTOCOL, port=None):
+        """Open a session on the shared sockets (raises PermissionError without root)."""
+        return get_socket_manager().open_session(dest_ip, protocol, port)
+
+raw_socket_backend = RawSocketBackend()
+
+class RateLimitedBackend:
+    """
+    Wraps a probe backend so all of its sessions share one probe budget.
+
+    Every probe waits for a token from the bucket (a ratelimit.TokenBucket)
+    before it is sent, which caps probes per second across all concurrent
+    traces and spreads a pipelined burst evenly over time.
+    """
+
+    def __init__(self, backend, bucket):
+        self.backend = backend
+        self.bucket = bucket
+        self.rtt_history = backend.rtt_history
+
+    def resolve(self, hostname):
+        return self.backend.resolve(hostname)
+
+    def open_session(self, dest_ip, protocol=DEFAULT_PROBE_PROTOCOL, port=None):
+        return RateLimitedSession(self.backend.open_session(dest_ip, protocol, port), self.bucket)
+
+class RateLimitedSession:
+    """Session of a RateLimitedBackend: the wrapped session, with send() paced by the bucket."""
+
+    def __init__(self, session, bucket):
+        self.session = session
+        self.bucket = bucket
+        self.dest_ip = session.dest_ip
+
+    def send(self, ttl, seq):
+        self.bucket.acquire()
+        self.session.send(ttl, seq)
+
+    def recv(self, timeout):
+        return self.session.recv(timeout)
+
+    def now(self):
+        return self.session.now()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Route(list):
+    """List of Hops (src.hop), plus why the trace stopped (see get_route)."""
+
+    def __init__(self, hops=(), stop_reason=None):
+        super().__init__(hops)
+        self.stop_reason = stop_reason
+
+class RttEstimator:
+    """
+    Smoothed RTT / RTT variance estimator (RFC 6298) used to size probe timeouts.
+
+    Seeded from the previous trace to the same destination when there is one,
+    and updated with every answered hop, so probes to silent hops only wait
+    as long as the path's observed RTT justifies instead of a fixed TIMEOUT.
+    """
+
+    def __init__(self, srtt=None, rttvar=None):
+        self.srtt = srtt  # ms
+        self.rttvar = rttvar  # ms
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def timeout(self):
+        """Probe timeout in seconds, clamped to [MIN_TIMEOUT, TIMEOUT]."""
+        if self.srtt is None:
+            return TIMEOUT
+        return min(TIMEOUT, max(MIN_TIMEOUT, (self.srtt + 4 * self.rttvar) / 1000))
+
+class FixedTimeout:
+    """Stand-in for RttEstimator when adaptive timeouts are disabled."""
+
+    def update(self, rtt):
+        pass
+
+    def timeout(self):
+        return TIMEOUT
+
+def _seed_estimator(backend, dest_ip):
+    """Start an estimator from the backend's last trace to dest_ip, if any."""
+    with _rtt_history_lock:
+        previous = backend.rtt_history.get(dest_ip)
+    if previous is None:
+        return RttEstimator()
+    return RttEstimator(previous.srtt, previous.rttvar)
+
+def _remember_estimator(backend, dest_ip, estimator):
+    if estimator.srtt is not None:
+        with _rtt_history_lock:
+            backend.rtt_history[dest_ip] = estimator
+
+_rtt_history_lock = threading.Lock()
+
+def _recv(session, deadline, cancel):
+    """
+    Wait for the session's next reply until deadline (on the session's clock).
+
+    With a cancel token the wait is sliced, so a cancelled or expired token
+    ends it within CANCEL_POLL_INTERVAL; the result is then None as for a
+    timeout, and the caller checks cancel.reason.
+    """
+    if cancel is None:
+        return session.recv(deadline - session.now())
+    while True:
+        wait = min(deadline - session.now(), CANCEL_POLL_INTERVAL)
+        remaining = cancel.remaining()
+        if remaining is not None:
+            wait = min(wait, max(remaining, 0))
+        reply = session.recv(wait)
+        if reply is not None or cancel.reason or session.now() >= deadline:
+            return reply
+
+def _stopped(hostname, hops, cancel):
+    """True (with hops.stop_reason set) if the trace was cancelled or ran out of time."""
+    reason = cancel.reason if cancel is not None else None
+    if reason:
+        print(f"Stopping trace to {hostname}: {reason}")
+        hops.stop_reason = reason
+    return bool(reason)
+
+def _trace_serial(hostname, session, estimator, max_silent_hops, start_ttl=1, max_ttl=MAX_HOPS,
+                  cancel=None):
+    """Trace a route one TTL at a time, waiting for each probe before sending the next."""
+    hops = Route()
+    dest_ip = session.dest_ip
+    silent_hops = 0
+    for ttl in range(start_ttl, max_ttl + 1):
         print(f"Tracing route to {hostname} with TTL={ttl}")
+        answered = False
         for attempt in range(TRIES):
-            mySocket = None
+            if _stopped(hostname, hops, cancel):
+                return hops
+            seq = attempt * MAX_HOPS + ttl
             try:
-                mySocket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
-                mySocket.setsockopt(IPPROTO_IP, IP_TTL, struct.pack('I', ttl))
-                mySocket.settimeout(TIMEOUT)
-                packet = build_packet()
-                mySocket.sendto(packet, (dest_ip, 0))
-                start_time = time.time()
-                whatReady = select.select([mySocket], [], [], TIMEOUT)
-                if whatReady[0] == []:  # Timeout
+                session.send(ttl, seq)
+                deadline = session.now() + estimator.timeout()
+                reply = None
+                while reply is None or reply[0] != seq:
+                    # Late replies to earlier probes are skipped
+                    reply = _recv(session, deadline, cancel)
+                    if reply is None:
+                        break
+                if reply is None and _stopped(hostname, hops, cancel):
+                    return hops  # Not a timeout: the wait was cut short
+                if reply is None:  # Timeout
                     print(f"  TTL={ttl}, Attempt={attempt+1}: Timeout")
-                    hops.append({"ttl": ttl, "ip": None, "rtt": None, "status": "timeout", "attempt": attempt + 1})
+                    hops.append(Hop(ttl, status="timeout", attempt=attempt + 1))
                     continue
-                recvPacket, addr = mySocket.recvfrom(1024)
-                rtt = (time.time() - start_time) * 1000  # ms
-                print(f"  TTL={ttl}, Attempt={attempt+1}: Success, IP={addr[0]}, RTT={rtt:.2f}ms")
-                hops.append({"ttl": ttl, "ip": addr[0], "rtt": rtt, "status": "success", "attempt": attempt + 1})
-                if addr[0] == dest_ip:  # Reached destination
+                _, ip, rtt, clock = reply
+                print(f"  TTL={ttl}, Attempt={attempt+1}: Success, IP={ip}, RTT={rtt:.2f}ms")
+                hops.append(Hop(ttl, ip, rtt, "success", attempt + 1, clock))
+                estimator.update(rtt)
+                answered = True
+                if ip == dest_ip:  # Reached destination
                     print(f"Reached destination {dest_ip}")
+                    hops.stop_reason = "destination_reached"
                     return hops
                 break
             except Exception as e:
                 print(f"  TTL={ttl}, Attempt={attempt+1}: Error: {str(e)}")
-                hops.append({"ttl": ttl, "ip": None, "rtt": None, "status": f"error: {str(e)}", "attempt": attempt + 1})
+                hops.append(Hop(ttl, status=f"error: {str(e)}", attempt=attempt + 1))
                 break
-            finally:
-                if mySocket:
-                    mySocket.close()
-    
+
+        silent_hops = 0 if answered else silent_hops + 1
+        if max_silent_hops and silent_hops >= max_silent_hops:
+            print(f"Stopping trace to {hostname}: {silent_hops} consecutive silent hops")
+            hops.stop_reason = "silent_hops"
+            return hops
+
+    print(f"Completed route trace to {hostname}, collected {len(hops)} hops")
+    hops.stop_reason = "max_hops"
+    return hops
+
+def _trace_pipelined(hostname, session, estimator, max_silent_hops, window=PIPELINE_WINDOW,
+                     start_ttl=1, max_ttl=MAX_HOPS, cancel=None):
+    """
+    Trace a route by firing probes for a whole window of TTLs at once.
+
+    All probes of the session are told apart by their ICMP sequence number,
+    so a window completes in roughly one max-RTT plus the probe timeout
+    instead of the sum of per-hop waits. Hops are returned in the same order
+    and shape as the serial trace produces.
+    """
+    hops = Route()
+    dest_ip = session.dest_ip
+    dest_ttl = None
+    last_answered = start_ttl - 1  # highest TTL that answered so far
+    first_ttl = start_ttl
+    while first_ttl <= max_ttl and dest_ttl is None:
+        last_ttl = min(first_ttl + window - 1, max_ttl)
+        print(f"Tracing route to {hostname} with TTL={first_ttl}..{last_ttl} (pipelined)")
+        replies = {}  # ttl -> (ip, rtt, attempt, clock)
+        failures = {ttl: [] for ttl in range(first_ttl, last_ttl + 1)}
+        errored = set()  # like the serial trace, a send error ends retries for that TTL
+
+        for attempt in range(TRIES):
+            if _stopped(hostname, hops, cancel):
+                break
+            pending = {}  # seq -> ttl
+            for ttl in range(first_ttl, last_ttl + 1):
+                if ttl in replies or ttl in errored:
+                    continue
+                if dest_ttl is not None and ttl > dest_ttl:
+                    continue
+                if attempt and max_silent_hops and ttl > last_answered + max_silent_hops:
+                    continue  # Past a silent tail; a retry would be cut off anyway
+                # Sequence numbers are unique per (ttl, attempt) across the whole trace
+                seq = attempt * MAX_HOPS + ttl
+                try:
+                    session.send(ttl, seq)
+                    pending[seq] = ttl
+                except Exception as e:
+                    print(f"  TTL={ttl}, Attempt={attempt+1}: Error: {str(e)}")
+                    failures[ttl].append((attempt + 1, f"error: {str(e)}"))
+                    errored.add(ttl)
+
+            deadline = session.now() + estimator.timeout()
+            while pending:
+                reply = _recv(session, deadline, cancel)
+                if reply is None:  # Timeout
+                    break
+                seq, ip, rtt, clock = reply
+                if seq not in pending:
+                    continue  # Late reply to an earlier attempt
+                ttl = pending.pop(seq)
+                print(f"  TTL={ttl}, Attempt={attempt+1}: Success, IP={ip}, RTT={rtt:.2f}ms")
+                replies[ttl] = (ip, rtt, attempt + 1, clock)
+                last_answered = max(last_answered, ttl)
+                estimator.update(rtt)
+                # Deeper hops are due within one timeout of this reply
+                deadline = min(deadline, session.now() + estimator.timeout())
+                if ip == dest_ip and (dest_ttl is None or ttl < dest_ttl):
+                    dest_ttl = ttl
+                    # Probes beyond the destination will never be answered
+                    pending = {s: t for s, t in pending.items() if t < dest_ttl}
+
+            if _stopped(hostname, hops, cancel):
+                break  # Unanswered probes were cut short, not timed out
+            for ttl in pending.values():
+                print(f"  TTL={ttl}, Attempt={attempt+1}: Timeout")
+                failures[ttl].append((attempt + 1, "timeout"))
+            if not pending:
+                break
+
+        hops.extend(assemble_hops(first_ttl, last_ttl, dest_ttl, failures, replies))
+        first_ttl = last_ttl + 1
+        if hops.stop_reason:
+            return hops
+
+        if dest_ttl is None and max_silent_hops and first_ttl - 1 - last_answered >= max_silent_hops:
+            print(f"Stopping trace to {hostname}: {max_silent_hops} consecutive silent hops")
+            hops[:] = [h for h in hops if h["ttl"] <= last_answered + max_silent_hops]
+            hops.stop_reason = "silent_hops"
+            return hops
+
+    if dest_ttl is not None:
+        print(f"Reached destination {dest_ip}")
+        hops.stop_reason = "destination_reached"
+    else:
+        hops.stop_reason = "max_hops"
     print(f"Completed route trace to {hostname}, collected {len(hops)} hops")
     return hops
+
+def get_route(hostname, pipelined=False, window=PIPELINE_WINDOW, adaptive_timeout=ADAPTIVE_TIMEOUT,
+              max_silent_hops=MAX_SILENT_HOPS, protocol=DEFAULT_PROBE_PROTOCOL, port=None,
+              max_ttl=MAX_HOPS, prefix_hops=None, backend=None, cancel=None, trace_timeout=None):
+    """
+    Trace the route to a host.
+
+    By default probes go through the process-wide ProbeSocketManager, so no
+    sockets are created per trace or per probe.
+
+    Args:
+        hostname: Host name or IP address to trace
+        pipelined: Probe a window of TTLs at once instead of one TTL at a time
+        window: Number of TTLs in flight per burst in pipelined mode
+        adaptive_timeout: Size probe timeouts from the observed RTT instead of TIMEOUT
+        max_silent_hops: Stop after this many consecutive unanswered TTLs (0 disables)
+        protocol: Probe protocol, one of PROBE_PROTOCOLS ("icmp", "tcp" or "udp")
+        port: Destination port for TCP probes / base port for UDP probes
+        max_ttl: Highest TTL to probe
+        prefix_hops: Hops every destination shares (see SharedPrefixCache); they are
+            copied into the result and probing starts at the first TTL after them
+        backend: Probe backend to trace with (default: raw_socket_backend); e.g. a
+            src.simnet.SimulatedNetwork to trace without privileges or a network
+        cancel: src.cancel.CancelToken that aborts the trace, keeping the hops so far
+        trace_timeout: Seconds the trace may take at most (None: no limit)
+
+    Returns:
+        Route (a list of Hops: one per attempt that timed out or
+        errored, plus one per answered TTL) whose stop_reason is one of
+        "destination_reached", "silent_hops", "max_hops", "dns_error",
+        "permission_error", or "cancelled" / "deadline" for a trace cut short
+    """
+    if trace_timeout is not None:
+        cancel = cancel.child(trace_timeout) if cancel is not None else CancelToken(trace_timeout)
+    hops = Route()
+    backend = backend or raw_socket_backend
+    # Use cached DNS resolution
+    try:
+        print(f"Resolving hostname: {hostname}")
+        dest_ip = backend.resolve(hostname)
+        print(f"Resolved {hostname} to {dest_ip}")
+    except Exception as e:
+        print(f"Error resolving hostname {hostname}: {e}")
+        hops.stop_reason = "dns_error"
+        return hops
+    
+    try:
+        session = backend.open_session(dest_ip, protocol, port)
+    except PermissionError:
+        print("ERROR: Insufficient permissions to create raw socket. Run as administrator/root.")
+        hops.append(Hop(1, status="error: Insufficient permissions. Run as root/administrator."))
+        hops.stop_reason = "permission_error"
+        return hops
+    
+    estimator = _seed_estimator(backend, dest_ip) if adaptive_timeout else FixedTimeout()
+    # A destination inside the shared prefix (e.g. our own gateway) is traced from scratch
+    if not prefix_hops or dest_ip in {h["ip"] for h in prefix_hops}:
+        prefix_hops = []
+    start_ttl = max((h["ttl"] for h in prefix_hops), default=0) + 1
+    for hop in prefix_hops:
+        if hop["status"] == "success":
+            estimator.update(hop["rtt"])
+    if prefix_hops:
+        print(f"Reusing {start_ttl - 1} shared prefix hops, tracing {hostname} from TTL={start_ttl}")
+
+    with session:
+        if pipelined:
+            hops = _trace_pipelined(hostname, session, estimator, max_silent_hops, window,
+                                    start_ttl, max_ttl, cancel)
+        else:
+            hops = _trace_serial(hostname, session, estimator, max_silent_hops, start_ttl, max_ttl,
+                                 cancel)
+    hops[:0] = [hop.copy() for hop in prefix_hops]
+    if adaptive_timeout:
+        _remember_estimator(backend, dest_ip, estimator)
+    return hops
+
+def discover_common_prefix(hostnames, max_ttl=PREFIX_MAX_TTL, samples=PREFIX_SAMPLE_HOSTS,
+                           backend=None, cancel=None):
+    """
+    Find the hops at the start of the path that all destinations share.
+
+    Traces the first max_ttl TTLs towards a few of the hosts and keeps the
+    leading TTLs where every sample was answered by the same router and no
+    sample had reached its destination yet.
+
+    Returns:
+        List of Hops (from the first sample, marked "shared_prefix"),
+        empty if fewer than two hosts were given, nothing is shared or the
+        discovery was cancelled
+    """
+    hostnames = list(dict.fromkeys(hostnames))[:samples]
+    if len(hostnames) < 2:
+        return []
+    traces = [get_route(host, pipelined=True, max_silent_hops=0, max_ttl=max_ttl, backend=backend,
+                        cancel=cancel)
+              for host in hostnames]
+    if cancel is not None and cancel.reason:
+        return []
+    answered = [{h["ttl"]: h["ip"] for h in trace if h["status"] == "success"} for trace in traces]
+    # TTL at which each sample reached its destination
+    reached = [max(a) if trace.stop_reason == "destination_reached" else max_ttl + 1
+               for trace, a in zip(traces, answered)]
+
+    prefix_len = 0
+    for ttl in range(1, min(reached)):
+        ips = {a.get(ttl) for a in answered}
+        if len(ips) != 1 or None in ips:
+            break
+        prefix_len = ttl
+    print(f"Discovered {prefix_len} shared prefix hops")
+    return [hop.copy(shared_prefix=True) for hop in traces[0] if hop["ttl"] <= prefix_len]
+
+class SharedPrefixCache:
+    """
+    Shared path prefix (our LAN/ISP hops), discovered once and reused for a while.
+
+    Every destination's trace starts with the same first few hops, so they
+    are probed once per validity window instead of once per endpoint and run.
+    """
+
+    def __init__(self, max_age=PREFIX_CACHE_TTL, backend=None):
+        self.max_age = max_age
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.hops = None
+        self.expires = 0
+
+    def get(self, hostnames, cancel=None):
+        """Cached prefix hops, rediscovered towards hostnames once stale."""
+        with self.lock:
+            if self.hops is None or time.time() >= self.expires:
+                hops = discover_common_prefix(hostnames, backend=self.backend, cancel=cancel)
+                if cancel is not None and cancel.reason:
+                    return hops  # Cut short: try again next time
+                self.hops = hops
+                self.expires = time.time() + self.max_age
+            return self.hops
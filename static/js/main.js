@@ -1,5 +1,6 @@
 $(document).ready(function() {
     let pollingInterval;
+    let progressEvents;
     const progressBar = $('#progressBar');
     const progressText = $('#progressText');
     const progressDetails = $('#progressDetails');
@@ -63,6 +64,7 @@ $(document).ready(function() {
         
         // Get number of runs from form
         const numRuns = parseInt($('#numRuns').val()) || 3;
+        const protocol = $('#probeProtocol').val() || null;
         
         if (selectedProviders.length === 0) {
             showToast('Please select at least one cloud provider');
@@ -95,12 +97,13 @@ $(document).ready(function() {
             contentType: 'application/json',
             data: JSON.stringify({
                 providers: selectedProviders,
-                num_runs: numRuns
+                num_runs: numRuns,
+                protocol: protocol
             }),
             success: function(response) {
                 console.log('Benchmark started:', response);
-                // Start polling for status updates
-                startPolling();
+                // Subscribe to progress updates
+                subscribeToProgress();
             },
             error: function(error) {
                 console.error('Error starting benchmark:', error);
@@ -155,8 +158,8 @@ $(document).ready(function() {
                     progressContainer.removeClass('d-none');
                     startBtn.prop('disabled', true);
                     
-                    // Start polling for updates
-                    startPolling();
+                    // Subscribe to progress updates
+                    subscribeToProgress();
                     
                     // Update UI with current progress
                     updateProgress(data.progress);
@@ -168,14 +171,46 @@ $(document).ready(function() {
         });
     }
     
-    function startPolling() {
-        // Clear existing interval if any
+    function subscribeToProgress() {
+        stopUpdates();
+        
+        if (!window.EventSource) {
+            // Fall back to polling every second
+            pollingInterval = setInterval(pollStatus, 1000);
+            return;
+        }
+        
+        // The server pushes every progress change and closes the stream when done
+        progressEvents = new EventSource('/benchmark/events');
+        progressEvents.onmessage = function(event) {
+            const progress = JSON.parse(event.data);
+            console.log('Progress event:', progress);
+            
+            if ((progress.status === 'complete' && progress.progress >= 100) ||
+                progress.status === 'cancelled') {
+                // A cancelled benchmark still has its partial results to show
+                showCompletion();
+            } else if (progress.status === 'error') {
+                showError(progress.error || 'Unknown error occurred');
+            } else {
+                updateProgress(progress);
+            }
+        };
+        progressEvents.onerror = function(error) {
+            // EventSource reconnects by itself
+            console.error('Progress stream error:', error);
+        };
+    }
+    
+    function stopUpdates() {
+        if (progressEvents) {
+            progressEvents.close();
+            progressEvents = null;
+        }
         if (pollingInterval) {
             clearInterval(pollingInterval);
+            pollingInterval = null;
         }
-        
-        // Poll every second
-        pollingInterval = setInterval(pollStatus, 1000);
     }
     
     function pollStatus() {
@@ -196,6 +231,9 @@ $(document).ready(function() {
                         // Wait for one more poll if status is complete but progress < 100%
                         updateProgress(data.progress);
                     }
+                } else if (data.progress && data.progress.status === 'cancelled') {
+                    // Show the partial results
+                    showCompletion();
                 } else if (data.progress && data.progress.status === 'error') {
                     // Show error
                     showError(data.progress.error || 'Unknown error occurred');
@@ -267,11 +305,8 @@ $(document).ready(function() {
     }
     
     function showCompletion() {
-        // Stop polling
-        if (pollingInterval) {
-            clearInterval(pollingInterval);
-            pollingInterval = null;
-        }
+        // Stop listening for progress
+        stopUpdates();
         
         // Update UI
         progressBar.css('width', '100%').attr('aria-valuenow', 100)
@@ -303,11 +338,8 @@ $(document).ready(function() {
     }
     
     function showError(message) {
-        // Stop polling
-        if (pollingInterval) {
-            clearInterval(pollingInterval);
-            pollingInterval = null;
-        }
+        // Stop listening for progress
+        stopUpdates();
         
         // Update UI
         runningAlert.removeClass('alert-info').addClass('alert-danger')
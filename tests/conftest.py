@@ -1,5 +1,10 @@
+import errno
+import socket
+import struct
+import threading
 import pytest
-from src.tracer import get_route
+from src.constants import ICMP_ECHO_REPLY, ICMP_TIME_EXCEEDED
+from src.tracer import get_route, ICMP_HEADER
 
 @pytest.fixture
 def mock_traceroute(monkeypatch):
@@ -8,4 +13,81 @@ def mock_traceroute(monkeypatch):
             {"ttl": 1, "ip": "192.168.1.1", "rtt": 10.0, "status": "success", "attempt": 1, "location": None},
             {"ttl": 2, "ip": "10.0.0.1", "rtt": 20.0, "status": "success", "attempt": 1, "location": None}
         ]
-    monkeypatch.setattr("tests.test_tracer.get_route", mock_get_route)
\ No newline at end of file
+    monkeypatch.setattr("tests.test_tracer.get_route", mock_get_route)
+
+def _ip_header(protocol=socket.IPPROTO_ICMP):
+    return bytes([0x45]) + bytes(8) + bytes([protocol]) + bytes(10)
+
+class FakeIcmpSocket:
+    """
+    Raw ICMP socket stand-in that answers echo requests along fixed paths.
+
+    routes maps a destination IP to the addresses answering TTL 1, 2, ... (None
+    for a silent hop); the last is the destination, which answers any larger
+    TTL with an echo reply. Replies are queued on a socketpair, so the socket
+    can be selected on or registered with an event loop like the real one.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.reader, self.writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.reader.setblocking(False)
+        self.ttl = 64
+        self.sent = []  # (dest_ip, ttl, packet_id, seq)
+        self.lock = threading.Lock()
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def setblocking(self, flag):
+        pass
+
+    def setsockopt(self, level, option, value):
+        if (level, option) != (socket.IPPROTO_IP, socket.IP_TTL):
+            raise OSError(errno.ENOPROTOOPT, "Not supported by the fake socket")
+        self.ttl = struct.unpack("I", value)[0]
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        self._answer(b"".join(buffers), address[0], struct.unpack("i", ancdata[0][2])[0])
+
+    def sendto(self, packet, address):
+        self._answer(packet, address[0], self.ttl)
+
+    def _answer(self, probe, dest_ip, ttl):
+        _, _, _, packet_id, seq = ICMP_HEADER.unpack(probe[:8])
+        with self.lock:
+            self.sent.append((dest_ip, ttl, packet_id, seq))
+        path = self.routes[dest_ip]
+        responder = path[min(ttl, len(path)) - 1]
+        if responder is not None:
+            self.deliver(responder, probe, echo=ttl >= len(path))
+
+    def deliver(self, ip, probe, echo=False):
+        """Queue the reply from ip to a probe: echo reply, else Time-Exceeded quoting it"""
+        if echo:
+            _, _, _, packet_id, seq = ICMP_HEADER.unpack(probe[:8])
+            icmp = ICMP_HEADER.pack(ICMP_ECHO_REPLY, 0, 0, packet_id, seq) + probe[8:]
+        else:
+            icmp = ICMP_HEADER.pack(ICMP_TIME_EXCEEDED, 0, 0, 0, 0) + _ip_header() + probe[:8]
+        self.writer.send(socket.inet_aton(ip) + _ip_header() + icmp)
+
+    def recvmsg(self, bufsize, ancbufsize=0, flags=0):
+        if flags & socket.MSG_ERRQUEUE:
+            raise BlockingIOError
+        data = self.reader.recv(bufsize + 4)
+        return data[4:], [], 0, (socket.inet_ntoa(data[:4]), 0)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+@pytest.fixture
+def fake_icmp_socket():
+    """Factory of FakeIcmpSocket(routes), closed after the test"""
+    sockets = []
+    def make(routes):
+        sockets.append(FakeIcmpSocket(routes))
+        return sockets[-1]
+    yield make
+    for sock in sockets:
+        sock.close()
@@ -0,0 +1,89 @@
+import pytest
+from src.aggregate import hop_statistics, confidence_interval
+from src.benchmark import _aggregate_endpoint, aggregate_runs
+
+def _run(hops, stop_reason="destination_reached"):
+    hops = [{"ttl": ttl, "ip": ip, "rtt": rtt, "status": "success" if ip else "timeout", "attempt": 1}
+            for ttl, ip, rtt in hops]
+    return {"data": {"hops": hops, "stop_reason": stop_reason}}
+
+def test_hop_statistics_percentiles_jitter_and_loss():
+    runs = [_run([(1, "10.0.0.1", rtt), (2, "8.8.8.8", rtt * 10)]) for rtt in (1.0, 3.0, 2.0, 4.0)]
+    runs.append(_run([(1, None, None), (1, None, None), (2, None, None)], "silent_hops"))
+    stats = hop_statistics(runs)
+
+    first, second = stats["hop_stats"]
+    assert first["ip"] == "10.0.0.1" and first["samples"] == 4
+    assert first["rtt_p50"] == pytest.approx(2.5)
+    assert first["rtt_min"] == 1.0 and first["rtt_max"] == 4.0
+    assert first["jitter"] == pytest.approx((2 + 1 + 2) / 3)
+    assert first["loss"] == pytest.approx(2 / 6 * 100)
+    assert second["rtt_p99"] == pytest.approx(39.7)
+
+    end_to_end = stats["end_to_end"]
+    assert end_to_end["samples"] == 4 and end_to_end["loss"] == 20.0
+    assert end_to_end["rtt_mean"] == pytest.approx(25.0)
+
+def test_hop_statistics_route_flaps():
+    paths = ["10.0.0.1", "10.0.0.2", "10.0.0.1", "10.0.0.1"]
+    runs = [_run([(1, "192.168.1.1", 1.0), (2, ip, 5.0), (3, "1.1.1.1", 9.0)]) for ip in paths]
+    stats = hop_statistics(runs)
+    assert stats["route_flaps"] == [2]
+    flapping = stats["hop_stats"][1]
+    assert flapping["ip"] == "10.0.0.1"
+    assert flapping["ips"] == {"10.0.0.1": 3, "10.0.0.2": 1}
+    assert flapping["flaps"] == 2
+
+def test_shared_prefix_hops_counted_once():
+    prefix = {"ttl": 1, "ip": "192.168.1.1", "rtt": 0.5, "status": "success", "attempt": 1,
+              "shared_prefix": True}
+    runs = [_run([(2, "8.8.8.8", rtt)]) for rtt in (10.0, 12.0, 14.0)]
+    for run in runs:
+        run["data"]["hops"].insert(0, dict(prefix))
+    first, second = hop_statistics(runs)["hop_stats"]
+    assert first["shared_prefix"] and first["samples"] == 1 and first["loss"] == 0.0
+    assert first["jitter"] is None and "shared_prefix" not in second
+    assert second["samples"] == 3
+
+def test_failed_runs_count_towards_end_to_end_loss():
+    runs = []
+    for hops in ([(1, "10.0.0.1", 1.0)], [(1, "10.0.0.1", 2.0)], []):
+        run = _run(hops)
+        run["data"].update({"hop_count": len(hops), "avg_rtt_ms": 1.0, "max_rtt_ms": 1.0,
+                            "min_rtt_ms": 1.0, "success_rate": 100, "packet_loss": 0,
+                            "countries_traversed": 0, "benchmark_duration": 0.1})
+        runs.append(run)
+    # A run that got no route carries only a placeholder hop
+    runs[2]["data"]["hops"] = [{"ttl": 1, "ip": "127.0.0.1", "rtt": 1.0, "attempt": 1,
+                                "status": "error: No route data available."}]
+    runs[2]["data"]["stop_reason"] = None
+    aggregated = _aggregate_endpoint("x", runs)
+    assert aggregated["runs_used"] == 2
+    assert aggregated["end_to_end"]["loss"] == pytest.approx(100 / 3)
+    assert aggregated["hop_stats"][0]["loss"] == 0.0
+
+def test_aggregate_runs_includes_hop_statistics():
+    runs = []
+    for rtt in (1.0, 2.0):
+        run = _run([(1, "10.0.0.1", rtt)])
+        run["data"].update({"hop_count": 1, "avg_rtt_ms": rtt, "max_rtt_ms": rtt, "min_rtt_ms": rtt,
+                            "success_rate": 100, "packet_loss": 0, "countries_traversed": 0,
+                            "benchmark_duration": 0.1})
+        runs.append(run)
+    aggregated = aggregate_runs(runs)
+    assert aggregated["avg_rtt_ms"] == 1.5
+    assert aggregated["hop_stats"][0]["rtt_mean"] == 1.5
+    assert aggregated["end_to_end"]["samples"] == 2
+
+def test_confidence_interval():
+    ci = confidence_interval([10, 12, 11, 13, 9])
+    assert ci["estimate"] == pytest.approx(11)
+    assert ci["half_width"] == pytest.approx(2.776 * 1.5811 / 5 ** 0.5, rel=1e-3)
+    assert ci["low"] < 11 < ci["high"]
+    assert confidence_interval([10]) is None
+
+    p95 = confidence_interval(range(100), "p95")
+    assert p95["low"] <= p95["estimate"] <= p95["high"]
+    assert p95 == confidence_interval(range(100), "p95")
+    with pytest.raises(ValueError):
+        confidence_interval([1, 2], "median")
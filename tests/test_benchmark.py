@@ -1,8 +1,174 @@
-from src.benchmark import run_benchmark
+import asyncio
+import json
+import threading
+import time
+from src import benchmark
+from src.benchmark import run_benchmark, async_run_benchmark, iter_benchmark, aiter_benchmark
+from src.async_tracer import AsyncTracer
+from src.simnet import SimulatedNetwork
+from src.progress import progress_bus
+from src.cancel import CancelToken
 
-def test_run_benchmark_mock():
+def test_run_benchmark_mock(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
     # Mock endpoints and traceroute results
     endpoints = {"test.com": "127.0.0.1"}
-    results = run_benchmark(endpoints)
+    network = SimulatedNetwork()
+    network.add_route(["192.168.1.1", {"ip": "127.0.0.1", "rtt": 5.0}])
+    results = run_benchmark(endpoints, backend=network)
     assert "127.0.0.1" in results
     assert "hop_count" in results["127.0.0.1"]
+    assert results["127.0.0.1"]["hop_count"] == 2
+
+def test_run_benchmark_simulated_shares_prefix(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    endpoints = {"a": "a.example", "b": "b.example", "c": "c.example"}
+    network = SimulatedNetwork.random_tree(endpoints.values(), seed=3, silent_rate=0)
+    results = run_benchmark(endpoints, num_runs=2, backend=network)
+    assert set(results) == set(endpoints.values())
+    for result in results.values():
+        assert result["stop_reason"] == "destination_reached"
+        assert [hop["ip"] for hop in result["hops"][:3]] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+ASYNC_ROUTES = {"192.0.2.1": ["10.0.0.1", "10.1.0.1", "192.0.2.1"],
+                "192.0.2.2": ["10.0.0.1", None, "10.2.0.1", "192.0.2.2"]}
+
+def test_async_run_benchmark(tmp_path, monkeypatch, fake_icmp_socket):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    monkeypatch.setattr("src.async_tracer.TIMEOUT", 0.2)
+    sock = fake_icmp_socket(ASYNC_ROUTES)
+    tracer = AsyncTracer(sock)
+    active = peak = 0
+    trace = tracer.trace
+    async def counted_trace(hostname):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        try:
+            return await trace(hostname)
+        finally:
+            active -= 1
+    tracer.trace = counted_trace
+    endpoints = {"a": "192.0.2.1", "b": "192.0.2.2"}
+    results = asyncio.run(async_run_benchmark(endpoints, num_runs=3, concurrency=2,
+                                              tracer=tracer))
+
+    assert peak == 2  # Six traces, never more than two in flight
+    a, b = results["192.0.2.1"], results["192.0.2.2"]
+    assert [hop["ip"] for hop in a["hops"]] == ["10.0.0.1", "10.1.0.1", "192.0.2.1"]
+    # The silent TTL was tried twice, the others answered at once
+    assert [(hop["ttl"], hop["status"]) for hop in b["hops"]] == [
+        (1, "success"), (2, "timeout"), (2, "timeout"), (3, "success"), (4, "success")]
+    assert a["runs_used"] == b["runs_used"] == 3 and b["hop_count"] == 3
+    assert a["stop_reason"] == b["stop_reason"] == "destination_reached"
+    assert b["end_to_end"]["samples"] == 3 and b["end_to_end"]["loss"] == 0.0
+    assert b["end_to_end"]["rtt_mean"] is not None
+    # Every trace probed with its own ICMP id
+    assert len({packet_id for _, _, packet_id, _ in sock.sent}) == 6
+
+def test_run_benchmark_parallel_matches_sequential(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    endpoints = {f"p{i}": f"p{i}.example" for i in range(6)}
+    def run(**options):
+        network = SimulatedNetwork.random_tree(endpoints.values(), seed=5, loss=0.05)
+        return run_benchmark(endpoints, num_runs=3, backend=network, **options)
+    sequential = run()
+    parallel = run(parallel=True, max_workers=4)
+    assert list(parallel) == list(sequential)
+    for host, result in sequential.items():
+        assert parallel[host]["hops"] == result["hops"]
+        assert parallel[host]["avg_rtt_ms"] == result["avg_rtt_ms"]
+
+    overlapping = run(parallel=True, serialize_per_host=False)
+    assert set(overlapping) == set(sequential)
+    _, progress = progress_bus.current()
+    assert progress["completed"] == progress["total"] == 18
+    with open(tmp_path / "progress.json") as f:
+        assert json.load(f)["completed"] == 18
+
+def test_parallel_runs_to_a_shared_host_never_overlap(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    endpoints = {"a": "shared.example", "alias": "shared.example", "b": "b.example"}
+    network = SimulatedNetwork.random_tree(set(endpoints.values()), seed=4)
+    in_flight, overlaps, lock = {}, [], threading.Lock()
+    def process_endpoint(name, host, geolocator, **options):
+        with lock:
+            in_flight[host] = in_flight.get(host, 0) + 1
+            overlaps.append(in_flight[host] > 1)
+        time.sleep(0.05)
+        with lock:
+            in_flight[host] -= 1
+        return real_process_endpoint(name, host, geolocator, **options)
+    real_process_endpoint = benchmark.process_endpoint
+    monkeypatch.setattr(benchmark, "process_endpoint", process_endpoint)
+    results = run_benchmark(endpoints, num_runs=2, backend=network, parallel=True, max_workers=4)
+    assert len(overlaps) == 6 and not any(overlaps)
+    # Providers sharing a host keep separate entries
+    assert list(results) == ["shared.example (a)", "shared.example (alias)", "b.example"]
+
+def test_iter_benchmark_streams_events(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    endpoints = {"a": "a.example", "b": "b.example"}
+    network = SimulatedNetwork.random_tree(endpoints.values(), seed=2)
+    events = [(e["type"], e["name"], e.get("run")) for e in iter_benchmark(endpoints, 2, backend=network)]
+    assert events == [("run", "a", 0), ("run", "a", 1), ("endpoint", "a", None),
+                      ("run", "b", 0), ("run", "b", 1), ("endpoint", "b", None)]
+
+    # Stopping early cancels the traces that have not started yet, even runs queued
+    # behind the one in flight to the same host
+    stream = iter_benchmark({f"p{i}": "a.example" for i in range(20)}, 2, backend=network,
+                            parallel=True, max_workers=2)
+    first = next(stream)
+    assert first["type"] == "run" and first["result"]["data"]["hop_count"] > 0
+    stream.close()
+
+def test_aiter_benchmark(tmp_path, monkeypatch, fake_icmp_socket):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    tracer = AsyncTracer(fake_icmp_socket(ASYNC_ROUTES))
+    async def collect():
+        return [event async for event in aiter_benchmark({"local": "192.0.2.1"}, num_runs=2,
+                                                         tracer=tracer)]
+    events = asyncio.run(collect())
+    assert [e["type"] for e in events] == ["run", "run", "endpoint"]
+    assert [hop["ip"] for hop in events[0]["result"]["data"]["hops"]] == [
+        "10.0.0.1", "10.1.0.1", "192.0.2.1"]
+    assert events[-1]["result"]["hop_count"] == 3
+    assert events[-1]["result"]["end_to_end"]["loss"] == 0.0
+
+def test_run_benchmark_adaptive_sampling(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    endpoints = {"stable": "stable.example", "noisy": "noisy.example"}
+    network = SimulatedNetwork(seed=1)
+    network.add_route(["10.0.0.1", {"ip": "10.0.1.1", "rtt": 20.0, "jitter": 0.2}],
+                      "stable.example")
+    network.add_route(["10.0.0.1", {"ip": "10.0.2.1", "rtt": 20.0, "jitter": 40.0,
+                                    "distribution": "exponential"}], "noisy.example")
+    results = run_benchmark(endpoints, num_runs=3, backend=network, target_ci=0.05, max_runs=8)
+
+    stable, noisy = results["stable.example"], results["noisy.example"]
+    assert stable["runs_used"] == 3
+    assert stable["rtt_ci"]["sampling_stop"] == "converged"
+    assert stable["rtt_ci"]["relative_half_width"] <= 0.05
+    assert noisy["runs_used"] == 8
+    assert noisy["rtt_ci"]["sampling_stop"] == "max_runs"
+    _, progress = progress_bus.current()
+    assert progress["completed"] == progress["total"] == 11
+
+def test_iter_benchmark_cancel_returns_truncated_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_bus, "snapshot_path", str(tmp_path / "progress.json"))
+    endpoints = {"a": "a.example", "b": "b.example"}
+    network = SimulatedNetwork.random_tree(endpoints.values(), seed=2)
+    cancel = CancelToken()
+    events = []
+    for event in iter_benchmark(endpoints, 3, backend=network, cancel=cancel):
+        events.append(event)
+        if event["type"] == "run":
+            cancel.cancel()  # After the first run of "a"
+
+    assert [(e["type"], e["name"]) for e in events] == [("run", "a"), ("endpoint", "a")]
+    result = events[-1]["result"]
+    assert result["truncated"] and result["runs_used"] == 1
+
+    # Without cancellation nothing is truncated
+    results = run_benchmark(endpoints, 2, backend=network, time_limit=60)
+    assert not any(result["truncated"] for result in results.values())
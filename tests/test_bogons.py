@@ -0,0 +1,44 @@
+from src.bogons import AddressClassifier, load_bogon_list, open_classifier
+from src.geo import GeoLocator
+from src.geocache import GeoCache
+
+def test_classify_special_purpose_addresses():
+    classifier = AddressClassifier()
+    expected = {
+        "10.1.2.3": "private", "172.31.255.255": "private", "172.32.0.1": None,
+        "192.168.0.1": "private", "100.64.0.1": "shared", "100.127.255.255": "shared",
+        "100.128.0.1": None, "127.0.0.1": "loopback", "169.254.1.1": "link-local",
+        "192.0.2.10": "documentation", "198.51.100.1": "documentation",
+        "203.0.113.255": "documentation", "198.19.0.1": "benchmarking", "0.1.2.3": "this-network",
+        "224.0.0.5": "multicast", "240.0.0.1": "reserved", "255.255.255.255": "broadcast",
+        "8.8.8.8": None, "1.1.1.1": None,
+        "::1": "loopback", "::": "unspecified", "fe80::1": "link-local",
+        "fd12:3456::1": "unique-local", "ff02::1": "multicast", "2001:db8::1": "documentation",
+        "::ffff:100.64.1.1": "shared", "::ffff:8.8.8.8": None, "2606:4700::1111": None,
+        "not an address": None, "10.1.2": None, "fe80::1%eth0": None,
+    }
+    assert {ip: classifier.classify(ip) for ip in expected} == expected
+
+def test_user_bogon_list(tmp_path):
+    path = tmp_path / "bogons.txt"
+    path.write_text("# Unallocated\n23.128.0.0/10\n\n192.168.10.0/24  # Our lab\n2a10::/12\n")
+    assert load_bogon_list(path) == ["23.128.0.0/10", "192.168.10.0/24", "2a10::/12"]
+    classifier = open_classifier(path)
+    assert classifier.classify("23.130.1.1") == "bogon"
+    assert classifier.classify("192.168.10.7") == "bogon"  # More specific than 192.168/16
+    assert classifier.classify("192.168.11.7") == "private"
+    assert classifier.is_bogon("2a10::1") and not classifier.is_bogon("23.192.0.1")
+
+class _NoNetwork:
+    def resolve(self, ip_addresses):
+        raise AssertionError(f"API called for {ip_addresses}")
+
+def test_geolocator_skips_bogons(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEOIP_DB", str(tmp_path / "absent.csv"))
+    geolocator = GeoLocator(client=_NoNetwork(), cache=GeoCache(":memory:"),
+                            classifier=AddressClassifier())
+    hops = geolocator.geolocate_hops([{"ttl": 1, "ip": "100.64.0.1", "status": "success"},
+                                      {"ttl": 2, "ip": "fe80::1", "status": "success"}])
+    assert hops[0]["geo"]["bogon"] == "shared" and hops[0]["geo"]["private"]
+    assert hops[1]["geo"]["city"] == "Reserved (link-local)"
+    assert len(geolocator.cache) == 0
@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from src.geo import GeoLocator
+from src.geocache import GeoCache
+
+def test_geo_cache_persists_expires_and_bounds_memory(tmp_path):
+    path = tmp_path / "geo_cache.db"
+    cache = GeoCache(path, memory_entries=2)
+    cache.put_many({f"198.51.100.{i}": {"ip": f"198.51.100.{i}", "asn": str(i)} for i in range(5)})
+    cache.put("203.0.113.1", {"ip": "203.0.113.1"}, ttl=-1)  # Already stale
+    assert len(cache.memory) == 2
+    assert cache.get("198.51.100.0") == {"ip": "198.51.100.0", "asn": "0"}  # From SQLite
+    assert list(cache.memory) == ["203.0.113.1", "198.51.100.0"]
+    assert cache.get("203.0.113.1") is None and cache.get("192.0.2.1") is None
+    cache.close()
+
+    # Written through: a new cache sees every entry, minus the expired one
+    cache = GeoCache(path)
+    assert len(cache) == 5 and cache.get("198.51.100.4")["asn"] == "4"
+    cache.close()
+
+def test_geo_cache_migrates_json_once(tmp_path):
+    json_path = tmp_path / "ip_cache.json"
+    json_path.write_text(json.dumps({
+        "8.8.8.8": {"ip": "8.8.8.8", "org": "AS15169 Google LLC", "asn": "15169"},
+        "10.0.0.1": {"ip": "10.0.0.1", "private": True},
+        "1.1.1.1": {"ip": "1.1.1.1", "country": "AU"},
+    }))
+    week_ago = time.time() - 7 * 24 * 3600
+    os.utime(json_path, (week_ago, week_ago))
+    cache = GeoCache(tmp_path / "geo_cache.db", ttl=10 * 24 * 3600)
+    assert cache.migrate_json(json_path) == 2
+    assert cache.get("8.8.8.8")["asn"] == "15169" and cache.get("10.0.0.1") is None
+    assert cache.memory["1.1.1.1"][1] == week_ago + 10 * 24 * 3600
+    cache.close()
+
+    json_path.write_text(json.dumps({"9.9.9.9": {"ip": "9.9.9.9"}}))
+    cache = GeoCache(tmp_path / "geo_cache.db")
+    assert cache.migrate_json(json_path) == 0 and len(cache) == 2
+    cache.close()
+
+class _StubClient:
+    """Answers every address except those in 45.18.0.0/15 (errors), recording the calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def resolve(self, ip_addresses):
+        self.calls.append(list(ip_addresses))
+        return {ip: {"error": "API returned status code 429", "ip": ip}
+                if ip.startswith(("45.18.", "45.19.")) else
+                {"ip": ip, "city": "Frankfurt", "country": "DE", "loc": "50.1,8.7",
+                 "org": "AS64500 Example Transit", "asn": "64500"}
+                for ip in ip_addresses}
+
+def test_prefix_and_asn_inference(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEOIP_DB", str(tmp_path / "absent.csv"))
+    client = _StubClient()
+    geolocator = GeoLocator(client=client, cache=GeoCache(":memory:"))
+    trace = [{"ttl": ttl, "ip": ip, "status": "success"}
+             for ttl, ip in enumerate(["185.51.100.1", "185.51.100.77", "45.18.5.1",
+                                       "2a00:1450:1::1", "2a00:1450:1:ff::9"], 1)]
+    geolocator.geolocate_hops(trace)
+    # One address per prefix goes to the API, the others are inferred from it
+    assert client.calls == [["185.51.100.1", "45.18.5.1", "2a00:1450:1::1"]]
+    assert "confidence" not in trace[0]["geo"] and trace[1]["lat"] == 50.1
+    assert trace[1]["geo"]["confidence"] == "prefix"
+    assert trace[1]["geo"]["inferred_from"] == {"ip": "185.51.100.1", "prefix": "185.51.100.0/24"}
+    assert trace[4]["geo"]["inferred_from"]["prefix"] == "2a00:1450:1::/48"
+    assert "error" in trace[2]["geo"]
+
+    # Another interface on the same backbone: no API call at all; an unanswered address
+    # in a known wide prefix still gets its org and asn
+    client.calls.clear()
+    geolocator.cache.put("45.18.200.1", {"ip": "45.18.200.1", "org": "AS64511 Carrier",
+                                          "asn": "64511", "loc": "1,1"})
+    trace = [{"ttl": 1, "ip": "185.51.100.201", "status": "success"},
+             {"ttl": 2, "ip": "45.18.5.1", "status": "success"}]
+    geolocator.geolocate_hops(trace)
+    assert client.calls == [["45.18.5.1"]]
+    assert trace[0]["geo"]["city"] == "Frankfurt"
+    assert trace[1]["geo"] == {"ip": "45.18.5.1", "org": "AS64511 Carrier", "asn": "64511",
+                               "confidence": "wide-prefix",
+                               "inferred_from": {"ip": "45.18.200.1", "prefix": "45.18.0.0/16"}}
+    assert "lat" not in trace[1]
+
+def test_prefix_table_backfilled_and_disabled(tmp_path):
+    path = tmp_path / "geo_cache.db"
+    cache = GeoCache(path, prefix_lengths={}, wide_prefix_lengths={})
+    cache.put("203.0.113.5", {"ip": "203.0.113.5", "country": "NL"})
+    assert cache.infer("203.0.113.6") is None
+    cache.close()
+
+    cache = GeoCache(path)
+    assert cache.infer("203.0.113.6")["country"] == "NL"
+    cache.close()
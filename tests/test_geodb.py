@@ -0,0 +1,48 @@
+import os
+from src.geo import GeoLocator
+from src.geocache import GeoCache
+from src.geodb import GeoDatabase, build_index
+
+CSV = """start_ip,end_ip,country,region,city,latitude,longitude,org,asn
+8.8.8.0,8.8.8.255,US,California,Mountain View,37.4056,-122.0775,Google LLC,AS15169
+1.0.0.0,1.0.0.255,AU,Queensland,Brisbane,-27.4679,153.0281,Cloudflare,13335
+1.0.0.128,1.0.1.10,XX,,,,,,
+"""
+
+def test_geo_database_lookup(tmp_path):
+    csv_path = tmp_path / "geoip.csv"
+    csv_path.write_text(CSV)
+    db = GeoDatabase(csv_path)
+    assert len(db) == 2  # The overlapping range is skipped
+    google = db.lookup("8.8.8.8")
+    assert google == {"ip": "8.8.8.8", "city": "Mountain View", "region": "California",
+                      "country": "US", "loc": "37.4056,-122.0775", "org": "Google LLC",
+                      "asn": "15169"}
+    assert db.lookup("1.0.0.0")["city"] == "Brisbane"
+    assert db.lookup("1.0.0.255")["asn"] == "13335"
+    for miss in ("0.255.255.255", "1.0.1.0", "8.8.9.0", "255.255.255.255", "::1", "bogus"):
+        assert db.lookup(miss) is None
+    db.close()
+
+    # CIDR rows; a newer CSV replaces the compiled index
+    csv_path.write_text("network,country\n10.0.0.0/8,ZZ\n")
+    os.utime(csv_path, (os.path.getmtime(csv_path) + 10,) * 2)
+    db = GeoDatabase(csv_path)
+    assert db.lookup("10.255.0.1") == {"ip": "10.255.0.1", "country": "ZZ"}
+    assert db.lookup("8.8.8.8") is None
+    db.close()
+
+class _NoNetwork:
+    def resolve(self, ip_addresses):
+        raise AssertionError("API called")
+
+def test_geolocator_prefers_offline_database(tmp_path):
+    csv_path = tmp_path / "geoip.csv"
+    csv_path.write_text(CSV)
+    geolocator = GeoLocator(geo_db=GeoDatabase(build_index(csv_path)), client=_NoNetwork(),
+                            cache=GeoCache(":memory:"))
+
+    hops = geolocator.geolocate_hops([{"ttl": 1, "ip": "8.8.8.8", "status": "success"}])
+    assert hops[0]["geo"]["country"] == "US"
+    assert (hops[0]["lat"], hops[0]["lon"]) == (37.4056, -122.0775)
+    assert geolocator.cache.get("8.8.8.8") is None
@@ -0,0 +1,29 @@
+import json
+import pytest
+from src.hop import Hop
+
+def test_hop_behaves_like_its_dict():
+    hop = Hop(3, "10.0.0.1", 4.5, clock="kernel")
+    assert hop["ip"] == "10.0.0.1" and hop.get("clock") == "kernel"
+    assert "geo" not in hop and hop.get("geo") is None
+    with pytest.raises(KeyError):
+        hop["geo"]
+
+    hop["geo"] = {"country": "US"}
+    hop["lat"], hop["lon"] = 1.0, 2.0
+    assert "geo" in hop
+    assert hop.to_dict() == {"ttl": 3, "ip": "10.0.0.1", "rtt": 4.5, "status": "success", "attempt": 1,
+                             "clock": "kernel", "geo": {"country": "US"}, "lat": 1.0, "lon": 2.0}
+    assert hop == hop.to_dict() and Hop.from_dict(json.loads(json.dumps(hop.to_dict()))) == hop
+
+    timeout = Hop(4, status="timeout", attempt=2)
+    assert timeout["ip"] is None and timeout.keys() == ["ttl", "ip", "rtt", "status", "attempt"]
+    with pytest.raises(KeyError):
+        timeout["location"] = "nowhere"
+
+def test_hop_copy_and_interning():
+    hop = Hop(1, "".join(["192.168.", "1.1"]), 1.0)
+    assert hop.ip is Hop(2, "192.168.1.1").ip
+    marked = hop.copy(shared_prefix=True)
+    assert marked["shared_prefix"] and "shared_prefix" not in hop
+    assert marked.copy() == marked
@@ -0,0 +1,106 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from src.geo import GeoLocator
+from src.geocache import GeoCache
+from src.ipinfo import IpinfoClient
+from src.ratelimit import TokenBucket
+
+def _record(ip):
+    return {"ip": ip, "city": "Testville", "country": "US", "loc": "1.5,2.5",
+            "org": "AS64500 Example Transit"}
+
+class _Handler(BaseHTTPRequestHandler):
+    """ipinfo.io stand-in; the first request is answered with 429"""
+    protocol_version = "HTTP/1.1"  # Keep-alive
+
+    def _reply(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for header in headers:
+            self.send_header(*header)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, body=None):
+        server = self.server
+        with server.lock:
+            server.log.append((self.command, self.path.split("?")[0], self.client_address, body))
+            first = len(server.log) == 1
+        if first:
+            return self._reply(429, {"error": "rate limited"}, [("Retry-After", "0")])
+        path = self.path.split("?")[0]
+        if self.command == "POST" and path == "/batch":
+            return self._reply(200, {ip: _record(ip) for ip in body})
+        ip = path.strip("/").split("/")[0]
+        if ip.startswith("185.199."):
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, _record(ip))
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.lock = threading.Lock()
+    server.log = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _client(server, **kwargs):
+    return IpinfoClient(base_url=f"http://127.0.0.1:{server.server_address[1]}",
+                        bucket=TokenBucket(1000, burst=10), linger=0.1, backoff=0, **kwargs)
+
+def test_batches_concurrent_lookups(stand_in):
+    client = _client(stand_in, token="secret")
+    address_sets = [[f"198.51.100.{i}", f"198.51.100.{i + 1}", "8.8.8.8"] for i in range(8)]
+    results = [None] * len(address_sets)
+    def resolve(index):
+        results[index] = client.resolve(address_sets[index])
+    threads = [threading.Thread(target=resolve, args=(i,)) for i in range(len(address_sets))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for addresses, result in zip(address_sets, results):
+        assert set(result) == set(addresses)
+        assert all(result[ip]["asn"] == "64500" for ip in addresses)
+    # One rate-limited attempt, then every address exactly once, over one kept-alive connection
+    assert stand_in.log[0][0] == "POST" and len(stand_in.log) <= 3
+    requested = [ip for _, _, _, body in stand_in.log[1:] for ip in body]
+    assert sorted(requested) == sorted({ip for addresses in address_sets for ip in addresses})
+    assert len({client_address for _, _, client_address, _ in stand_in.log}) == 1
+    assert client.requests == len(stand_in.log)
+
+def test_geolocator_without_token(stand_in, tmp_path, monkeypatch):
+    monkeypatch.setenv("GEOIP_DB", str(tmp_path / "absent.csv"))
+    client = _client(stand_in, token="", batch_size=2)
+    geolocator = GeoLocator(client=client, cache=GeoCache(":memory:"))
+    hops = [{"ttl": 1, "ip": "192.168.1.1", "status": "success"},
+            {"ttl": 2, "ip": "8.8.8.8", "status": "success"},
+            {"ttl": 3, "ip": None, "status": "timeout"},
+            {"ttl": 4, "ip": "185.199.0.9", "status": "success"},
+            {"ttl": 5, "ip": "8.8.8.8", "status": "success"}]
+    geolocator.geolocate_hops(hops)
+
+    assert hops[0]["geo"]["private"] and hops[1]["geo"]["asn"] == "64500"
+    assert (hops[4]["lat"], hops[4]["lon"]) == (1.5, 2.5)
+    assert hops[3]["geo"]["error"] == "API returned status code 404"
+    # Per-address requests after the 429; only successful answers are cached
+    assert [(method, path) for method, path, _, _ in stand_in.log[1:]] == [
+        ("GET", "/8.8.8.8/json"), ("GET", "/185.199.0.9/json")]
+    assert len(geolocator.cache) == 1 and geolocator.cache.get("8.8.8.8")["asn"] == "64500"
@@ -0,0 +1,45 @@
+import time
+from src.monitor import Monitor
+from src.ratelimit import TokenBucket
+from src.simnet import SimulatedNetwork, SimulatedSession
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=100, burst=5)
+    start = time.monotonic()
+    for _ in range(25):
+        bucket.acquire()
+    # The burst goes out at once, the other 20 tokens at 100/s
+    assert 0.15 < time.monotonic() - start < 0.5
+    assert not bucket.try_acquire()
+
+def test_monitor_schedules_each_endpoint_on_its_interval():
+    endpoints = {"fast": "fast.example", "slow": "slow.example"}
+    network = SimulatedNetwork.random_tree(endpoints.values(), seed=1, silent_rate=0)
+    results = []
+    monitor = Monitor(endpoints, intervals={"fast": 0.1}, default_interval=0.4, seed=1,
+                      probes_per_second=1000, backend=network,
+                      on_result=lambda name, host, result: results.append((time.monotonic(), name)))
+    monitor.run(duration=1.0)
+
+    assert 7 <= monitor.traces["fast"] <= 11
+    assert 2 <= monitor.traces["slow"] <= 3
+    assert len(results) == sum(monitor.traces.values())
+    fast = [t for t, name in results if name == "fast"]
+    assert all(0.05 < b - a < 0.2 for a, b in zip(fast, fast[1:]))
+
+def test_monitor_probe_budget(monkeypatch):
+    endpoints = {f"p{i}": f"p{i}.example" for i in range(4)}
+    network = SimulatedNetwork.random_tree(endpoints.values(), seed=2, silent_rate=0)
+    monitor = Monitor(endpoints, default_interval=0.01, probes_per_second=200, backend=network,
+                      max_workers=4)
+    sent = []
+    send = SimulatedSession.send
+    def counting_send(session, ttl, seq):
+        sent.append(time.monotonic())
+        send(session, ttl, seq)
+    monkeypatch.setattr(SimulatedSession, "send", counting_send)
+    monitor.run(duration=0.5)
+
+    assert len(sent) / (sent[-1] - sent[0]) < 200 * 1.2
+    # Traces were due far more often than the budget allows: the overlap was skipped
+    assert sum(monitor.skipped.values()) > 0
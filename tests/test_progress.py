@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from src.progress import ProgressBus
+
+def test_progress_bus_wait_and_snapshot(tmp_path):
+    bus = ProgressBus(snapshot_path=str(tmp_path / "progress.json"), snapshot_interval=60)
+    version, state = bus.current()
+    assert state["status"] == "unknown"
+    assert bus.wait(version, timeout=0.01) == (version, None)
+
+    # A subscriber blocked in wait() wakes up with the newest state
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(bus.wait(version, timeout=5)))
+    waiter.start()
+    bus.publish({"progress": 10, "status": "running"})
+    waiter.join()
+    assert woken[0] == (version + 1, {"progress": 10, "status": "running"})
+
+    # Running states within the snapshot interval stay in memory, finished ones hit the file
+    bus.publish({"progress": 50, "status": "running"})
+    with open(tmp_path / "progress.json") as f:
+        assert json.load(f)["progress"] == 10
+    bus.publish({"progress": 100, "status": "complete"})
+    with open(tmp_path / "progress.json") as f:
+        assert json.load(f)["status"] == "complete"
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_benchmark_events_stream(monkeypatch):
+    from app import app
+    bus = ProgressBus(snapshot_path=None)
+    monkeypatch.setattr("app.progress_bus", bus)
+    bus.publish({"progress": 40, "status": "running", "current_provider": "aws (run 1/3)"})
+    # Finish the benchmark once the client has consumed the first event
+    threading.Timer(0.1, bus.publish, [{"progress": 100, "status": "complete"}]).start()
+
+    response = app.test_client().get('/benchmark/events')
+    assert response.mimetype == 'text/event-stream'
+    events = [json.loads(line[len("data: "):])
+              for line in response.get_data(as_text=True).split("\n\n") if line.startswith("data: ")]
+    assert events[0]["current_provider"] == "aws (run 1/3)"
+    assert events[-1]["status"] == "complete"
+
+def test_benchmark_cancel_frees_slot(tmp_path, monkeypatch):
+    import app
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("app.progress_bus", ProgressBus(snapshot_path=None))
+    monkeypatch.setattr("app.get_endpoints", lambda providers: {"aws": "aws.example"})
+    monkeypatch.setattr("app.get_probe_options", lambda providers: {})
+    def slow_benchmark(endpoints, num_runs, cancel=None, **options):
+        yield {"type": "endpoint", "name": "aws", "host": "aws.example",
+               "key": "aws.example",                "result": {"hops": [], "avg_rtt_ms": 1.0, "truncated": False}}
+        cancel.wait(30)  # Traces in flight, until cancelled
+        yield {"type": "endpoint", "name": "gcp", "host": "gcp.example",
+               "key": "gcp.example",                "result": {"hops": [], "avg_rtt_ms": 2.0, "truncated": True}}
+    monkeypatch.setattr("app.iter_benchmark", slow_benchmark)
+    client = app.app.test_client()
+
+    assert client.post('/benchmark/cancel').status_code == 409
+    assert client.post('/benchmark', json={"providers": ["aws"]}).status_code == 200
+    start = time.time()
+    response = client.post('/benchmark/cancel').get_json()
+    assert time.time() - start < 2
+    assert response["status"] == "cancelled" and response["stopped"]
+    assert set(response["results"]) == {"aws.example", "gcp.example"}
+    assert response["results"]["gcp.example"]["truncated"]
+    assert not app.benchmark_status["running"]
+    assert app.progress_bus.current()[1]["status"] == "cancelled"
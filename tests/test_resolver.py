@@ -0,0 +1,144 @@
+import socket
+import struct
+import threading
+import time
+import pytest
+from src.resolver import Resolver, expand_addresses
+
+class _StubNameserver:
+    """UDP nameserver answering from a {name: ([addresses], ttl)} zone, each after a delay"""
+
+    def __init__(self, zone, delay=0.0):
+        self.zone = zone
+        self.delay = delay
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, client = self.sock.recvfrom(512)
+            except OSError:
+                return
+            threading.Thread(target=self._answer, args=(data, client), daemon=True).start()
+
+    def _answer(self, data, client):
+        query_id, = struct.unpack_from("!H", data)
+        offset, labels = 12, []
+        while data[offset]:
+            labels.append(data[offset + 1:offset + 1 + data[offset]].decode())
+            offset += data[offset] + 1
+        question = data[12:offset + 5]
+        name = ".".join(labels)
+        self.queries.append(name)
+        time.sleep(self.delay)
+        if name in self.zone:
+            addresses, ttl = self.zone[name]
+            flags = 0x8380 if name.startswith("tc.") else 0x8180  # TC set for tc.*
+            # A CNAME first, then the A records, all named by pointers to the question
+            records = struct.pack("!HHHIH", 0xC00C, 5, 1, ttl + 100, 2) + b"\xc0\x0c"
+            records += b"".join(struct.pack("!HHHIH", 0xC00C, 1, 1, ttl, 4) + socket.inet_aton(ip)
+                                for ip in addresses)
+            header = struct.pack("!HHHHHH", query_id, flags, 1, len(addresses) + 1, 0, 0)
+        else:
+            # NXDOMAIN with the zone's SOA (negative TTL 2 = min(SOA TTL, MINIMUM))
+            soa = b"\x00\x00" + struct.pack("!IIIII", 1, 3600, 600, 86400, 2)
+            records = struct.pack("!HHHIH", 0xC00C, 6, 1, 30, len(soa)) + soa
+            header = struct.pack("!HHHHHH", query_id, 0x8183, 1, 0, 1, 0)
+        self.sock.sendto(header + question + records, client)
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def nameserver():
+    server = _StubNameserver({"a.example": (["192.0.2.1", "192.0.2.2"], 300),
+                              "b.example": (["198.51.100.7"], 1)})
+    yield server
+    server.close()
+
+def test_ttl_expiry_and_negative_caching(nameserver):
+    resolver = Resolver(nameservers=[nameserver.address], min_ttl=0)
+    assert resolver.resolve_all("a.example") == ["192.0.2.1", "192.0.2.2"]
+    assert resolver.resolve("a.example") == "192.0.2.1"
+    assert resolver.resolve("192.0.2.99") == "192.0.2.99"
+    for _ in range(2):
+        with pytest.raises(socket.gaierror, match="no such host"):
+            resolver.resolve("missing.example")
+    assert nameserver.queries == ["a.example", "missing.example"]
+    # The lowest TTL of the answer (the A records, not the CNAME) is honoured
+    assert 299 < resolver.cache["a.example"][1] - time.monotonic() <= 300
+
+    assert resolver.resolve("b.example") == "198.51.100.7"
+    nameserver.zone["b.example"] = (["198.51.100.8"], 300)
+    nameserver.zone["missing.example"] = (["203.0.113.1"], 300)
+    assert resolver.resolve("b.example") == "198.51.100.7"
+    time.sleep(1.1)
+    assert resolver.resolve("b.example") == "198.51.100.8"  # Expired with its record
+    time.sleep(1)
+    assert resolver.resolve("missing.example") == "203.0.113.1"  # Negative TTL from the SOA
+
+def test_concurrent_lookups(nameserver):
+    nameserver.delay = 0.3
+    nameserver.zone.update({f"host{i}.example": ([f"203.0.113.{i}"], 60) for i in range(6)})
+    resolver = Resolver(nameservers=[nameserver.address])
+    results = {}
+    def resolve(name):
+        results.setdefault(name, []).append(resolver.resolve(name))
+    names = [f"host{i}.example" for i in range(6)] * 3
+    threads = [threading.Thread(target=resolve, args=(name,)) for name in names]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Names are resolved side by side, each with a single query however many callers wait
+    assert time.monotonic() - start < 1.0
+    assert sorted(nameserver.queries) == sorted(set(names))
+    assert all(results[f"host{i}.example"] == [f"203.0.113.{i}"] * 3 for i in range(6))
+
+def test_background_refresh_and_all_addresses(nameserver):
+    resolver = Resolver(nameservers=[nameserver.address], min_ttl=0)
+    resolver.start_refresh(["b.example"])
+    time.sleep(0.3)
+    nameserver.zone["b.example"] = (["198.51.100.9"], 1)
+    time.sleep(2.5)
+    resolver.stop_refresh()
+    # Refreshed ahead of expiry without any caller asking
+    assert nameserver.queries.count("b.example") >= 2
+    assert resolver.cache["b.example"][0] == ["198.51.100.9"]
+
+    endpoints, options = expand_addresses({"a": "a.example", "x": "missing.example"},
+                                          {"a": {"protocol": "tcp"}}, resolver=resolver)
+    assert endpoints == {"a@192.0.2.1": "192.0.2.1", "a@192.0.2.2": "192.0.2.2",
+                         "x": "missing.example"}
+    assert options == {"a@192.0.2.1": {"protocol": "tcp"}, "a@192.0.2.2": {"protocol": "tcp"}}
+
+def test_background_refresh_pace(nameserver):
+    nameserver.zone["c.example"] = (["192.0.2.50"], 2)
+    resolver = Resolver(nameservers=[nameserver.address], min_ttl=2)
+    resolver.start_refresh(["c.example", "missing.example"])
+    time.sleep(3.0)
+    resolver.stop_refresh()
+    # Answers are refreshed at 80% of their TTL, failures (negative TTL clamped up to
+    # min_ttl) only once expired: not once a second
+    assert nameserver.queries.count("c.example") == 2
+    assert nameserver.queries.count("missing.example") == 2
+
+def test_system_resolver_fallback(nameserver, monkeypatch):
+    def getaddrinfo(host, port, family, type):
+        if host in ("lab.example", "tc.example"):
+            return [(family, type, 6, "", ("10.9.8.7", 0))]
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    monkeypatch.setattr("src.resolver.socket.getaddrinfo", getaddrinfo)
+    nameserver.zone["tc.example"] = (["192.0.2.60"], 300)
+    resolver = Resolver(nameservers=[nameserver.address], min_ttl=0)
+    # NXDOMAIN from the nameserver, but known to the system (/etc/hosts, search domains)
+    assert resolver.resolve("lab.example") == "10.9.8.7"
+    # A truncated response is retried by the system resolver (over TCP)
+    assert resolver.resolve("tc.example") == "10.9.8.7"
+    with pytest.raises(socket.gaierror, match="no such host"):
+        resolver.resolve("missing.example")
@@ -0,0 +1,38 @@
+from src.simnet import SimulatedNetwork, Router
+from src.tracer import get_route
+
+def _ips(route):
+    return [hop["ip"] for hop in route if hop["status"] == "success"]
+
+def test_simulated_trace_is_deterministic():
+    def trace(seed):
+        network = SimulatedNetwork.random_tree(["a.example", "b.example"], seed=seed, loss=0.1)
+        return [get_route("a.example", backend=network) for _ in range(3)]
+    assert trace(7) == trace(7)
+    route = trace(7)[0]
+    assert route.stop_reason in ("destination_reached", "silent_hops")
+    assert all(hop["clock"] == "simulated" for hop in route if hop["status"] == "success")
+
+def test_simulated_silent_hops_and_tail():
+    network = SimulatedNetwork()
+    network.add_route(["10.0.0.1", {"ip": "10.0.0.2", "silent": True}, "10.0.0.3"], "host.example")
+    route = get_route("host.example", backend=network)
+    assert _ips(route) == ["10.0.0.1", "10.0.0.3"]
+    assert [hop["status"] for hop in route if hop["ttl"] == 2] == ["timeout", "timeout"]
+
+    # Unanswered hops past the last router end the trace early, in virtual time
+    network.add_route(["10.0.0.1"] + [Router(f"10.9.0.{i}", silent=True) for i in range(20)])
+    route = get_route("10.9.0.19", backend=network, pipelined=True, max_silent_hops=3)
+    assert route.stop_reason == "silent_hops"
+    assert max(hop["ttl"] for hop in route) == 4
+
+def test_simulated_rate_limit_and_latency():
+    network = SimulatedNetwork()
+    router = Router("10.0.0.1", rtt=20.0, rate_limit=1, burst=1)
+    network.add_route([router, {"ip": "10.0.0.9", "rtt": 40.0, "jitter": 5.0}])
+    first = get_route("10.0.0.9", backend=network, adaptive_timeout=False)
+    assert first[0]["rtt"] == 20.0 and first[-1]["rtt"] >= 4.0
+    # The bucket has not refilled: the router's second trace gets no answer
+    second = get_route("10.0.0.9", backend=network, adaptive_timeout=False, pipelined=True)
+    assert second[0]["status"] == "timeout"
+    assert second.stop_reason == "destination_reached"
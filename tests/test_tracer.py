@@ -1,9 +1,181 @@
 import os
+import struct
+import threading
+import time
 import pytest
-from src.tracer import get_route
+from src.tracer import (
+    get_route, build_packet, parse_reply, checksum, PacketBuilder, RttEstimator, probe_rtt,
+    Route, discover_common_prefix, ProbeSocketManager
+)
+from src.cancel import CancelToken
+from src.constants import TIMEOUT, MIN_TIMEOUT
+from src.hop import Hop
 
 def test_get_route(mock_traceroute):
     hops = get_route("test.com")
     assert len(hops) == 2
     assert hops[0]["ip"] == "192.168.1.1"
     assert hops[1]["rtt"] == 20.0
+
+def _ip_header(length):
+    return bytes([0x45, 0]) + struct.pack("!H", length) + bytes(16)
+
+def test_parse_reply_matches_quoted_probe():
+    probe = build_packet(seq=7, my_id=1234)
+    time_exceeded = struct.pack("bbHHh", 11, 0, 0, 0, 0) + _ip_header(28) + probe[:8]
+    assert parse_reply(_ip_header(56) + time_exceeded) == (11, 1234, 7)
+
+    echo_reply = struct.pack("bbHHh", 0, 0, 0, 1234, 9) + probe[8:]
+    assert parse_reply(_ip_header(36) + echo_reply) == (0, 1234, 9)
+
+    # Our own echo request seen on the raw socket is not a reply
+    assert parse_reply(_ip_header(36) + probe) is None
+
+def test_packet_builder_matches_build_packet(monkeypatch):
+    monkeypatch.setattr("src.tracer.time.time", lambda: 1700000000.123)
+    builder = PacketBuilder(4321)
+    for seq in (1, 31, 60, 500):
+        packet = builder.build(seq)
+        assert packet == build_packet(seq, 4321)
+        assert checksum(packet) == 0
+
+def test_rtt_estimator_timeout_bounds():
+    estimator = RttEstimator()
+    assert estimator.timeout() == TIMEOUT
+    for rtt in (10.0, 12.0, 11.0, 9.0):
+        estimator.update(rtt)
+    assert estimator.timeout() == MIN_TIMEOUT
+    estimator.update(5000.0)
+    assert estimator.timeout() == TIMEOUT
+
+def test_parse_reply_matches_quoted_udp_and_tcp_probes():
+    udp_probe = struct.pack("!HHHH", 40000, 33440, 16, 0)
+    port_unreachable = struct.pack("bbHHh", 3, 3, 0, 0, 0) + _ip_header(36)[:9] + bytes([17]) + bytes(10) + udp_probe
+    assert parse_reply(_ip_header(56) + port_unreachable) == (3, ("udp", 40000), 33440)
+
+    tcp_probe = struct.pack("!HHI", 50000, 443, 0)
+    time_exceeded = struct.pack("bbHHh", 11, 0, 0, 0, 0) + _ip_header(40)[:9] + bytes([6]) + bytes(10) + tcp_probe
+    assert parse_reply(_ip_header(56) + time_exceeded) == (11, ("tcp", 50000), 443)
+
+def test_probe_rtt_prefers_kernel_timestamps():
+    send_stamp = (1_000_000_000, 500_000_000)
+    assert probe_rtt(send_stamp, 1_020_000_000, 999_000_000, 1_001_000_000) == (19.0, "kernel")
+    assert probe_rtt(send_stamp, 1_020_000_000, 999_000_000) == (20.0, "kernel_rx")
+    assert probe_rtt(send_stamp, None, 530_000_000) == (30.0, "perf_counter")
+
+def test_discover_common_prefix(monkeypatch):
+    paths = {
+        "a.com": ["192.168.1.1", "10.0.0.1", "10.9.0.1", "1.1.1.1"],
+        "b.com": ["192.168.1.1", "10.0.0.1", "10.8.0.1"],
+        "c.com": ["192.168.1.1", "10.0.0.1", "10.7.0.1", "10.7.0.2"],
+    }
+    def fake_route(hostname, max_ttl, **options):
+        hops = [Hop(ttl, ip, 1.0) for ttl, ip in enumerate(paths[hostname][:max_ttl], start=1)]
+        return Route(hops, "destination_reached" if len(paths[hostname]) <= max_ttl else "max_hops")
+    monkeypatch.setattr("src.tracer.get_route", fake_route)
+
+    prefix = discover_common_prefix(["a.com", "b.com", "c.com"])
+    assert [hop["ip"] for hop in prefix] == ["192.168.1.1", "10.0.0.1"]
+    assert all(hop["shared_prefix"] for hop in prefix)
+
+    # A destination one hop past the gateway leaves only the gateway to share
+    paths["b.com"] = ["192.168.1.1", "10.0.0.1"]
+    assert [hop["ttl"] for hop in discover_common_prefix(["a.com", "b.com"])] == [1]
+    assert discover_common_prefix(["a.com"]) == []
+
+class _SilentNetwork:
+    """Backend whose probes are never answered, waiting in real time like raw sockets."""
+    rtt_history = {}
+
+    def resolve(self, hostname):
+        return "192.0.2.1"
+
+    def open_session(self, dest_ip, protocol=None, port=None):
+        return self
+
+    dest_ip = "192.0.2.1"
+
+    def send(self, ttl, seq):
+        pass
+
+    def recv(self, timeout):
+        time.sleep(max(timeout, 0))
+        return None
+
+    def now(self):
+        return time.time()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_get_route_deadline_and_cancel(pipelined):
+    start = time.time()
+    hops = get_route("silent.example", pipelined=pipelined, max_silent_hops=0,
+                     backend=_SilentNetwork(), trace_timeout=0.3)
+    assert hops.stop_reason == "deadline"
+    assert time.time() - start < 0.3 + TIMEOUT / 2
+
+    cancel = CancelToken()
+    threading.Timer(0.2, cancel.cancel).start()
+    start = time.time()
+    hops = get_route("silent.example", pipelined=pipelined, max_silent_hops=0,
+                     backend=_SilentNetwork(), cancel=cancel)
+    assert hops.stop_reason == "cancelled"
+    assert time.time() - start < 0.2 + TIMEOUT / 2
+    # The probe cut short (well within TIMEOUT) is not reported as a timeout
+    assert hops == []
+    assert get_route("silent.example", backend=_SilentNetwork(), cancel=cancel) == []
+
+def test_probe_socket_manager_routes_replies(fake_icmp_socket):
+    sock = fake_icmp_socket({"192.0.2.9": ["10.0.0.1", None, "192.0.2.9"]})
+    manager = ProbeSocketManager(sock)
+    try:
+        first, second = manager.open_session("192.0.2.9"), manager.open_session("192.0.2.9")
+        first.send(1, 5)
+        second.send(3, 6)
+        second.send(2, 7)
+        # Each reply reaches the session whose ICMP id it carries or quotes
+        assert first.recv(1)[:2] == (5, "10.0.0.1")
+        assert second.recv(1)[:2] == (6, "192.0.2.9")
+        assert second.recv(0.2) is None  # TTL 2 is silent
+        assert first.recv(0.1) is None
+
+        # A late reply to a closed session is dropped; the dispatcher carries on
+        first.close()
+        sock.deliver("10.0.0.1", build_packet(8, first.packet_id))
+        second.send(1, 9)
+        assert second.recv(1)[:2] == (9, "10.0.0.1")
+        assert first.replies.empty()
+        second.close()
+        assert manager.sessions == {}
+    finally:
+        manager.close()
+    manager.dispatcher.join(1)
+    assert not manager.dispatcher.is_alive() and sock.reader.fileno() == -1
+
+def test_probe_socket_manager_concurrent_sessions(fake_icmp_socket):
+    routes = {f"192.0.2.{i}": ["10.0.0.1", f"10.0.{i}.1", f"192.0.2.{i}"] for i in range(8)}
+    manager = ProbeSocketManager(fake_icmp_socket(routes))
+    results = {}
+    def trace(dest_ip):
+        with manager.open_session(dest_ip) as session:
+            for ttl in (1, 2, 3):
+                session.send(ttl, ttl)
+            results[dest_ip] = sorted(session.recv(1)[:2] for _ in range(3))
+    threads = [threading.Thread(target=trace, args=(ip,)) for ip in routes]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        manager.close()
+    assert results == {ip: [(1, "10.0.0.1"), (2, path[1]), (3, ip)] for ip, path in routes.items()}
+    assert manager.sessions == {}
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from werkzeug.serving import make_server
+from src.agent import compact_result
+from src.coordinator import Coordinator
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def test_compact_result():
+    result = {"hop_count": 2, "avg_rtt_ms": 5.0, "max_rtt_ms": 8.0, "min_rtt_ms": 2.0,
+              "success_rate": 100, "packet_loss": 0, "hop_stats": [],
+              "hops": [{"ttl": 1, "ip": "10.0.0.1", "rtt": 2.0, "status": "success", "geo": {}},
+                       {"ttl": 2, "ip": "10.0.0.2", "rtt": 8.0, "status": "success"}]}
+    compact = compact_result(result)
+    assert compact["hops"] == [[1, "10.0.0.1", 2.0], [2, "10.0.0.2", 8.0]]
+    assert "hop_stats" not in compact and compact["avg_rtt_ms"] == 5.0
+
+def test_agents_push_to_collector(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "collector.db"))
+    from app import app
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    collector_url = f"http://127.0.0.1:{server.port}"
+
+    # Two agent processes on this machine, each tracing its own simulated network
+    agents = [subprocess.Popen([sys.executable, "main.py", "--agent", name, "--simulate",
+                                "--collector", collector_url],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+              for name in ("site-a", "site-b")]
+    try:
+        coordinator = Coordinator(collector_url, poll_interval=0.1)
+        deadline = time.time() + 30
+        while len(coordinator.agents()) < 2 and time.time() < deadline:
+            time.sleep(0.1)
+        assert set(coordinator.agents()) == {"site-a", "site-b"}
+
+        merged = coordinator.run(["aws", "gcp"], num_runs=2, timeout=60)
+        for name in ("site-a", "site-b"):
+            entry = merged["vantages"][name]
+            assert entry["finished"] and entry["error"] is None
+            assert len(entry["results"]) == 2
+        assert all(set(rtts) == {"site-a", "site-b"} for rtts in merged["endpoints"].values())
+        # Different vantage points see different paths
+        endpoint = next(iter(merged["endpoints"]))
+        hops = [merged["vantages"][name]["results"][endpoint]["hops"]
+                for name in ("site-a", "site-b")]
+        assert hops[0] != hops[1]
+
+        # A job the agents do not know (e.g. lost in a restart) ends after one more poll
+        merged = coordinator.wait("lost-job", coordinator.agents(), timeout=60)
+        assert all(entry["finished"] and "unknown" in entry["error"]
+                   for entry in merged["vantages"].values())
+    finally:
+        for agent in agents:
+            agent.terminate()
+            agent.wait()
+        server.shutdown()